@@ -1,18 +1,61 @@
-from ultralytics import YOLO
 import os
+import argparse
 import glob
+import cv2
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
+from mask_accounting import batch_class_union_coverage
+from sliced_inference import SlicedPredictor
+from footprint_index import load_footprint_index
+from prediction_cache import PredictionCache
+from prediction_store import PredictionStoreWriter, PredictionStore
+from inference_backend import BACKENDS, load_model, weights_file
+
+# ================= 配置区域 =================
+# 每次送入模型的图片数量
+BATCH_SIZE = 8
+# 计算覆盖度时 mask 长边缩放到的像素数 (越小越快，误差只来自目标边缘的缩放像素)
+COVERAGE_MAX_SIDE = 640
+# 切片推理 (适合 3840x2160 原始航拍帧，小目标不会因整帧缩小而丢失)
+SLICED_INFERENCE = False
+TILE_SIZE = 1024
+TILE_OVERLAP = 0.2
+# 足迹去重: 只对覆盖不同地面的帧做推理 (悬停时大量帧拍的是同一块地)
+# 需要 images.geojson 中有与图片同名的记录，不在其中的图片不受影响
+DEDUP_FOOTPRINTS = False
+# 预测缓存: 同一模型、同一图片、同一参数的结果只推理一次 (切片推理不走缓存)
+# 与 statistic.py 相同，默认关闭 (缓存写在 runs/prediction_cache，占用磁盘)
+USE_PREDICTION_CACHE = False
+# 把每个实例的类别/置信度/框/RLE mask 流式写入输出目录下的预测结果库 (会替换该目录下已有的库)，
+# 之后可用 --from-store 直接从库出图。与 statistic.py 相同，默认关闭
+WRITE_PREDICTION_STORE = False
+# ===========================================
 
 # 设置中文字体 (防止Matplotlib中文乱码)
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
 plt.rcParams['axes.unicode_minus'] = False
 
-def analyze_wetland_vegetation(model_path, data_dir, output_dir):
-    # 加载模型
-    model = YOLO(model_path)
+def frame_coverage_stats(filename, orig_shape, cover, class_names):
+    """把一帧的覆盖比例 (长度为类别数) 转换为 CSV 的一行: 各类别面积 (像素) 和百分比"""
+    img_h, img_w = orig_shape
+    img_area = img_h * img_w
+
+    # 统计单张图片中各类别的面积 (像素)
+    frame_stats = {name: 0 for name in class_names.values()}
+    frame_stats['filename'] = filename
+    for cls_id, cls_name in class_names.items():
+        frame_stats[cls_name] = cover[cls_id] * img_area
+
+    # 计算百分比 (同类实例已去重，每个类别不超过100%；不同类别之间仍可能有少量重叠)
+    for name in class_names.values():
+        frame_stats[f"{name}_ratio"] = (frame_stats[name] / img_area) * 100
+    return frame_stats
+
+def analyze_wetland_vegetation(model_path, data_dir, output_dir, backend="torch"):
+    # 加载模型 (backend 可选导出的 ONNX / OpenVINO 模型，见 inference_backend.py)
+    model = load_model(model_path, backend)
     
     # 获取类别名称
     class_names = model.names
@@ -24,43 +67,64 @@ def analyze_wetland_vegetation(model_path, data_dir, output_dir):
     image_paths = glob.glob(os.path.join(data_dir, "*.jpg")) + \
                   glob.glob(os.path.join(data_dir, "*.png"))
     
+    if DEDUP_FOOTPRINTS:
+        index = load_footprint_index()
+        selected, indexed = set(index.greedy_cover()), set(index.names)
+        image_paths = [p for p in image_paths
+                       if os.path.basename(p) not in indexed or os.path.basename(p) in selected]
+        print(f"足迹去重后保留 {len(image_paths)} 张影像")
+
     print(f"开始分析 {len(image_paths)} 张影像数据...")
 
-    for img_path in image_paths:
-        # 进行推理，不保存图片，只拿数据
-        results = model.predict(img_path, verbose=False)
-        result = results[0]
-        
-        img_h, img_w = result.orig_shape
-        img_area = img_h * img_w
-        
-        # 统计单张图片中各类别的面积
-        frame_stats = {name: 0 for name in class_names.values()}
-        frame_stats['filename'] = os.path.basename(img_path)
-        
-        if result.boxes:
-            for box in result.boxes:
-                cls_id = int(box.cls[0])
-                cls_name = class_names[cls_id]
-                
-                # 获取框的坐标 (xyxy)
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                
-                # 计算矩形框面积
-                box_area = (x2 - x1) * (y2 - y1)
-                
-                # 累加面积
-                frame_stats[cls_name] += box_area
-
-        # 计算百分比 (注意：如果是密集目标检测，框可能有重叠，总和可能超过100%，这在生态统计中叫“盖度”)
-        for name in class_names.values():
-            frame_stats[f"{name}_ratio"] = (frame_stats[name] / img_area) * 100
-            
-        stats_list.append(frame_stats)
+    num_classes = len(class_names)
+    slicer = SlicedPredictor(model, tile_size=TILE_SIZE, overlap=TILE_OVERLAP) if SLICED_INFERENCE else None
+    cache = PredictionCache(model, weights_file(model_path, backend)) if USE_PREDICTION_CACHE and not slicer else None
+    writer = PredictionStoreWriter(os.path.join(output_dir, "predictions"), class_names) if WRITE_PREDICTION_STORE else None
+    try:
+        for start in range(0, len(image_paths), BATCH_SIZE):
+            batch_paths = image_paths[start:start + BATCH_SIZE]
+            if slicer:
+                # 整批图片的所有切片一起推理，结果拼回整图坐标
+                results = slicer.predict([cv2.imread(p) for p in batch_paths], paths=batch_paths)
+            elif cache:
+                results = cache.predict(batch_paths, verbose=False, retina_masks=False)
+            else:
+                # 批量推理，不保存图片，只拿数据
+                # 覆盖度在降低的分辨率上计算，因此不需要 retina mask
+                results = model.predict(batch_paths, verbose=False, retina_masks=False)
+
+            # 每个类别的实例 mask 在设备上求并集 -> (B, C) 覆盖比例，重叠区域只算一次
+            coverage = batch_class_union_coverage(results, num_classes, COVERAGE_MAX_SIDE)
+
+            for img_path, result, cover in zip(batch_paths, results, coverage):
+                if writer:
+                    writer.add(os.path.basename(img_path), result)
+                stats_list.append(frame_coverage_stats(os.path.basename(img_path), result.orig_shape, cover, class_names))
+    except BaseException:
+        # 出错或中断时丢弃本次写了一半的结果库，保留旧的
+        if writer:
+            writer.abort()
+        raise
+
+    if slicer:
+        print(slicer.report())
+    if cache:
+        print(cache.report())
+    if writer:
+        writer.close()
+        print(f"预测结果库已保存: {writer.store_dir}")
 
     # 转换为 DataFrame
     df = pd.DataFrame(stats_list)
-    
+    save_coverage_report(df, output_dir)
+
+def analyze_from_store(store_dir, output_dir):
+    """不重新推理，直接从预测结果库逐帧解码 mask，生成同样的 CSV 和图表"""
+    store = PredictionStore(store_dir)
+    print(f"从预测结果库读取 {len(store)} 帧: {store_dir}")
+    save_coverage_report(store.coverage_table(), output_dir)
+
+def save_coverage_report(df, output_dir):
     # ================= 结果可视化 =================
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -89,7 +153,7 @@ def analyze_wetland_vegetation(model_path, data_dir, output_dir):
     sns.boxplot(data=df[ratio_cols])
     plt.xticks(range(len(labels)), labels)
     plt.title("各航拍帧植被覆盖度分布范围")
-    plt.ylabel("覆盖度 (%) - 基于检测框面积")
+    plt.ylabel("覆盖度 (%) - 基于分割掩码并集")
     plt.savefig(os.path.join(output_dir, "coverage_boxplot.png"))
     plt.close()
     
@@ -109,7 +173,17 @@ if __name__ == "__main__":
     # 结果保存
     OUTPUT_DIR = project_root / "results" / "statistics"
     
-    if MODEL_PATH.exists() and DATA_DIR.exists():
-        analyze_wetland_vegetation(MODEL_PATH, DATA_DIR, OUTPUT_DIR)
+    # 已有预测结果库时直接出图 (调整图表样式不必重新推理)
+    STORE_DIR = OUTPUT_DIR / "predictions"
+    
+    parser = argparse.ArgumentParser(description="植被覆盖度统计")
+    parser.add_argument('--from-store', action='store_true', help="从预测结果库出图，不重新推理 (需先以 WRITE_PREDICTION_STORE=True 运行一次)")
+    parser.add_argument('--backend', default="torch", choices=BACKENDS, help="推理后端 (见 inference_backend.py)")
+    args = parser.parse_args()
+
+    if args.from_store:
+        analyze_from_store(STORE_DIR, OUTPUT_DIR)
+    elif MODEL_PATH.exists() and DATA_DIR.exists():
+        analyze_wetland_vegetation(MODEL_PATH, DATA_DIR, OUTPUT_DIR, args.backend)
     else:
         print("错误: 找不到模型或数据文件夹。")
\ No newline at end of file
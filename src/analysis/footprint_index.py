@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import heapq
+import numpy as np
+from pathlib import Path
+from collections import defaultdict
+from matplotlib.path import Path as PolygonPath
+from matplotlib.transforms import Bbox
+
+# ================= 配置区域 =================
+current_file = Path(__file__).resolve()
+project_root = current_file.parents[2]
+
+# 每帧的拍摄位置 (由 SRT 导出) 或 WebODM 的相机位置
+IMAGES_GEOJSON = project_root / "data" / "SRT_geo" / "images.geojson"
+SHOTS_GEOJSON = project_root / "runs" / "DOM" / "-2024-10-14-shots.geojson"
+
+# 镜头视场 (3840x2160, 归一化焦距 0.637，来自 -cameras.json):
+# 地面覆盖宽度 = 高度 × 3840 / (0.637 × 3840)，高度方向同理
+FOOTPRINT_W_PER_M = 1.0 / 0.6369801591191914
+FOOTPRINT_H_PER_M = (2160 / 3840) / 0.6369801591191914
+# 没有高度信息或高度过低时使用的默认高度 (m)
+DEFAULT_HEIGHT = 15.0
+MIN_HEIGHT = 2.0
+
+# 贪心选帧时的栅格精度 (m) 和目标覆盖率
+COVER_CELL_SIZE = 0.5
+COVER_TARGET = 0.99
+# ===========================================
+
+# 从文件名中解析 视频名 / 时间 / 帧号，例如 DJI_0040_t1.0_29.jpg
+FRAME_NAME_PATTERN = re.compile(r'^(?P<video>.+)_t(?P<time>[\d\.]+)_(?P<frame>\d+)\.\w+$')
+# 直接从视频抽帧时的帧名 (statistic.frame_producer)，例如 DJI_0040_f29
+VIDEO_FRAME_PATTERN = re.compile(r'^(?P<video>.+)_f(?P<frame>\d+)$')
+
+def parse_frame_name(filename):
+    """返回 (视频名, 帧号)，文件名不符合 "视频_t时间_帧号" 或 "视频_f帧号" 格式时返回 None"""
+    name = os.path.basename(filename)
+    m = FRAME_NAME_PATTERN.match(name) or VIDEO_FRAME_PATTERN.match(name)
+    if not m:
+        return None
+    return m.group('video'), int(m.group('frame'))
+
+class FootprintIndex:
+    """
+    帧地面范围的均匀网格空间索引。
+    坐标先投影到以测区中心为原点的局部平面 (m)，测区只有几百米，等距投影误差可以忽略。
+    无人机航向未知，每帧的范围取以拍摄点为中心、边长为地面覆盖短边的正方形:
+    不论机头朝向如何，这块区域一定在画面内，去重时不会漏掉地面。
+    """
+
+    def __init__(self, names, lons, lats, heights, cell_size=None):
+        self.names = list(names)
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        heights = np.asarray(heights, dtype=np.float64)
+        heights = np.where(np.isfinite(heights) & (heights >= MIN_HEIGHT), heights, DEFAULT_HEIGHT)
+
+        self.lon0, self.lat0 = float(lons.mean()), float(lats.mean())
+        self.x, self.y = self.project(lons, lats)
+        half = 0.5 * heights * min(FOOTPRINT_W_PER_M, FOOTPRINT_H_PER_M)
+        self.xmin, self.xmax = self.x - half, self.x + half
+        self.ymin, self.ymax = self.y - half, self.y + half
+
+        # 网格大小取足迹边长的中位数，每个足迹只落在少数几个格子里
+        self.cell_size = float(cell_size or max(1.0, np.median(2 * half)))
+        self.grid = defaultdict(list)
+        for i in range(len(self.names)):
+            for key in self._cells(self.xmin[i], self.ymin[i], self.xmax[i], self.ymax[i]):
+                self.grid[key].append(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def project(self, lons, lats):
+        """经纬度 -> 局部平面坐标 (m)"""
+        R = 6378137.0
+        x = np.radians(np.asarray(lons) - self.lon0) * R * np.cos(np.radians(self.lat0))
+        y = np.radians(np.asarray(lats) - self.lat0) * R
+        return x, y
+
+    def _cells(self, xmin, ymin, xmax, ymax):
+        c0, c1 = int(np.floor(xmin / self.cell_size)), int(np.floor(xmax / self.cell_size))
+        r0, r1 = int(np.floor(ymin / self.cell_size)), int(np.floor(ymax / self.cell_size))
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                yield r, c
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """返回与矩形相交的所有帧的下标 (局部坐标)"""
+        candidates = set()
+        for key in self._cells(xmin, ymin, xmax, ymax):
+            candidates.update(self.grid.get(key, ()))
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+        ids = np.fromiter(candidates, dtype=np.int64)
+        hit = (self.xmin[ids] <= xmax) & (self.xmax[ids] >= xmin) & (self.ymin[ids] <= ymax) & (self.ymax[ids] >= ymin)
+        return np.sort(ids[hit])
+
+    def frames_covering(self, polygon_lonlat):
+        """返回与多边形 [(lon, lat), ...] 相交的帧文件名"""
+        px, py = self.project(*np.asarray(polygon_lonlat, dtype=np.float64).T)
+        poly = PolygonPath(np.column_stack([px, py]))
+        ids = self.query_bbox(px.min(), py.min(), px.max(), py.max())
+        return [
+            self.names[i] for i in ids
+            if poly.intersects_bbox(Bbox([[self.xmin[i], self.ymin[i]], [self.xmax[i], self.ymax[i]]]), filled=True)
+        ]
+
+    def greedy_cover(self, polygon_lonlat=None, cell_size=COVER_CELL_SIZE, target=COVER_TARGET):
+        """
+        贪心求近似最小帧集合: 每次选择能覆盖最多"尚未覆盖的地面格子"的帧，
+        直到覆盖率达到 target。polygon_lonlat 为 None 时目标区域为所有帧范围的并集。
+        使用惰性贪心 (增益只会变小，堆顶重新计算后仍最大即可直接选中)。
+        """
+        gx0, gy0 = self.xmin.min(), self.ymin.min()
+        cols = int(np.ceil((self.xmax.max() - gx0) / cell_size)) + 1
+        rows = int(np.ceil((self.ymax.max() - gy0) / cell_size)) + 1
+
+        # 每帧覆盖的格子范围 (轴对齐矩形 -> 切片)
+        c0 = np.clip(np.ceil((self.xmin - gx0) / cell_size).astype(int), 0, cols)
+        c1 = np.clip(np.floor((self.xmax - gx0) / cell_size).astype(int), 0, cols)
+        r0 = np.clip(np.ceil((self.ymin - gy0) / cell_size).astype(int), 0, rows)
+        r1 = np.clip(np.floor((self.ymax - gy0) / cell_size).astype(int), 0, rows)
+
+        # 目标区域
+        target_mask = np.zeros((rows, cols), dtype=bool)
+        if polygon_lonlat is None:
+            for i in range(len(self.names)):
+                target_mask[r0[i]:r1[i], c0[i]:c1[i]] = True
+        else:
+            px, py = self.project(*np.asarray(polygon_lonlat, dtype=np.float64).T)
+            poly = PolygonPath(np.column_stack([px, py]))
+            cx = gx0 + (np.arange(cols) + 0.5) * cell_size
+            cy = gy0 + (np.arange(rows) + 0.5) * cell_size
+            xx, yy = np.meshgrid(cx, cy)
+            target_mask = poly.contains_points(np.column_stack([xx.ravel(), yy.ravel()])).reshape(rows, cols)
+
+        total = int(target_mask.sum())
+        if total == 0:
+            return []
+        uncovered = target_mask.copy()
+
+        def gain(i):
+            return int(uncovered[r0[i]:r1[i], c0[i]:c1[i]].sum())
+
+        heap = [(-gain(i), i) for i in range(len(self.names))]
+        heapq.heapify(heap)
+        selected, covered = [], 0
+        while heap and covered < target * total:
+            neg, i = heapq.heappop(heap)
+            g = gain(i)
+            if g == 0:
+                continue
+            if heap and g < -heap[0][0]:
+                heapq.heappush(heap, (-g, i))
+                continue
+            uncovered[r0[i]:r1[i], c0[i]:c1[i]] = False
+            covered += g
+            selected.append(self.names[i])
+
+        print(f"  -> 贪心选帧: {len(selected)}/{len(self.names)} 帧覆盖 {covered / total:.1%} 的目标区域")
+        return selected
+
+def load_footprint_index(geojson_path=IMAGES_GEOJSON):
+    """
+    从 images.geojson (Filename, [lon, lat, alt]) 或 WebODM 的 shots.geojson (filename) 构建索引。
+    shots.geojson 中的高度是重建坐标系下的值，不代表离地高度，因此使用默认高度。
+    """
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    names, lons, lats, heights = [], [], [], []
+    is_shots = False
+    for feat in data.get('features', []):
+        props = feat['properties']
+        name = props.get('Filename') or props.get('filename')
+        if name is None:
+            continue
+        is_shots = is_shots or 'translation' in props
+        coords = feat['geometry']['coordinates']
+        names.append(name)
+        lons.append(coords[0])
+        lats.append(coords[1])
+        heights.append(coords[2] if len(coords) > 2 and not is_shots else np.nan)
+    return FootprintIndex(names, lons, lats, heights)
+
+def select_unique_frames(geojson_path=IMAGES_GEOJSON, polygon_lonlat=None):
+    """返回去重后的帧文件名集合 (近似最小覆盖集)"""
+    index = load_footprint_index(geojson_path)
+    return set(index.greedy_cover(polygon_lonlat))
+
+def select_unique_video_frames(geojson_path=IMAGES_GEOJSON, polygon_lonlat=None):
+    """
+    返回 {视频名: {帧号, ...}}，供直接从视频抽帧的统计脚本使用。
+    索引中的每个视频都有一项: 所有帧都被去重掉的视频对应空集合 (整段跳过)，
+    只有不在索引中的视频才没有对应项。
+    """
+    index = load_footprint_index(geojson_path)
+    selected = {}
+    for name in index.names:
+        parsed = parse_frame_name(name)
+        if parsed:
+            selected.setdefault(parsed[0], set())
+    for name in index.greedy_cover(polygon_lonlat):
+        parsed = parse_frame_name(name)
+        if parsed:
+            selected[parsed[0]].add(parsed[1])
+    return selected
+
+if __name__ == "__main__":
+    index = load_footprint_index()
+    print(f"共 {len(index)} 帧，网格大小 {index.cell_size:.1f} m")
+    selected = index.greedy_cover()
+    print(f"去重后需要推理的帧: {len(selected)}")
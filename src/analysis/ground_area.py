@@ -0,0 +1,317 @@
+import os
+import re
+import csv
+import glob
+import json
+import numpy as np
+import cv2
+import torch
+from pathlib import Path
+
+try:
+    import rasterio
+except ImportError:  # 只有使用 DSM 计算离地高度时才需要
+    rasterio = None
+
+try:
+    import piexif
+except ImportError:  # 没有 piexif 时只用 images.csv 的高度
+    piexif = None
+
+# ================= 配置区域 =================
+current_file = Path(__file__).resolve()
+project_root = current_file.parents[2]
+
+# WebODM/OpenSfM 输出的相机内参 (Brown 模型) 和每张图片的位姿
+CAMERAS_PATH = project_root / "runs" / "DOM" / "-2024-10-14-cameras.json"
+SHOTS_PATH = project_root / "runs" / "DOM" / "-2024-10-14-shots.geojson"
+DSM_PATH = project_root / "runs" / "DOM" / "-2024-10-14-dsm.tif"
+# 每帧的飞行高度 (由 SRT 导出，Altitude 为相对起飞点高度，单位 m)
+# 地理标记影像 (videos2geotagged_images.py) 优先读取 EXIF 中的 GPSAltitude (同样来自 SRT)，
+# 没有 EXIF 时按 视频名 + 时间 与 images.csv 对应
+ALTITUDE_CSV = project_root / "data" / "SRT_geo" / "images.csv"
+
+# 离地高度来源:
+#   "altitude": 直接使用 EXIF / images.csv 中 SRT 的相对高度 (假设地面与起飞点同高)
+#   "dsm"     : 相机位置 (shots.geojson) 的高程减去 DSM 在相机正下方的地面高程
+HEIGHT_SOURCE = "altitude"
+# 是否使用 shots.geojson 中的相机姿态 (倾斜拍摄时每个像素的地面面积差别很大)
+# False 时按正射 (镜头垂直向下) 计算，同一相机的 GSD 网格只算一次，按高度平方缩放
+USE_POSE_TILT = False
+# 低于该高度的帧 (起飞/降落阶段) 不参与面积统计
+MIN_HEIGHT = 2.0
+# 倾斜拍摄时，地面交点距相机超过该距离 (m) 的像素视为天空/远景，不计面积
+MAX_GROUND_RANGE = 200.0
+# ===========================================
+
+class BrownCamera:
+    """OpenSfM 的 Brown 相机模型 (焦距和主点以 max(宽, 高) 归一化)"""
+
+    def __init__(self, name, params):
+        self.name = name
+        self.width = int(params['width'])
+        self.height = int(params['height'])
+        self.focal_x = float(params['focal_x'])
+        self.focal_y = float(params.get('focal_y', params['focal_x']))
+        self.c_x = float(params.get('c_x', 0.0))
+        self.c_y = float(params.get('c_y', 0.0))
+        self.k1 = float(params.get('k1', 0.0))
+        self.k2 = float(params.get('k2', 0.0))
+        self.k3 = float(params.get('k3', 0.0))
+        self.p1 = float(params.get('p1', 0.0))
+        self.p2 = float(params.get('p2', 0.0))
+
+    def undistorted_bearings(self, u, v):
+        """像素坐标 (可为任意形状的数组) -> 去畸变后的归一化坐标 (x, y)，z = 1"""
+        size = max(self.width, self.height)
+        xd = ((u - self.width / 2.0) / size - self.c_x) / self.focal_x
+        yd = ((v - self.height / 2.0) / size - self.c_y) / self.focal_y
+        x, y = xd.copy(), yd.copy()
+        # Brown 畸变没有解析逆，定点迭代若干次即可收敛
+        for _ in range(10):
+            r2 = x * x + y * y
+            radial = 1 + self.k1 * r2 + self.k2 * r2 ** 2 + self.k3 * r2 ** 3
+            dx = 2 * self.p1 * x * y + self.p2 * (r2 + 2 * x * x)
+            dy = self.p1 * (r2 + 2 * y * y) + 2 * self.p2 * x * y
+            x = (xd - dx) / radial
+            y = (yd - dy) / radial
+        return x, y
+
+    def pixel_area_grid(self, out_h, out_w, height_m, rotation=None):
+        """
+        计算 (out_h, out_w) 网格中每个格子对应的地面面积 (m²)，网格覆盖整张原图。
+        rotation 为 OpenSfM 的角轴向量 (世界 -> 相机)；None 表示镜头垂直向下。
+        地面视为相机下方 height_m 处的水平面。
+        """
+        # 格子角点的像素坐标 -> 地面坐标，再用两条对角线的叉积求四边形面积
+        u = np.linspace(0, self.width, out_w + 1)
+        v = np.linspace(0, self.height, out_h + 1)
+        uu, vv = np.meshgrid(u, v)
+        x, y = self.undistorted_bearings(uu, vv)
+
+        if rotation is None:
+            gx, gy = x * height_m, y * height_m
+            valid = np.ones_like(gx, dtype=bool)
+        else:
+            R, _ = cv2.Rodrigues(np.asarray(rotation, dtype=np.float64))
+            bearings = np.stack([x, y, np.ones_like(x)], axis=-1)
+            dirs = bearings @ R  # 等价于 R^T @ b，得到世界坐标系下的射线方向
+            dz = dirs[..., 2]
+            # 只有朝下的射线能与地面相交
+            valid = dz < -1e-6
+            t = np.where(valid, height_m / np.where(valid, -dz, 1.0), 0.0)
+            gx, gy = dirs[..., 0] * t, dirs[..., 1] * t
+            valid &= np.hypot(gx, gy) < MAX_GROUND_RANGE
+
+        d1x, d1y = gx[1:, 1:] - gx[:-1, :-1], gy[1:, 1:] - gy[:-1, :-1]
+        d2x, d2y = gx[1:, :-1] - gx[:-1, 1:], gy[1:, :-1] - gy[:-1, 1:]
+        area = 0.5 * np.abs(d1x * d2y - d1y * d2x)
+        cell_valid = valid[1:, 1:] & valid[:-1, :-1] & valid[1:, :-1] & valid[:-1, 1:]
+        return np.where(cell_valid, area, 0.0)
+
+def load_cameras(path=CAMERAS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {name.strip(): BrownCamera(name, params) for name, params in data.items()}
+
+def load_shots(path=SHOTS_PATH):
+    """文件名 -> {'camera', 'translation', 'rotation'}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    shots = {}
+    for feat in data.get('features', []):
+        props = feat['properties']
+        shots[props['filename']] = {
+            'camera': props.get('camera', '').replace('v2 ', '', 1).strip(),
+            'translation': props['translation'],
+            'rotation': props['rotation'],
+        }
+    return shots
+
+# images.csv 中为 DJI_0040_t1.0_29.jpg，地理标记影像为 img_00001_DJI_0040_t1.0.jpg
+FRAME_TIME_PATTERN = re.compile(r'^(?:img_\d+_)?(?P<video>.+?)_t(?P<time>\d+(?:\.\d+)?)(?:_\d+)?\.\w+$')
+
+def altitude_key(filename):
+    """(视频名, 时间) 作为两种命名方式共同的键；不符合格式时返回文件名本身"""
+    name = os.path.basename(filename)
+    m = FRAME_TIME_PATTERN.match(name)
+    if not m:
+        return name
+    return m.group('video'), round(float(m.group('time')), 1)
+
+def load_frame_altitudes(path=ALTITUDE_CSV):
+    """altitude_key(文件名) -> 相对高度 (m)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return {altitude_key(row['Filename']): float(row['Altitude']) for row in csv.DictReader(f)}
+
+def exif_altitude(img_path):
+    """读取 JPEG EXIF 中的 GPSAltitude (m)，没有时返回 None"""
+    if piexif is None or not img_path.lower().endswith(('.jpg', '.jpeg')):
+        return None
+    try:
+        gps = piexif.load(img_path).get('GPS', {})
+    except Exception:
+        return None
+    value = gps.get(piexif.GPSIFD.GPSAltitude)
+    if not value or not value[1]:
+        return None
+    alt = value[0] / value[1]
+    return -alt if gps.get(piexif.GPSIFD.GPSAltitudeRef) == 1 else alt
+
+class DsmSampler:
+    """在 DSM 上按地图坐标取高程，取 5x5 邻域的中位数以避开 NoData 和噪点"""
+
+    def __init__(self, path=DSM_PATH):
+        if rasterio is None:
+            raise RuntimeError("使用 DSM 需要安装 rasterio (pip install rasterio)")
+        self.ds = rasterio.open(path)
+
+    def elevation(self, x, y, radius=2):
+        row, col = self.ds.index(x, y)
+        window = rasterio.windows.Window(col - radius, row - radius, 2 * radius + 1, 2 * radius + 1)
+        data = self.ds.read(1, window=window, boundless=True, masked=True)
+        if data.count() == 0:
+            return None
+        return float(np.ma.median(data))
+
+class GsdGridCache:
+    """
+    正射模式下，同一相机的面积网格只与高度的平方成正比:
+    预先算好 1 m 高度的单位网格 (每个相机、每种输出尺寸一份)，使用时乘以 H²。
+    """
+
+    def __init__(self, device=None):
+        self.device = device
+        self._unit = {}
+
+    def grid(self, camera, shape, height_m, rotation=None):
+        if rotation is not None:
+            # 倾斜模式每帧姿态不同，无法复用
+            return torch.as_tensor(camera.pixel_area_grid(shape[0], shape[1], height_m, rotation),
+                                   dtype=torch.float32, device=self.device)
+        key = (camera.name, tuple(shape))
+        if key not in self._unit:
+            self._unit[key] = torch.as_tensor(camera.pixel_area_grid(shape[0], shape[1], 1.0),
+                                              dtype=torch.float32, device=self.device)
+        return self._unit[key] * (height_m ** 2)
+
+def letterbox_area_grid(grid_cache, camera, orig_shape, mask_shape, height_m, rotation=None):
+    """
+    生成与 mask 同尺寸的面积网格。retina mask 与原图同尺寸；
+    网络输入分辨率的 mask 带有 LetterBox 灰边，灰边处面积为 0。
+    """
+    if tuple(mask_shape) == tuple(orig_shape):
+        return grid_cache.grid(camera, mask_shape, height_m, rotation)
+    in_h, in_w = mask_shape
+    gain = min(in_h / orig_shape[0], in_w / orig_shape[1])
+    new_h, new_w = int(round(orig_shape[0] * gain)), int(round(orig_shape[1] * gain))
+    # 与 Ultralytics LetterBox(center=True) 的取整方式一致
+    top = int(round((in_h - new_h) / 2 - 0.1))
+    left = int(round((in_w - new_w) / 2 - 0.1))
+    inner = grid_cache.grid(camera, (new_h, new_w), height_m, rotation)
+    full = torch.zeros(mask_shape, dtype=inner.dtype, device=inner.device)
+    full[top:top + new_h, left:left + new_w] = inner
+    return full
+
+def class_ground_areas(result, num_classes, area_grid):
+    """
+    每个类别的地面面积 (m²)。同类实例先求并集 (重叠不重复计算)，
+    再与面积网格逐像素相乘求和，全部在设备上完成。返回 (num_classes,) 张量。
+    """
+    if result.masks is None or len(result.masks) == 0:
+        return torch.zeros(num_classes, dtype=torch.float64, device=area_grid.device)
+    data = result.masks.data
+    n = data.shape[0]
+    cls = result.boxes.cls.long()
+    one_hot = torch.zeros(num_classes, n, dtype=torch.float32, device=data.device)
+    one_hot[cls, torch.arange(n, device=data.device)] = 1.0
+    union = ((one_hot @ data.reshape(n, -1).float()) > 0).float()  # (C, h*w)
+    return (union @ area_grid.reshape(-1).to(union.device)).double()
+
+def frame_height(img_path, altitudes, shots, dsm):
+    """确定一帧的离地高度 (m)，无法确定时返回 None"""
+    filename = os.path.basename(img_path)
+    if HEIGHT_SOURCE == "dsm" and dsm is not None and filename in shots:
+        x, y, z = shots[filename]['translation']
+        ground = dsm.elevation(x, y)
+        if ground is not None:
+            return z - ground
+    altitude = exif_altitude(img_path)
+    if altitude is not None:
+        return altitude
+    return altitudes.get(altitude_key(filename))
+
+def analyze_ground_area(model_path, image_dir, output_dir, batch_size=8):
+    from ultralytics import YOLO
+
+    model = YOLO(str(model_path))
+    class_names = model.names
+    num_classes = len(class_names)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+    cameras = load_cameras()
+    default_camera = next(iter(cameras.values()))
+    shots = load_shots()
+    altitudes = load_frame_altitudes()
+    dsm = DsmSampler() if HEIGHT_SOURCE == "dsm" else None
+    grid_cache = GsdGridCache(device=device)
+
+    # DOM 目录下按 wetland_proj_partN/ 分包，递归查找
+    image_paths = sorted(glob.glob(os.path.join(image_dir, "**", "*.jpg"), recursive=True)
+                         + glob.glob(os.path.join(image_dir, "**", "*.png"), recursive=True))
+    print(f"开始计算地面面积: {len(image_paths)} 张影像 (高度来源: {HEIGHT_SOURCE}, 倾斜校正: {USE_POSE_TILT})")
+
+    rows = []
+    totals = np.zeros(num_classes)
+    skipped = 0
+    for start in range(0, len(image_paths), batch_size):
+        batch_paths = image_paths[start:start + batch_size]
+        results = model.predict(batch_paths, verbose=False, retina_masks=False, device=device)
+        for img_path, result in zip(batch_paths, results):
+            filename = os.path.basename(img_path)
+            height_m = frame_height(img_path, altitudes, shots, dsm)
+            if height_m is None or height_m < MIN_HEIGHT:
+                skipped += 1
+                continue
+
+            shot = shots.get(filename)
+            camera = cameras.get(shot['camera'], default_camera) if shot else default_camera
+            rotation = shot['rotation'] if (USE_POSE_TILT and shot) else None
+            mask_shape = result.masks.data.shape[1:] if result.masks is not None else result.orig_shape
+            area_grid = letterbox_area_grid(grid_cache, camera, result.orig_shape, mask_shape, height_m, rotation)
+
+            areas = class_ground_areas(result, num_classes, area_grid).cpu().numpy()
+            totals += areas
+            row = {'filename': filename, 'height_m': height_m, 'footprint_m2': float(area_grid.sum())}
+            row.update({f"{class_names[k]}_m2": areas[k] for k in range(num_classes)})
+            rows.append(row)
+
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = os.path.join(output_dir, "vegetation_ground_area.csv")
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        if rows:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    print(f"逐帧面积已保存: {csv_path} (跳过 {skipped} 张无高度/高度过低的影像)")
+
+    # 注意: 相邻帧的地面范围会重叠，这里的合计是逐帧面积之和
+    print("\n====== 各类植被地面面积 (逐帧累加) ======")
+    for k in range(num_classes):
+        print(f"{class_names[k]}: {totals[k]:.1f} m² ({totals[k] / 10000:.4f} ha)")
+    print(f"合计: {totals.sum():.1f} m² ({totals.sum() / 10000:.4f} ha)")
+    return rows
+
+if __name__ == "__main__":
+    MODEL_PATH = project_root / "models" / "best.pt"
+    DATA_DIR = project_root / "data" / "DOM"
+    OUTPUT_DIR = project_root / "runs" / "analysis_results"
+
+    if MODEL_PATH.exists() and DATA_DIR.exists():
+        analyze_ground_area(MODEL_PATH, DATA_DIR, OUTPUT_DIR)
+    else:
+        print("错误: 找不到模型或数据文件夹。")
@@ -0,0 +1,269 @@
+import os
+import sys
+import argparse
+import yaml
+import cv2
+import numpy as np
+from pathlib import Path
+from ultralytics import YOLO
+from ultralytics.cfg import DEFAULT_CFG
+
+try:
+    from onnxruntime.quantization import CalibrationDataReader
+except ImportError:
+    CalibrationDataReader = object
+
+# ================= 配置区域 =================
+current_file = Path(__file__).resolve()
+project_root = current_file.parents[2]
+
+# 可选的推理后端:
+#   torch          : 直接用 PyTorch 加载 best.pt (原来的方式，有 GPU 时首选)
+#   onnx           : ONNX Runtime (FP32)
+#   onnx-int8      : ONNX Runtime + 静态 int8 量化 (用本项目的训练帧校准)
+#   openvino       : OpenVINO IR (FP32)，Intel CPU 上通常最快
+#   openvino-int8  : OpenVINO IR + NNCF 静态 int8 量化 (用本项目的训练帧校准)
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino", "openvino-int8")
+EXPORT_IMGSZ = 1024               # 与训练分辨率一致
+DATA_YAML = project_root / "configs" / "chenhu_seg.yaml"
+CALIB_IMAGES = 300                # 校准用的训练帧数 (在训练集中均匀抽取)
+MAX_MAP_DROP = 0.01               # mask mAP50-95 相比 PyTorch 下降超过该值 (绝对值) 视为不合格
+CHECK_BATCH = 8                   # 精度检查时两个模型使用相同的 batch，且都不用 rect (补边方式完全一致)
+# ===========================================
+
+# ================= 说明 =================
+# 导出: python inference_backend.py --model best.pt --backend openvino-int8 --export
+#   导出文件放在 best.pt 旁边 (Ultralytics 的命名: best.onnx / best_openvino_model / best_int8_openvino_model，
+#   ONNX int8 为 best_int8.onnx)。导出使用动态输入尺寸，可以按 batch 推理；
+#   load_model 加载导出模型时把默认推理尺寸设为 EXPORT_IMGSZ (导出时改了 --imgsz 的话，加载时也要传相同的值)。
+# 检查: 加 --check 在验证集上对比导出模型和 PyTorch 模型的 mask mAP。
+# 分析脚本通过 load_model(model_path, backend) 加载，返回的对象与 YOLO 用法相同 (predict/names)。
+# =======================================
+
+def exported_path(model_path, backend):
+    """导出后模型所在的路径 (文件或 OpenVINO 目录)"""
+    model_path = Path(model_path)
+    stem = model_path.with_suffix("")
+    return {
+        "torch": model_path,
+        "onnx": stem.with_suffix(".onnx"),
+        "onnx-int8": Path(f"{stem}_int8.onnx"),
+        "openvino": Path(f"{stem}_openvino_model"),
+        "openvino-int8": Path(f"{stem}_int8_openvino_model"),
+    }[backend]
+
+def weights_file(model_path, backend):
+    """用于预测缓存键的权重文件 (OpenVINO 为目录中的 .bin)"""
+    path = exported_path(model_path, backend)
+    if path.is_dir():
+        bins = sorted(path.glob("*.bin"))
+        return bins[0] if bins else path / "metadata.yaml"
+    return path
+
+def backend_device(backend, device):
+    """导出的后端只在 CPU 上运行 (ONNX Runtime GPU 版本另行安装，这里不考虑)"""
+    return device if backend == "torch" else 'cpu'
+
+def is_stale(path, model_path):
+    """导出文件比 best.pt 旧 (重新训练之后还没有重新导出)"""
+    model_path = Path(model_path)
+    return model_path.exists() and Path(path).stat().st_mtime < model_path.stat().st_mtime
+
+def load_model(model_path, backend="torch", imgsz=EXPORT_IMGSZ):
+    """
+    按后端加载模型；导出文件不存在时给出导出命令。
+    动态尺寸的导出模型不带输入尺寸，Ultralytics 预测时会退回默认的 640，
+    而 best.pt 会沿用训练时的 imgsz=1024；这里把导出模型的默认 imgsz 固定为 imgsz，保证可以直接替换 best.pt。
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的推理后端: {backend}，可选: {', '.join(BACKENDS)}")
+    path = exported_path(model_path, backend)
+    export_cmd = f"python inference_backend.py --model {model_path} --backend {backend} --export"
+    if not path.exists():
+        raise FileNotFoundError(f"找不到 {backend} 模型 {path}，请先运行: {export_cmd}")
+    if backend != "torch" and is_stale(path, model_path):
+        print(f"警告: {path} 比 {model_path} 旧，可能是重新训练前导出的，请重新运行: {export_cmd}")
+    model = YOLO(str(path), task='segment')
+    if backend != "torch":
+        model.overrides['imgsz'] = imgsz  # 调用 predict 时显式传入的 imgsz (例如切片推理) 仍然优先
+        print(f"推理后端: {backend} ({path}, imgsz={imgsz})")
+    return model
+
+# ---------- 校准数据 ----------
+def calibration_images(data_yaml=DATA_YAML, count=CALIB_IMAGES):
+    """从数据集配置的训练集中均匀抽取 count 张图片 (train 可以是目录或列表文件)"""
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    root = Path(cfg.get('path', '.'))
+    if not root.is_absolute() and not root.exists():
+        root = Path(data_yaml).resolve().parent.parent / root  # 相对于项目根目录 (configs/ 的上一级)
+    entry = root / cfg['train']
+    if entry.is_dir():
+        images = sorted(str(p) for p in entry.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))
+    else:
+        with open(entry, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f if line.strip()]
+        images = sorted({str(entry.parent / l[2:]) if l.startswith('./') else l for l in lines})
+    if not images:
+        raise FileNotFoundError(f"{entry} 中没有图片")
+    pick = np.linspace(0, len(images) - 1, min(count, len(images))).round().astype(int)
+    return [images[i] for i in np.unique(pick)]
+
+def write_calibration_yaml(data_yaml, images, out_dir):
+    """生成 val 指向校准列表的数据集配置 (Ultralytics 的 int8 导出从 val 划分读取校准图片)"""
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    os.makedirs(out_dir, exist_ok=True)
+    list_path = os.path.join(out_dir, "calibration.txt")
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.writelines(p + "\n" for p in images)
+    cfg.update(path=str(Path(out_dir).resolve()), train="calibration.txt", val="calibration.txt")
+    calib_yaml = os.path.join(out_dir, "calibration.yaml")
+    with open(calib_yaml, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+    return calib_yaml
+
+def letterbox(img, imgsz):
+    """与 Ultralytics 预处理相同: 长边缩放到 imgsz，居中补灰边 (114)，BGR -> RGB，归一化到 0~1，NCHW"""
+    h, w = img.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * r), round(w * r)
+    if (nh, nw) != (h, w):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    canvas[top:top + nh, left:left + nw] = img
+    return np.ascontiguousarray(canvas[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """ONNX Runtime 静态量化的校准数据: 逐张读取训练帧 (不一次性全部载入内存)"""
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.pos = 0
+
+    def get_next(self):
+        while self.pos < len(self.image_paths):
+            img = cv2.imread(self.image_paths[self.pos])
+            self.pos += 1
+            if img is not None:
+                return {self.input_name: letterbox(img, self.imgsz)}
+        return None
+
+    def rewind(self):
+        self.pos = 0
+
+# ---------- 导出 ----------
+def quantize_onnx_int8(fp32_path, int8_path, images, imgsz):
+    """
+    ONNX Runtime 静态 int8 量化 (QDQ 格式，权重按通道量化)。
+    只量化 Conv/MatMul，检测头的 Sigmoid/Concat 和 mask 系数保留浮点，精度损失小得多。
+    """
+    try:
+        import onnx
+        from onnxruntime.quantization import quantize_static, QuantFormat, QuantType, CalibrationMethod
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError:
+        print("错误: ONNX int8 量化需要 onnx 和 onnxruntime (pip install onnx onnxruntime)")
+        raise
+
+    prep_path = str(fp32_path).replace(".onnx", "_prep.onnx")
+    quant_pre_process(str(fp32_path), prep_path, skip_symbolic_shape=True)
+    input_name = onnx.load(prep_path, load_external_data=False).graph.input[0].name
+    print(f"正在量化 (校准图片 {len(images)} 张)...")
+    quantize_static(
+        prep_path, str(int8_path), FrameCalibrationReader(images, input_name, imgsz),
+        quant_format=QuantFormat.QDQ, per_channel=True,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        op_types_to_quantize=['Conv', 'MatMul'], calibrate_method=CalibrationMethod.MinMax,
+    )
+    os.remove(prep_path)
+
+    # 把 Ultralytics 写在 FP32 模型里的元数据 (类别名、imgsz、task 等) 复制过来，YOLO() 才能直接加载
+    fp32_meta = onnx.load(str(fp32_path), load_external_data=False).metadata_props
+    int8_model = onnx.load(str(int8_path))
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_meta)
+    onnx.save(int8_model, str(int8_path))
+    return int8_path
+
+def export_backend(model_path, backend, imgsz=EXPORT_IMGSZ, data_yaml=DATA_YAML, calib_images=CALIB_IMAGES):
+    """把 best.pt 导出为指定后端，返回导出路径"""
+    if backend == "torch":
+        return Path(model_path)
+    model = YOLO(str(model_path))
+    target = exported_path(model_path, backend)
+
+    if backend in ("onnx", "onnx-int8"):
+        fp32_path = exported_path(model_path, "onnx")
+        # int8 在 FP32 ONNX 的基础上量化: 已有的 best.onnx 比 best.pt 旧时重新导出，避免量化重新训练前的模型
+        if backend == "onnx" or not fp32_path.exists() or is_stale(fp32_path, model_path):
+            fp32_path = Path(model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True))
+        if backend == "onnx-int8":
+            quantize_onnx_int8(fp32_path, target, calibration_images(data_yaml, calib_images), imgsz)
+    elif backend == "openvino":
+        target = Path(model.export(format='openvino', imgsz=imgsz, dynamic=True))
+    elif backend == "openvino-int8":
+        calib_dir = Path(model_path).parent / "calibration"
+        calib_yaml = write_calibration_yaml(data_yaml, calibration_images(data_yaml, calib_images), calib_dir)
+        target = Path(model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=True,
+                                   data=calib_yaml, split='val'))
+    else:
+        raise ValueError(f"未知的推理后端: {backend}")
+
+    size_mb = sum(p.stat().st_size for p in (target.rglob("*") if target.is_dir() else [target])) / 2**20
+    print(f"✅ 已导出 {backend}: {target} ({size_mb:.1f} MB)")
+    return target
+
+# ---------- 精度检查 ----------
+def check_map_drift(model_path, backend, data_yaml=DATA_YAML, imgsz=EXPORT_IMGSZ, max_drop=MAX_MAP_DROP):
+    """
+    在验证集上分别评估 PyTorch 模型和导出模型，比较 mask mAP50-95 / mAP50。
+    两次评估使用相同的 batch 并关闭 rect，输入的缩放和补边完全相同，差异只来自模型本身。
+    不显式传 imgsz: 两个模型都用 load_model 给出的默认推理尺寸 (与分析脚本一致)，尺寸不一致直接判为不合格。
+    返回结果字典，ok=False 表示下降超过 max_drop 或推理尺寸不一致。
+    """
+    import torch
+
+    torch_device = 0 if torch.cuda.is_available() else 'cpu'
+    rows = {}
+    for name, device in (("torch", torch_device), (backend, backend_device(backend, torch_device))):
+        model = load_model(model_path, name, imgsz)
+        metrics = model.val(data=str(data_yaml), split='val', batch=CHECK_BATCH, rect=False,
+                            device=device, plots=False, verbose=False)
+        rows[name] = {"mask_map": float(metrics.seg.map), "mask_map50": float(metrics.seg.map50),
+                      "box_map": float(metrics.box.map), "imgsz": model.overrides.get('imgsz', DEFAULT_CFG.imgsz)}
+
+    drop = rows["torch"]["mask_map"] - rows[backend]["mask_map"]
+    same_size = rows["torch"]["imgsz"] == rows[backend]["imgsz"]
+    result = {"reference": rows["torch"], "backend": rows[backend], "mask_map_drop": drop,
+              "ok": drop <= max_drop and same_size}
+    print(f"\n====== mask mAP 对比 (验证集) ======")
+    for name, r in rows.items():
+        print(f"{name:>14}: mAP50-95 {r['mask_map']:.4f} | mAP50 {r['mask_map50']:.4f} | "
+              f"box mAP50-95 {r['box_map']:.4f} | imgsz {r['imgsz']}")
+    if not same_size:
+        print(f"❌ 推理尺寸不一致 ({rows['torch']['imgsz']} vs {rows[backend]['imgsz']})，导出模型不能直接替换 best.pt")
+    print(f"下降: {drop:+.4f} (允许 {max_drop}) -> {'✅ 合格' if result['ok'] else '❌ 不合格'}")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出 CPU 推理后端 (ONNX / OpenVINO，可选 int8) 并检查精度")
+    parser.add_argument('--model', default=str(project_root / "runs" / "train" / "wetland_yolo11x_exp1" / "weights" / "best.pt"))
+    parser.add_argument('--backend', default="openvino-int8", choices=BACKENDS)
+    parser.add_argument('--data', default=str(DATA_YAML))
+    parser.add_argument('--imgsz', type=int, default=EXPORT_IMGSZ)
+    parser.add_argument('--calib', type=int, default=CALIB_IMAGES, help="校准图片数量")
+    parser.add_argument('--export', action='store_true', help="导出模型")
+    parser.add_argument('--check', action='store_true', help="在验证集上检查 mask mAP 下降")
+    args = parser.parse_args()
+
+    if not (args.export or args.check):
+        parser.error("请至少指定 --export 或 --check")
+    if args.export:
+        export_backend(args.model, args.backend, args.imgsz, args.data, args.calib)
+    if args.check:
+        result = check_map_drift(args.model, args.backend, args.data, args.imgsz)
+        sys.exit(0 if result["ok"] else 1)
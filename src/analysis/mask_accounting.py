@@ -0,0 +1,112 @@
+import torch
+
+# ================= 说明 =================
+# 分割结果的像素统计工具，所有归约都在模型所在设备上完成，
+# 只把长度为类别数的向量拷回 CPU，避免 (N, H, W) 的整张 mask 传输。
+#
+# 统计分辨率 (count_resolution):
+#   "retina": predict(retina_masks=True)，mask 已是原图分辨率，直接计数
+#   "input" : predict(retina_masks=False)，mask 为网络输入分辨率 (由原型 mask 上采样得到)，
+#             计数后乘以精确的面积缩放系数换算回原图像素，全程不生成 4K mask
+#
+# 覆盖度 (class_union_coverage): 同一类别的实例 mask 先求并集再计数，
+# 结果是不重叠的真实覆盖比例 (不会超过 100%)，可以在降低的分辨率上计算以节省显存。
+# =======================================
+
+COUNT_RESOLUTIONS = ("retina", "input")
+
+def letterbox_unpad_shape(orig_shape, input_shape):
+    """复现 Ultralytics LetterBox 的缩放: 返回原图缩放后 (去掉灰边) 的 (h, w)"""
+    orig_h, orig_w = orig_shape
+    in_h, in_w = input_shape
+    gain = min(in_h / orig_h, in_w / orig_w)
+    return int(round(orig_h * gain)), int(round(orig_w * gain))
+
+def mask_area_scale(orig_shape, mask_shape):
+    """
+    mask 中一个像素对应原图多少个像素。
+    retina mask 与原图同尺寸时为 1；输入分辨率的 mask 只有中间去灰边的区域映射到原图。
+    """
+    if tuple(mask_shape) == tuple(orig_shape):
+        return 1.0
+    unpad_h, unpad_w = letterbox_unpad_shape(orig_shape, mask_shape)
+    return (orig_shape[0] * orig_shape[1]) / float(unpad_h * unpad_w)
+
+def class_pixel_totals(result, num_classes):
+    """
+    计算单帧结果中每个类别的 mask 像素总数 (换算到原图分辨率，实例重叠部分重复计数)。
+    返回长度为 num_classes 的 torch.float64 张量 (仍在设备上)。
+    """
+    masks = result.masks
+    if masks is None or len(masks) == 0:
+        return None
+
+    data = masks.data  # (N, h, w)，设备上
+    cls = result.boxes.cls.long()
+    # 每个实例的像素数: 单个 4K mask 最多 830 万像素，float32 仍能精确表示
+    per_instance = data.sum(dim=(1, 2), dtype=torch.float32).double()
+    totals = torch.zeros(num_classes, dtype=torch.float64, device=data.device)
+    totals.index_add_(0, cls, per_instance)
+    return totals * mask_area_scale(result.orig_shape, data.shape[1:])
+
+def batch_class_pixel_totals(results, num_classes):
+    """对一批结果求和，只在最后做一次设备 -> CPU 拷贝，返回 numpy 数组 (num_classes,)"""
+    acc = None
+    for result in results:
+        totals = class_pixel_totals(result, num_classes)
+        if totals is None:
+            continue
+        acc = totals if acc is None else acc + totals
+    if acc is None:
+        return None
+    return acc.cpu().numpy()
+
+def class_union_coverage(result, num_classes, max_side=640):
+    """
+    计算单帧中每个类别的真实覆盖度 (0~1)，同类实例之间的重叠只算一次。
+    先把 mask 在设备上缩小到长边不超过 max_side，再按类别做 OR 并集。
+    返回长度为 num_classes 的 torch.float64 张量 (仍在设备上)。
+    """
+    masks = result.masks
+    if masks is None or len(masks) == 0:
+        return None
+
+    data = masks.data  # (N, h, w)
+    n, h, w = data.shape
+    scale = min(1.0, max_side / max(h, w))
+    if scale < 1.0:
+        rh, rw = max(1, int(round(h * scale))), max(1, int(round(w * scale)))
+        # area 插值相当于按块求平均，再以 0.5 为阈值还原为二值图
+        data = torch.nn.functional.interpolate(data[None].float(), size=(rh, rw), mode='area')[0] >= 0.5
+    else:
+        rh, rw = h, w
+        data = data > 0.5
+
+    # 类别 one-hot (C, N) @ mask (N, rh*rw) > 0  等价于对每个类别的实例 mask 求 OR
+    cls = result.boxes.cls.long()
+    one_hot = torch.zeros(num_classes, n, dtype=torch.float32, device=data.device)
+    one_hot[cls, torch.arange(n, device=data.device)] = 1.0
+    union = (one_hot @ data.reshape(n, -1).float()) > 0
+    union_pixels = union.sum(dim=1, dtype=torch.float64)
+
+    # 缩小后的一个像素 -> 原 mask 像素 -> 原图像素
+    orig_h, orig_w = result.orig_shape
+    to_orig = (h * w) / float(rh * rw) * mask_area_scale(result.orig_shape, (h, w))
+    return (union_pixels * to_orig / float(orig_h * orig_w)).clamp_(max=1.0)
+
+def batch_class_union_coverage(results, num_classes, max_side=640):
+    """
+    对一批结果计算覆盖度，返回 numpy 数组 (B, num_classes)，没有检测结果的帧为 0。
+    整批只做一次设备 -> CPU 拷贝。
+    """
+    rows = []
+    device = None
+    for result in results:
+        cov = class_union_coverage(result, num_classes, max_side)
+        if cov is not None:
+            device = cov.device
+        rows.append(cov)
+    if device is None:
+        return torch.zeros(len(results), num_classes, dtype=torch.float64).numpy()
+    rows = [r if r is not None else torch.zeros(num_classes, dtype=torch.float64, device=device) for r in rows]
+    return torch.stack(rows).cpu().numpy()
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import numpy as np
+import torch
+from pathlib import Path
+from ultralytics import YOLO
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:  # rasterio 只有这个脚本需要，未安装时给出提示
+    rasterio = None
+
+# ================= 配置区域 =================
+current_file = Path(__file__).resolve()
+project_root = current_file.parents[2]
+
+# WebODM 输出的正射影像 (RGB + Alpha)
+ORTHO_PATH = project_root / "runs" / "DOM" / "-2024-10-14-orthophoto.tif"
+MODEL_PATH = project_root / "models" / "best.pt"
+# 输出: 与正射影像同网格、同坐标系的类别栅格
+OUTPUT_PATH = project_root / "runs" / "DOM" / "-2024-10-14-classmap.tif"
+
+# 每个推理窗口的大小 (像素)，与训练时的 imgsz 一致
+WINDOW_SIZE = 1024
+# 窗口四周的重叠边距: 推理时多读 MARGIN 像素，只写回中间部分，避免窗口边缘处的目标被截断
+MARGIN = 128
+# 每批推理的窗口数量
+BATCH_SIZE = 8
+CONF_THRESHOLD = 0.25
+
+# 输出栅格的取值: 0 = 无植被，k + 1 = 类别 k，255 = 正射影像以外 (NoData)
+BACKGROUND_VALUE = 0
+NODATA_VALUE = 255
+# 输出 GeoTIFF 的分块大小 (必须是 16 的倍数)
+BLOCK_SIZE = 256
+# ===========================================
+
+def iter_core_windows(width, height, core_size):
+    """按行优先顺序产出不重叠的核心窗口 (col_off, row_off, w, h)，顺序固定，便于断点续跑"""
+    for row in range(0, height, core_size):
+        for col in range(0, width, core_size):
+            yield col, row, min(core_size, width - col), min(core_size, height - row)
+
+def expand_window(core, margin, width, height):
+    """核心窗口向四周扩展 margin 像素 (裁剪到影像范围内)，返回读取窗口和核心在其中的偏移"""
+    col, row, w, h = core
+    c0, r0 = max(0, col - margin), max(0, row - margin)
+    c1, r1 = min(width, col + w + margin), min(height, row + h + margin)
+    return (c0, r0, c1 - c0, r1 - r0), (col - c0, row - r0)
+
+def result_to_class_map(result, shape):
+    """
+    把一个窗口的实例分割结果转换为类别图 (uint8)。
+    多个实例重叠时取置信度最高的实例的类别。全部在设备上计算，只把窗口大小的结果拷回。
+    """
+    class_map = np.full(shape, BACKGROUND_VALUE, dtype=np.uint8)
+    if result.masks is None or len(result.masks) == 0:
+        return class_map
+    masks = result.masks.data  # (N, h, w)，retina 分辨率 = 窗口大小
+    conf = result.boxes.conf
+    cls = result.boxes.cls.long()
+    score = masks * conf[:, None, None]
+    best_score, best_idx = score.max(dim=0)
+    values = torch.where(best_score > 0, cls[best_idx] + 1, torch.full_like(best_idx, BACKGROUND_VALUE))
+    return values.to(torch.uint8).cpu().numpy()
+
+def progress_path_for(output_path):
+    return str(output_path) + ".progress.json"
+
+def run_signature(ortho_path, model_path):
+    """断点续跑的校验信息: 输入影像、模型或窗口参数变了就必须从头开始"""
+    st = os.stat(ortho_path)
+    return {
+        'ortho': str(ortho_path), 'ortho_size': st.st_size, 'ortho_mtime': st.st_mtime_ns,
+        'model': str(model_path), 'window': WINDOW_SIZE, 'margin': MARGIN, 'conf': CONF_THRESHOLD,
+    }
+
+def load_progress(output_path, signature):
+    path = progress_path_for(output_path)
+    if not os.path.exists(output_path) or not os.path.exists(path):
+        return 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if progress.get('signature') != signature:
+        print("  [提示] 输入或参数已变化，忽略旧的进度文件，从头开始。")
+        return 0
+    return int(progress.get('next_window', 0))
+
+def save_progress(output_path, signature, next_window, total_windows):
+    path = progress_path_for(output_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'next_window': next_window, 'total_windows': total_windows}, f)
+    os.replace(tmp_path, path)
+
+def create_output(src, output_path, class_names):
+    """创建分块 + 压缩的单波段 uint8 GeoTIFF，坐标系和仿射变换与正射影像一致"""
+    profile = {
+        'driver': 'GTiff', 'width': src.width, 'height': src.height, 'count': 1, 'dtype': 'uint8',
+        'crs': src.crs, 'transform': src.transform, 'nodata': NODATA_VALUE,
+        'tiled': True, 'blockxsize': BLOCK_SIZE, 'blockysize': BLOCK_SIZE,
+        'compress': 'deflate', 'predictor': 2, 'BIGTIFF': 'IF_SAFER',
+    }
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        # 类别说明写进 GeoTIFF 标签，GIS 软件中可以直接查看
+        dst.update_tags(**{f"class_{k + 1}": name for k, name in class_names.items()},
+                        class_0="background")
+
+def read_window_bgr(src, read_win):
+    """读取一个窗口，返回 (BGR 图像, 有效像素掩码)"""
+    c0, r0, w, h = read_win
+    window = Window(c0, r0, w, h)
+    rgb = src.read([1, 2, 3], window=window)  # (3, h, w)
+    if src.count >= 4:
+        valid = src.read(4, window=window) > 0
+    else:
+        valid = np.ones((h, w), dtype=bool)
+    bgr = np.ascontiguousarray(rgb[::-1].transpose(1, 2, 0))
+    return bgr, valid
+
+def segment_orthophoto(ortho_path=ORTHO_PATH, model_path=MODEL_PATH, output_path=OUTPUT_PATH):
+    if rasterio is None:
+        print("错误: 需要安装 rasterio 才能读写 GeoTIFF (pip install rasterio)")
+        return
+
+    model = YOLO(str(model_path))
+    core_size = WINDOW_SIZE - 2 * MARGIN
+    signature = run_signature(ortho_path, model_path)
+
+    with rasterio.open(ortho_path) as src:
+        windows = list(iter_core_windows(src.width, src.height, core_size))
+        total = len(windows)
+        start_idx = load_progress(output_path, signature)
+        if start_idx == 0:
+            create_output(src, output_path, model.names)
+        else:
+            print(f"  -> 从第 {start_idx}/{total} 个窗口继续")
+
+        print(f"正射影像: {src.width}x{src.height}, 共 {total} 个窗口 (核心 {core_size}px + 边距 {MARGIN}px)")
+        t_start = time.perf_counter()
+        processed = 0
+
+        # 每次只在内存里保留一个批次的窗口，内存占用与影像大小无关
+        for batch_start in range(start_idx, total, BATCH_SIZE):
+            batch = windows[batch_start:batch_start + BATCH_SIZE]
+            images, metas, outputs = [], [], []
+            for core in batch:
+                read_win, offset = expand_window(core, MARGIN, src.width, src.height)
+                bgr, valid = read_window_bgr(src, read_win)
+                col_off, row_off = offset
+                core_valid = valid[row_off:row_off + core[3], col_off:col_off + core[2]]
+                if not core_valid.any():
+                    # 完全在正射影像范围外的窗口不需要推理
+                    outputs.append((core, np.full((core[3], core[2]), NODATA_VALUE, dtype=np.uint8)))
+                    continue
+                images.append(bgr)
+                metas.append((core, offset, core_valid))
+
+            if images:
+                results = model.predict(images, imgsz=WINDOW_SIZE, conf=CONF_THRESHOLD,
+                                        retina_masks=True, verbose=False)
+                for (core, (col_off, row_off), core_valid), img, result in zip(metas, images, results):
+                    class_map = result_to_class_map(result, img.shape[:2])
+                    core_map = class_map[row_off:row_off + core[3], col_off:col_off + core[2]].copy()
+                    core_map[~core_valid] = NODATA_VALUE
+                    outputs.append((core, core_map))
+
+            # 每批写完后关闭文件 (刷新到磁盘) 再记录进度，中断后可从下一批继续
+            with rasterio.open(output_path, 'r+') as dst:
+                for (col, row, w, h), data in outputs:
+                    dst.write(data, 1, window=Window(col, row, w, h))
+            next_window = batch_start + len(batch)
+            save_progress(output_path, signature, next_window, total)
+
+            processed += len(batch)
+            elapsed = time.perf_counter() - t_start
+            print(f"  -> 进度: {next_window}/{total} 窗口 ({processed / elapsed:.2f} 窗口/秒)", end='\r')
+
+    print(f"\n✅ 类别栅格已保存: {output_path}")
+
+if __name__ == "__main__":
+    if ORTHO_PATH.exists() and MODEL_PATH.exists():
+        segment_orthophoto()
+    else:
+        print("错误: 找不到正射影像或模型文件。")
@@ -1,21 +1,36 @@
 from ultralytics import YOLO
 import cv2
+from sliced_inference import SlicedPredictor
+from prediction_cache import PredictionCache
 
-def predict_wetland_plants(image_path, model_path='../models/wetland_best.pt'):
+def predict_wetland_plants(image_path, model_path='../models/wetland_best.pt', sliced=False, tile_size=1024, overlap=0.2,
+                           use_cache=True):
     # 加载你训练好的模型
     model = YOLO(model_path)
-    
+
     # 预测
-    results = model(image_path)
-    
+    if sliced:
+        # 切片推理: 3840x2160 原图按 tile_size 切块推理后拼回，小目标不会因整图缩小而丢失
+        # mask_downscale=1 保证拼接后的 mask 与原图同尺寸，便于直接画图保存
+        slicer = SlicedPredictor(model, tile_size=tile_size, overlap=overlap, mask_downscale=1)
+        results = slicer.predict([cv2.imread(image_path)], paths=[image_path])
+        print(slicer.report())
+    elif use_cache:
+        # 同一模型对同一张图片 (按内容) 只推理一次，结果存放在 runs/prediction_cache
+        cache = PredictionCache(model, model_path)
+        results = cache.predict([image_path])
+        print(cache.report())
+    else:
+        results = model(image_path)
+
     # 处理结果
     for result in results:
         # 保存结果图
-        result.save(filename='result.jpg') 
+        result.save(filename='result.jpg')
         # 获取分割掩码 (Masks)
         if result.masks:
             masks = result.masks.data
             # 这里可以添加代码计算植被覆盖面积
-            
+
 if __name__ == "__main__":
-    predict_wetland_plants("../data/samples/test_plant.jpg")
\ No newline at end of file
+    predict_wetland_plants("../data/samples/test_plant.jpg")
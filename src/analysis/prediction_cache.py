@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import numpy as np
+import cv2
+import torch
+from pathlib import Path
+from ultralytics.engine.results import Results
+
+# ================= 配置区域 =================
+current_file = Path(__file__).resolve()
+project_root = current_file.parents[2]
+
+# 预测缓存目录 (所有分析脚本共用)
+CACHE_DIR = project_root / "runs" / "prediction_cache"
+# 缓存总大小上限，超过后按最近最少使用 (LRU) 删除
+CACHE_MAX_GB = 5.0
+# 不影响预测结果的参数，不参与缓存键
+IGNORED_OPTIONS = ('device', 'verbose', 'stream', 'save', 'show')
+# ===========================================
+
+def hash_file(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def hash_bytes(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class PredictionCache:
+    """
+    内容寻址的预测结果缓存。
+    键 = (权重文件哈希, 图像内容哈希, 影响结果的推理参数)，与文件名和路径无关，
+    图片改名或移动后仍能命中；权重或参数一变就自动失效。
+    每条记录是一个 .npz: 框 (N, 6) + 按位压缩的 mask，命中时还原为 Ultralytics Results。
+
+    用法:
+        cache = PredictionCache(model, MODEL_PATH)
+        results = cache.predict(image_paths_or_frames, conf=0.5, retina_masks=False)
+        print(cache.report())
+    """
+
+    def __init__(self, model, weights_path, cache_dir=CACHE_DIR, max_bytes=int(CACHE_MAX_GB * 1024 ** 3)):
+        self.model = model
+        # 导出的模型 (ONNX/OpenVINO) 每次访问 names 都可能重新初始化推理器，这里只取一次
+        self.names = model.names
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.weights_hash = hash_file(weights_path)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = sum(p.stat().st_size for p in self.cache_dir.glob("*.npz"))
+
+    # ---------- 键 ----------
+    def _key(self, image_hash, options):
+        opts = {k: v for k, v in options.items() if k not in IGNORED_OPTIONS}
+        payload = json.dumps([self.weights_hash, image_hash, opts], sort_keys=True, default=str)
+        return hash_bytes(payload.encode('utf-8'))
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.npz"
+
+    @staticmethod
+    def _option_device(device):
+        """predict 的 device 参数 -> torch.device；未指定时与 Ultralytics 相同，有 GPU 时用第一块 GPU"""
+        if device is None or device == '':
+            return torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+        if isinstance(device, int) or str(device).isdigit():
+            return torch.device(f'cuda:{int(device)}')
+        return torch.device(str(device).split(',')[0])
+
+    @staticmethod
+    def _load_source(source):
+        """返回 (BGR 图像, 内容哈希, 路径)。路径直接对文件字节求哈希，不需要先解码"""
+        if isinstance(source, (str, Path)):
+            data = Path(source).read_bytes()
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            return image, hash_bytes(data), str(source)
+        image = np.ascontiguousarray(source)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str(image.shape).encode())
+        h.update(image.data)
+        return image, h.hexdigest(), ""
+
+    # ---------- 读写 ----------
+    def _read(self, path, image, source_path):
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                boxes = torch.from_numpy(npz['boxes'])
+                masks = None
+                if npz['mask_shape'].size:
+                    n, h, w = (int(v) for v in npz['mask_shape'])
+                    bits = np.unpackbits(npz['mask_bits'], count=n * h * w)
+                    masks = torch.from_numpy(bits.reshape(n, h, w).astype(np.float32))
+        except Exception:
+            return None
+        os.utime(path)  # 更新访问时间，用于 LRU
+        return Results(image, source_path, self.names, boxes=boxes, masks=masks)
+
+    def _write(self, path, result):
+        boxes = result.boxes.data.cpu().numpy().astype(np.float32) if result.boxes is not None \
+            else np.zeros((0, 6), np.float32)
+        if result.masks is not None:
+            mask_data = result.masks.data.cpu().numpy() > 0.5
+            mask_shape = np.array(mask_data.shape, dtype=np.int64)
+            mask_bits = np.packbits(mask_data.ravel())
+        else:
+            mask_shape = np.zeros(0, dtype=np.int64)
+            mask_bits = np.zeros(0, dtype=np.uint8)
+
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, boxes=boxes, mask_shape=mask_shape, mask_bits=mask_bits)
+        os.replace(tmp_path, path)
+        self.total_bytes += path.stat().st_size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """按最后访问时间从旧到新删除，直到总大小降到上限的 90%"""
+        entries = sorted(self.cache_dir.glob("*.npz"), key=lambda p: p.stat().st_mtime)
+        limit = int(self.max_bytes * 0.9)
+        for p in entries:
+            if self.total_bytes <= limit:
+                break
+            try:
+                size = p.stat().st_size
+                p.unlink()
+            except OSError:
+                continue
+            self.total_bytes -= size
+            self.evictions += 1
+
+    # ---------- 对外接口 ----------
+    def predict(self, sources, **options):
+        """
+        与 model.predict 相同的参数；sources 为图片路径或 BGR 数组的列表。未命中的图片合并成一批推理。
+        命中的结果从磁盘还原后搬到推理结果所在的设备，同一批中命中与未命中的结果在同一设备上。
+        """
+        if not isinstance(sources, (list, tuple)):
+            sources = [sources]
+
+        results = [None] * len(sources)
+        pending = []  # (下标, 图像, 缓存路径, 原始路径)
+        hit_ids = []
+        for i, source in enumerate(sources):
+            image, image_hash, source_path = self._load_source(source)
+            path = self._entry_path(self._key(image_hash, options))
+            cached = self._read(path, image, source_path) if path.exists() else None
+            if cached is not None:
+                self.hits += 1
+                results[i] = cached
+                hit_ids.append(i)
+            else:
+                self.misses += 1
+                pending.append((i, image, path, source_path))
+
+        device = self._option_device(options.get('device'))
+        if pending:
+            predicted = self.model.predict([image for _, image, _, _ in pending], **options)
+            for (i, _, path, source_path), result in zip(pending, predicted):
+                result.path = source_path
+                self._write(path, result)
+                results[i] = result
+            if predicted[0].boxes is not None:
+                device = predicted[0].boxes.data.device
+
+        # 缓存还原的张量在 CPU 上，与推理结果混在一批时按设备归约会出错
+        for i in hit_ids:
+            if results[i].boxes.data.device != device:
+                results[i] = results[i].to(device)
+        return results
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"预测缓存: 命中 {self.hits} / 未命中 {self.misses} (命中率 {rate:.1%}) | "
+                f"淘汰 {self.evictions} 条 | 占用 {self.total_bytes / 1024 ** 2:.1f} MB")
@@ -0,0 +1,321 @@
+import os
+import json
+import shutil
+import numpy as np
+import torch
+import pandas as pd
+from pathlib import Path
+from mask_accounting import mask_area_scale
+
+# ================= 配置区域 =================
+current_file = Path(__file__).resolve()
+project_root = current_file.parents[2]
+
+# 默认的预测结果库目录
+STORE_DIR = project_root / "runs" / "prediction_store"
+# 每个分片包含的帧数 (写满一个分片就落盘，推理过程中内存只保留一个分片)
+SHARD_FRAMES = 500
+STORE_VERSION = 1
+# ===========================================
+
+# ================= 说明 =================
+# 列式存储的预测结果库，每个分片是一个 npz:
+#   帧列 (长度 F):      frame_name, orig_h, orig_w, mask_h, mask_w, inst_start (长度 F+1，实例偏移)
+#   实例列 (长度 N):    cls, conf, box (N, 4, 原图 xyxy), area (原图像素), rle_start (长度 N+1，游程偏移)
+#   游程 (拼接):        rle (uint32)，按行优先展开 mask，从 0 的游程开始交替计数 (与 COCO RLE 相同的规则)
+# index.json 记录类别名和分片列表。统计时按列读取，mask 只在需要时逐帧解码。
+# 写入时先写到同级的 <目录>.partial，close() 时整体替换旧的结果库；
+# 运行中途出错或中断时旧结果库保持不变，不会出现 index.json 指向已删除分片的情况。
+# =======================================
+
+def encode_rle(masks):
+    """
+    把 (N, h, w) 的 mask (torch 张量或 numpy 数组) 编码为游程。
+    只把值发生变化的位置拷回 CPU，不传输整张 mask。
+    返回 (rle, rle_start)，第 i 个实例的游程为 rle[rle_start[i]:rle_start[i+1]]。
+    """
+    n = masks.shape[0]
+    length = masks.shape[1] * masks.shape[2]
+    if n == 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(1, dtype=np.int64)
+
+    flat = masks.reshape(n, -1) > 0.5
+    if isinstance(flat, torch.Tensor):
+        changes = torch.nonzero(flat[:, 1:] != flat[:, :-1]).cpu().numpy()
+        first = flat[:, 0].cpu().numpy()
+    else:
+        changes = np.argwhere(flat[:, 1:] != flat[:, :-1])
+        first = flat[:, 0]
+
+    rows, positions = changes[:, 0], changes[:, 1] + 1
+    splits = np.searchsorted(rows, np.arange(1, n))
+    runs = []
+    for i, pos in enumerate(np.split(positions, splits)):
+        bounds = np.concatenate(([0], pos, [length]))
+        r = np.diff(bounds)
+        if first[i]:
+            r = np.concatenate(([0], r))  # 游程总是从 0 开始
+        runs.append(r)
+
+    rle_start = np.zeros(n + 1, dtype=np.int64)
+    rle_start[1:] = np.cumsum([len(r) for r in runs])
+    return np.concatenate(runs).astype(np.uint32), rle_start
+
+def decode_rle(runs, shape):
+    """游程 -> 二值 mask (h, w)"""
+    values = (np.arange(len(runs)) % 2).astype(bool)
+    return np.repeat(values, runs.astype(np.int64)).reshape(shape)
+
+class PredictionStoreWriter:
+    """
+    推理过程中流式写入预测结果。
+
+    用法:
+        with PredictionStoreWriter(store_dir, model.names) as writer:
+            for name, result in ...:
+                writer.add(name, result)
+    正常退出时调用 close() 替换旧结果库；with 块中抛出异常时调用 abort()，旧结果库不受影响。
+    """
+
+    def __init__(self, store_dir=STORE_DIR, class_names=None, shard_frames=SHARD_FRAMES):
+        self.store_dir = Path(store_dir)
+        # 同一目录只保存一次运行的结果: 新结果先写到临时目录，close() 时再替换
+        self.work_dir = self.store_dir.with_name(self.store_dir.name + ".partial")
+        if self.work_dir.exists():
+            shutil.rmtree(self.work_dir)  # 上次中断留下的临时目录
+        self.work_dir.mkdir(parents=True)
+        self.class_names = {int(k): v for k, v in (class_names or {}).items()}
+        self.shard_frames = shard_frames
+        self.shards = []
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self.frames = {'frame_name': [], 'orig_h': [], 'orig_w': [], 'mask_h': [], 'mask_w': []}
+        self.inst_counts = []
+        self.cls, self.conf, self.box, self.area = [], [], [], []
+        self.rle, self.rle_counts = [], []
+
+    def add(self, frame_name, result):
+        orig_h, orig_w = result.orig_shape
+        masks = result.masks
+        n = 0 if result.boxes is None else len(result.boxes)
+        if masks is not None and n:
+            data = masks.data
+            mask_h, mask_w = data.shape[1:]
+            rle, rle_start = encode_rle(data)
+            area = data.reshape(n, -1).gt(0.5).sum(dim=1).cpu().numpy() * mask_area_scale((orig_h, orig_w), (mask_h, mask_w))
+        else:
+            # 没有 mask 的实例游程数为 0，保证 rle_start 与实例一一对应
+            mask_h, mask_w = 0, 0
+            rle, rle_start = np.zeros(0, dtype=np.uint32), np.zeros(n + 1, dtype=np.int64)
+            area = np.zeros(n)
+
+        self.frames['frame_name'].append(str(frame_name))
+        self.frames['orig_h'].append(orig_h)
+        self.frames['orig_w'].append(orig_w)
+        self.frames['mask_h'].append(mask_h)
+        self.frames['mask_w'].append(mask_w)
+        self.inst_counts.append(n)
+        if n:
+            self.cls.append(result.boxes.cls.cpu().numpy())
+            self.conf.append(result.boxes.conf.cpu().numpy())
+            self.box.append(result.boxes.xyxy.cpu().numpy())
+            self.area.append(area)
+            self.rle.append(rle)
+            self.rle_counts.append(np.diff(rle_start))
+
+        if len(self.inst_counts) >= self.shard_frames:
+            self.flush()
+
+    def flush(self):
+        if not self.inst_counts:
+            return
+        shard_name = f"shard_{len(self.shards):05d}.npz"
+        inst_start = np.zeros(len(self.inst_counts) + 1, dtype=np.int64)
+        inst_start[1:] = np.cumsum(self.inst_counts)
+        rle_counts = np.concatenate(self.rle_counts) if self.rle_counts else np.zeros(0, dtype=np.int64)
+        rle_start = np.zeros(len(rle_counts) + 1, dtype=np.int64)
+        rle_start[1:] = np.cumsum(rle_counts)
+
+        columns = {
+            'frame_name': np.array(self.frames['frame_name']),
+            'orig_h': np.array(self.frames['orig_h'], dtype=np.int32),
+            'orig_w': np.array(self.frames['orig_w'], dtype=np.int32),
+            'mask_h': np.array(self.frames['mask_h'], dtype=np.int32),
+            'mask_w': np.array(self.frames['mask_w'], dtype=np.int32),
+            'inst_start': inst_start,
+            'cls': np.concatenate(self.cls).astype(np.int16) if self.cls else np.zeros(0, np.int16),
+            'conf': np.concatenate(self.conf).astype(np.float32) if self.conf else np.zeros(0, np.float32),
+            'box': np.concatenate(self.box).astype(np.float32) if self.box else np.zeros((0, 4), np.float32),
+            'area': np.concatenate(self.area).astype(np.float64) if self.area else np.zeros(0),
+            'rle_start': rle_start,
+            'rle': np.concatenate(self.rle) if self.rle else np.zeros(0, np.uint32),
+        }
+        with open(self.work_dir / shard_name, 'wb') as f:
+            np.savez_compressed(f, **columns)
+
+        self.shards.append({
+            'file': shard_name, 'frames': len(self.inst_counts), 'instances': int(inst_start[-1]),
+            'first_frame': self.frames['frame_name'][0], 'last_frame': self.frames['frame_name'][-1],
+        })
+        self._write_index()
+        self._reset_buffer()
+
+    def _write_index(self):
+        index = {'version': STORE_VERSION, 'class_names': self.class_names, 'shards': self.shards}
+        with open(self.work_dir / "index.json", 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        """写完剩余的帧，用临时目录替换旧的结果库"""
+        if not self.work_dir.exists():
+            return
+        self.flush()
+        self._write_index()
+        old_dir = self.store_dir.with_name(self.store_dir.name + ".old")
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
+        if self.store_dir.exists():
+            os.replace(self.store_dir, old_dir)
+        os.replace(self.work_dir, self.store_dir)
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
+
+    def abort(self):
+        """放弃本次写入的结果，保留旧的结果库"""
+        if self.work_dir.exists():
+            shutil.rmtree(self.work_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class PredictionStore:
+    """
+    读取预测结果库。表格类统计只读取需要的列，mask 只在逐帧遍历时解码，
+    内存占用与帧数无关。
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / "index.json", 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') != STORE_VERSION:
+            raise ValueError(f"不支持的预测结果库版本: {index.get('version')}")
+        self.class_names = {int(k): v for k, v in index['class_names'].items()}
+        self.shards = index['shards']
+        self._frame_index = None
+
+    def __len__(self):
+        return sum(s['frames'] for s in self.shards)
+
+    def _open(self, shard):
+        return np.load(self.store_dir / shard['file'], allow_pickle=False)
+
+    def frame_index(self):
+        """{帧名: (分片序号, 行号)}，首次调用时只读取各分片的 frame_name 列"""
+        if self._frame_index is None:
+            self._frame_index = {}
+            for s, shard in enumerate(self.shards):
+                with self._open(shard) as npz:
+                    for row, name in enumerate(npz['frame_name']):
+                        self._frame_index[str(name)] = (s, row)
+        return self._frame_index
+
+    def instance_table(self):
+        """所有实例的表格 (不含 mask): frame, cls, class_name, conf, x1, y1, x2, y2, area"""
+        tables = []
+        for shard in self.shards:
+            with self._open(shard) as npz:
+                counts = np.diff(npz['inst_start'])
+                box = npz['box']
+                tables.append(pd.DataFrame({
+                    'frame': np.repeat(npz['frame_name'], counts),
+                    'cls': npz['cls'],
+                    'conf': npz['conf'],
+                    'x1': box[:, 0], 'y1': box[:, 1], 'x2': box[:, 2], 'y2': box[:, 3],
+                    'area': npz['area'],
+                }))
+        if not tables:
+            return pd.DataFrame(columns=['frame', 'cls', 'class_name', 'conf', 'x1', 'y1', 'x2', 'y2', 'area'])
+        df = pd.concat(tables, ignore_index=True)
+        df.insert(2, 'class_name', df['cls'].map(self.class_names))
+        return df
+
+    def class_pixel_totals(self):
+        """每个类别的 mask 像素总数 (原图分辨率，实例重叠部分重复计数)，只读 cls 和 area 两列"""
+        totals = np.zeros(len(self.class_names))
+        for shard in self.shards:
+            with self._open(shard) as npz:
+                totals += np.bincount(npz['cls'], weights=npz['area'], minlength=len(totals))[:len(totals)]
+        return {self.class_names[k]: v for k, v in enumerate(totals)}
+
+    def iter_frames(self, with_masks=True):
+        """
+        逐帧产出 dict: name, orig_shape, cls, conf, box, masks ((n, mask_h, mask_w) bool 或 None)。
+        一次只解码一帧的 mask。
+        """
+        for shard in self.shards:
+            with self._open(shard) as npz:
+                names, inst_start = npz['frame_name'], npz['inst_start']
+                orig_h, orig_w = npz['orig_h'], npz['orig_w']
+                mask_h, mask_w = npz['mask_h'], npz['mask_w']
+                cls, conf, box = npz['cls'], npz['conf'], npz['box']
+                rle_start = npz['rle_start']
+                rle = npz['rle'] if with_masks else None
+                for f in range(len(names)):
+                    a, b = inst_start[f], inst_start[f + 1]
+                    yield self._frame_dict(names[f], (orig_h[f], orig_w[f]), (mask_h[f], mask_w[f]),
+                                           cls[a:b], conf[a:b], box[a:b], rle_start[a:b + 1], rle)
+
+    def frame(self, name, with_masks=True):
+        """按帧名读取单帧"""
+        s, f = self.frame_index()[name]
+        with self._open(self.shards[s]) as npz:
+            inst_start = npz['inst_start']
+            a, b = inst_start[f], inst_start[f + 1]
+            return self._frame_dict(name, (npz['orig_h'][f], npz['orig_w'][f]), (npz['mask_h'][f], npz['mask_w'][f]),
+                                    npz['cls'][a:b], npz['conf'][a:b], npz['box'][a:b], npz['rle_start'][a:b + 1],
+                                    npz['rle'] if with_masks else None)
+
+    @staticmethod
+    def _frame_dict(name, orig_shape, mask_shape, cls, conf, box, rle_start, rle):
+        masks = None
+        if rle is not None and mask_shape[0] > 0 and len(cls):
+            masks = np.stack([decode_rle(rle[rle_start[i]:rle_start[i + 1]], mask_shape) for i in range(len(cls))])
+        return {'name': str(name), 'orig_shape': (int(orig_shape[0]), int(orig_shape[1])),
+                'mask_shape': (int(mask_shape[0]), int(mask_shape[1])),
+                'cls': cls, 'conf': conf, 'box': box, 'masks': masks}
+
+    def coverage_table(self):
+        """
+        每帧每个类别的覆盖度 (%)，同类实例求并集后计数 (与 coverage_statistic 的定义一致)。
+        列: filename, <类别>, <类别>_ratio
+        """
+        rows = []
+        for fr in self.iter_frames(with_masks=True):
+            orig_h, orig_w = fr['orig_shape']
+            img_area = orig_h * orig_w
+            row = {'filename': fr['name']}
+            for cls_id, name in self.class_names.items():
+                pixels = 0.0
+                if fr['masks'] is not None:
+                    union = fr['masks'][fr['cls'] == cls_id].any(axis=0)
+                    pixels = min(float(np.count_nonzero(union)) * mask_area_scale(fr['orig_shape'], fr['mask_shape']),
+                                 img_area)
+                row[name] = pixels
+                row[f"{name}_ratio"] = pixels / img_area * 100
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    store = PredictionStore()
+    print(f"预测结果库: {STORE_DIR}，{len(store)} 帧，{len(store.shards)} 个分片")
+    totals = store.class_pixel_totals()
+    for name, pixels in sorted(totals.items(), key=lambda kv: -kv[1]):
+        print(f"  {name}: {pixels:.0f} 像素")
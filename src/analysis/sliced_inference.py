@@ -0,0 +1,216 @@
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torchvision.ops import box_iou
+from ultralytics.engine.results import Results
+
+# ================= 说明 =================
+# 切片 (tiled / sliced) 推理:
+# 模型按 imgsz=1024 训练，而航拍帧是 3840x2160，整帧缩小后小块的香蒲/喜旱莲子草会消失。
+# 这里把每帧切成带重叠的 tile_size 小块，一帧或多帧的所有小块拼成一个 batch 推理，
+# 再把结果平移回整帧坐标，被切片边缘截断的同类实例在切片重叠区做跨切片合并 (框取并集、mask 取 OR)，
+# 同一切片内的实例不互相合并。
+#
+# 输出仍是 Ultralytics 的 Results 对象，可以直接交给 mask_accounting 等后续统计。
+# 为控制显存，拼接后的 mask 默认是原图的 1/mask_downscale 分辨率，
+# mask_accounting.mask_area_scale 会自动把像素数换算回原图。
+# =======================================
+
+def make_tiles(height, width, tile_size, overlap):
+    """返回覆盖整帧的切片坐标列表 [(x0, y0, x1, y1), ...]，最后一行/列贴齐图像边缘"""
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        pos = list(range(0, length - tile_size, step))
+        pos.append(length - tile_size)
+        return pos
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in starts(height)
+        for x0 in starts(width)
+    ]
+
+def _intersection_over_smaller(boxes):
+    """IoS 矩阵: 交集面积 / 两框中较小者的面积。被切片边缘截断的目标 IoU 很低，但 IoS 接近 1"""
+    area = (boxes[:, 2] - boxes[:, 0]).clamp(min=0) * (boxes[:, 3] - boxes[:, 1]).clamp(min=0)
+    lt = torch.max(boxes[:, None, :2], boxes[None, :, :2])
+    rb = torch.min(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = (rb - lt).clamp(min=0).prod(dim=2)
+    smaller = torch.min(area[:, None], area[None, :]).clamp(min=1e-6)
+    return inter / smaller
+
+class SlicedPredictor:
+    """
+    切片推理器。
+    用法:
+        slicer = SlicedPredictor(model, tile_size=1024, overlap=0.2)
+        results = slicer.predict([frame1, frame2])   # 返回每帧一个 Results
+        print(slicer.report())
+    """
+
+    def __init__(self, model, tile_size=1024, overlap=0.2, batch_size=16, conf=0.25, iou=0.7,
+                 merge_threshold=0.5, mask_downscale=2, device=None):
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.conf = conf
+        self.iou = iou
+        self.merge_threshold = merge_threshold
+        self.mask_downscale = max(1, int(mask_downscale))
+        self.device = device
+        # 吞吐量统计
+        self.frames = 0
+        self.tiles = 0
+        self.infer_seconds = 0.0
+        self.stitch_seconds = 0.0
+
+    def _predict_tiles(self, crops):
+        """批量推理所有切片；每个结果记下自己的切片编号 (crops 中的下标)，合并时只合并不同切片的碎片"""
+        outputs = []
+        for start in range(0, len(crops), self.batch_size):
+            batch = self.model.predict(
+                crops[start:start + self.batch_size], imgsz=self.tile_size, conf=self.conf, iou=self.iou,
+                retina_masks=True, verbose=False, device=self.device
+            )
+            for k, res in enumerate(batch):
+                res.tile_id = start + k
+            outputs.extend(batch)
+        return outputs
+
+    def predict(self, frames, paths=None):
+        """frames: BGR 图像列表 (可以是多帧)。所有帧的切片放在同一批次中推理"""
+        crops, owners, rects = [], [], []
+        for frame_idx, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            for (x0, y0, x1, y1) in make_tiles(h, w, self.tile_size, self.overlap):
+                crops.append(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+                owners.append((frame_idx, x0, y0))
+                rects.append((x0, y0, x1, y1))
+
+        t0 = time.perf_counter()
+        tile_results = self._predict_tiles(crops)
+        t1 = time.perf_counter()
+
+        per_frame = [[] for _ in frames]
+        for (frame_idx, x0, y0), res in zip(owners, tile_results):
+            per_frame[frame_idx].append((x0, y0, res))
+
+        names = self.model.names
+        tile_rects = torch.tensor(rects, dtype=torch.float32)
+        results = []
+        for frame_idx, frame in enumerate(frames):
+            path = paths[frame_idx] if paths else ""
+            results.append(self._stitch(frame, per_frame[frame_idx], names, path, tile_rects))
+        t2 = time.perf_counter()
+
+        self.frames += len(frames)
+        self.tiles += len(crops)
+        self.infer_seconds += t1 - t0
+        self.stitch_seconds += t2 - t1
+        return results
+
+    def _stitch(self, frame, tile_outputs, names, path, tile_rects):
+        """把各切片的结果平移到整帧坐标，并合并跨切片的重复实例"""
+        h, w = frame.shape[:2]
+        f = self.mask_downscale
+        mh, mw = (h + f - 1) // f, (w + f - 1) // f
+
+        boxes, masks, tile_ids = [], [], []
+        for x0, y0, res in tile_outputs:
+            if res.boxes is None or len(res.boxes) == 0:
+                continue
+            data = res.boxes.data.clone()  # (n, 6): x1 y1 x2 y2 conf cls
+            data[:, [0, 2]] += x0
+            data[:, [1, 3]] += y0
+            boxes.append(data)
+            tile_ids.append(torch.full((len(data),), res.tile_id, dtype=torch.long, device=data.device))
+
+            if res.masks is None:
+                continue
+            tile_masks = res.masks.data  # (n, th, tw)，retina 分辨率
+            th, tw = tile_masks.shape[1:]
+            ty, tx = y0 // f, x0 // f
+            sh, sw = min((th + f - 1) // f, mh - ty), min((tw + f - 1) // f, mw - tx)
+            if f > 1:
+                tile_masks = F.interpolate(tile_masks[None].float(), size=(sh, sw), mode='area')[0] >= 0.5
+            else:
+                tile_masks = tile_masks[:, :sh, :sw] > 0.5
+            full = torch.zeros(len(tile_masks), mh, mw, dtype=torch.bool, device=tile_masks.device)
+            full[:, ty:ty + sh, tx:tx + sw] = tile_masks
+            masks.append(full)
+
+        if not boxes:
+            return Results(frame, path, names, boxes=torch.zeros(0, 6))
+
+        boxes = torch.cat(boxes)
+        masks = torch.cat(masks) if masks else None
+        boxes, masks = self._merge(boxes, masks, torch.cat(tile_ids), tile_rects.to(boxes.device))
+        return Results(frame, path, names, boxes=boxes,
+                       masks=masks.float() if masks is not None else None)
+
+    def _merge(self, boxes, masks, tile_ids, tile_rects):
+        """
+        合并被切片边缘截断的同一实例。按置信度从高到低，每个保留的实例只吸收满足以下条件的碎片:
+          - 同类，且来自另一个切片 (同一切片内的重复框已由模型自身的 NMS 处理)；
+          - 两个切片有重叠区 (或共用切缝)，且两个框都碰到这块区域；
+          - 与该实例原始框的 IoS 超过 merge_threshold 或 IoU 超过 NMS 阈值。
+        每个其他切片最多吸收一个碎片 (与原始框 IoU 最大者，框内的小实例 IoS 也是 1，不能用 IoS 选)，
+        框只与原始框比较，不会因合并变大而继续连锁吸收。
+        框取外接并集，mask 取 OR，置信度保留较高者。
+        boxes: (n, 6)；tile_ids: (n,) 每个框所在切片在 tile_rects (k, 4) 中的下标。
+        """
+        order = boxes[:, 4].argsort(descending=True)
+        boxes = boxes[order]
+        tile_ids = tile_ids[order]
+        masks = masks[order] if masks is not None else None
+
+        n = len(boxes)
+        ios = _intersection_over_smaller(boxes[:, :4])
+        iou = box_iou(boxes[:, :4], boxes[:, :4])
+        rects = tile_rects[tile_ids]  # (n, 4) 每个框所在切片的范围
+        absorbed = torch.zeros(n, dtype=torch.bool, device=boxes.device)
+        keep_boxes, keep_masks = [], []
+        for i in range(n):
+            if absorbed[i]:
+                continue
+            # 本框所在切片与其他框所在切片的重叠区 (切缝处宽度为 0)
+            lt = torch.max(rects[i, :2], rects[:, :2])
+            rb = torch.min(rects[i, 2:], rects[:, 2:])
+            shared = (rb >= lt).all(dim=1)
+            touch_i = (boxes[i, :2] <= rb).all(dim=1) & (boxes[i, 2:4] >= lt).all(dim=1)
+            touch_j = (boxes[:, :2] <= rb).all(dim=1) & (boxes[:, 2:4] >= lt).all(dim=1)
+            candidates = ((boxes[:, 5] == boxes[i, 5]) & (tile_ids != tile_ids[i]) & ~absorbed
+                          & shared & touch_i & touch_j
+                          & ((ios[i] > self.merge_threshold) | (iou[i] > self.iou)))
+
+            group = torch.zeros(n, dtype=torch.bool, device=boxes.device)
+            group[i] = True
+            for t in tile_ids[candidates].unique():
+                in_tile = candidates & (tile_ids == t)
+                group[torch.where(in_tile, iou[i], torch.full_like(iou[i], -1)).argmax()] = True
+
+            members = boxes[group]
+            merged = boxes[i].clone()
+            merged[:2] = members[:, :2].min(dim=0).values
+            merged[2:4] = members[:, 2:4].max(dim=0).values
+            absorbed |= group
+            keep_boxes.append(merged)
+            if masks is not None:
+                keep_masks.append(masks[group].any(dim=0))
+
+        boxes = torch.stack(keep_boxes)
+        masks = torch.stack(keep_masks) if masks is not None else None
+        return boxes, masks
+
+    def report(self):
+        tiles_per_sec = self.tiles / self.infer_seconds if self.infer_seconds > 0 else 0.0
+        total = self.infer_seconds + self.stitch_seconds
+        frames_per_sec = self.frames / total if total > 0 else 0.0
+        return (f"切片推理: {self.frames} 帧 / {self.tiles} 个切片 | "
+                f"推理 {self.infer_seconds:.1f}s ({tiles_per_sec:.2f} 切片/秒) | "
+                f"拼接 {self.stitch_seconds:.1f}s | 整体 {frames_per_sec:.2f} 帧/秒")
@@ -0,0 +1,218 @@
+import os
+import re
+import numpy as np
+
+# ================= 配置区域 =================
+# 解析结果缓存文件的后缀 (与 .srt 放在同一目录)
+# 例如 DJI_0040.SRT -> DJI_0040.SRT.telemetry.npz
+CACHE_SUFFIX = ".telemetry.npz"
+
+# 缓存格式版本号，修改解析逻辑后 +1 即可让旧缓存全部失效
+CACHE_VERSION = 1
+# ===========================================
+
+# 正则只在模块加载时编译一次
+REGEX_TIMELINE = re.compile(r'(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})')
+
+# 匹配 New DJI 格式: 2024-10-14 12:00:00 ... GPS(113.12, 30.12, 10.5)
+REGEX_NEW_V2 = re.compile(
+    r'(\d{4}[\.-]\d{2}[\.-]\d{2} \d{2}:\d{2}:\d{2}).*?GPS\(([\d\.]+),\s*([\d\.]+),\s*([\d\.]+)\)',
+    re.DOTALL | re.IGNORECASE
+)
+# 匹配 New DJI 格式: GPS(113.12, 30.12, 10.5) ... 2024-10-14 12:00:00
+REGEX_NEW = re.compile(
+    r'GPS\(([\d\.]+),\s*([\d\.]+),\s*([\d\.]+)\).*?(\d{4}[\.-]\d{2}[\.-]\d{2} \d{2}:\d{2}:\d{2})',
+    re.DOTALL | re.IGNORECASE
+)
+# 匹配 Old DJI 格式: 2024-10-14 12:00:00 ... latitude: .. longitude: .. altitude: ..
+REGEX_OLD = re.compile(
+    r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}).*?latitude:\s*([\d\.]+).*?longitude:\s*([\d\.]+).*?altitude:\s*([\d\.]+)',
+    re.DOTALL | re.IGNORECASE
+)
+
+def _from_new_v2(m):
+    return m.group(1), float(m.group(2)), float(m.group(3)), float(m.group(4))
+
+def _from_new(m):
+    return m.group(4), float(m.group(1)), float(m.group(2)), float(m.group(3))
+
+def _from_old(m):
+    return m.group(1), float(m.group(3)), float(m.group(2)), float(m.group(4))
+
+# (名称, 正则, 取值函数 -> (date_str, lon, lat, alt))，顺序即探测优先级
+SRT_FORMATS = [
+    ("new_v2", REGEX_NEW_V2, _from_new_v2),
+    ("new", REGEX_NEW, _from_new),
+    ("old", REGEX_OLD, _from_old),
+]
+
+COLUMNS = ('start', 'end', 'lat', 'lon', 'alt', 'time')
+
+def normalize_exif_date(date_str):
+    """
+    [关键修复] 将各种格式的日期转换为 EXIF 标准格式: YYYY:MM:DD HH:MM:SS
+    WebODM 严格要求使用冒号分隔
+    """
+    if not date_str:
+        return "2024:01:01 00:00:00" # 默认值防止报错
+
+    # 替换 - 和 . 为 :
+    normalized = date_str.replace('-', ':').replace('.', ':')
+
+    # 确保格式正确 (简单校验)
+    # 如果原字符串带有毫秒 (2024:10:14 12:00:00,000)，去掉逗号后面
+    if ',' in normalized:
+        normalized = normalized.split(',')[0]
+
+    return normalized
+
+def parse_srt_time(time_str):
+    """将SRT时间字符串转换为秒"""
+    try:
+        h, m, s = time_str.replace(',', '.').split(':')
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except:
+        return 0.0
+
+def iter_srt_blocks(lines_iter):
+    """逐行读取，按空行切分字幕块，不把整个文件读入内存"""
+    block = []
+    for line in lines_iter:
+        line = line.strip()
+        if line:
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+    if block:
+        yield block
+
+def _iter_records_from_file(lines_iter):
+    fmt = None  # 第一次匹配成功后锁定的格式
+    for lines in iter_srt_blocks(lines_iter):
+        if len(lines) < 3: continue
+
+        # 提取时间轴
+        time_match = REGEX_TIMELINE.search(lines[1])
+        if not time_match: continue
+
+        text_content = " ".join(lines[2:])
+        parsed = None
+
+        if fmt is not None:
+            m = fmt[1].search(text_content)
+            if m:
+                parsed = fmt[2](m)
+
+        if parsed is None:
+            # 首次探测 (或已锁定格式在个别块上失配时) 才依次尝试全部格式
+            for candidate in SRT_FORMATS:
+                if candidate is fmt: continue
+                m = candidate[1].search(text_content)
+                if m:
+                    fmt, parsed = candidate, candidate[2](m)
+                    break
+
+        if parsed is None: continue
+
+        date_str, lon, lat, alt = parsed
+        yield {
+            'start': parse_srt_time(time_match.group(1)),
+            'end': parse_srt_time(time_match.group(2)),
+            'lat': lat,
+            'lon': lon,
+            'alt': alt,
+            'time': normalize_exif_date(date_str) # 已经是 YYYY:MM:DD HH:MM:SS
+        }
+
+def _iter_decoded_lines(f):
+    """按行解码: 优先 UTF-8，个别行解码失败时按 GBK 解码 (DJI 旧固件的中文字幕)"""
+    for raw in f:
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            yield raw.decode('gbk', errors='ignore')
+
+def iter_srt_records(srt_path):
+    """流式解析SRT，逐条产出GPS记录 (dict)"""
+    with open(srt_path, 'rb') as f:
+        yield from _iter_records_from_file(_iter_decoded_lines(f))
+
+def _records_to_columns(records):
+    cols = {name: [] for name in COLUMNS}
+    for r in records:
+        for name in COLUMNS:
+            cols[name].append(r[name])
+    return {
+        'start': np.asarray(cols['start'], dtype=np.float64),
+        'end': np.asarray(cols['end'], dtype=np.float64),
+        'lat': np.asarray(cols['lat'], dtype=np.float64),
+        'lon': np.asarray(cols['lon'], dtype=np.float64),
+        'alt': np.asarray(cols['alt'], dtype=np.float64),
+        'time': np.asarray(cols['time'], dtype='<U19'),
+    }
+
+def cache_path_for(srt_path):
+    return str(srt_path) + CACHE_SUFFIX
+
+def _source_key(srt_path):
+    st = os.stat(srt_path)
+    return np.array([CACHE_VERSION, st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+def _load_cache(srt_path):
+    path = cache_path_for(srt_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            if not np.array_equal(npz['source_key'], _source_key(srt_path)):
+                return None
+            return {name: npz[name] for name in COLUMNS}
+    except Exception:
+        return None
+
+def _save_cache(srt_path, columns):
+    path = cache_path_for(srt_path)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, source_key=_source_key(srt_path), **columns)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"  [警告] 无法写入SRT缓存 {os.path.basename(path)}: {e}")
+
+def load_srt_telemetry(srt_path, use_cache=True):
+    """
+    返回列式遥测数据: {'start','end','lat','lon','alt','time'} -> numpy 数组。
+    缓存以 .srt 的文件大小和修改时间为键，SRT 变化后自动重新解析。
+    """
+    if use_cache:
+        columns = _load_cache(srt_path)
+        if columns is not None:
+            return columns
+
+    columns = _records_to_columns(iter_srt_records(srt_path))
+    if use_cache:
+        _save_cache(srt_path, columns)
+    return columns
+
+def parse_srt_smart(srt_path, use_cache=True):
+    """解析SRT文件，提取GPS和时间信息 (返回 dict 列表，兼容旧接口)"""
+    print(f"正在解析字幕: {os.path.basename(srt_path)}")
+    try:
+        columns = load_srt_telemetry(srt_path, use_cache)
+    except OSError:
+        print("  -> SRT读取失败")
+        return []
+
+    parsed_data = [
+        {
+            'start': float(s), 'end': float(e),
+            'lat': float(la), 'lon': float(lo), 'alt': float(al),
+            'time': str(t)
+        }
+        for s, e, la, lo, al, t in zip(columns['start'], columns['end'], columns['lat'],
+                                       columns['lon'], columns['alt'], columns['time'])
+    ]
+    print(f"  -> 解析成功: {len(parsed_data)} 条GPS记录")
+    return parsed_data
@@ -3,9 +3,18 @@ import glob
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
-from ultralytics import YOLO
 from collections import defaultdict
 import torch
+import time
+import queue
+import threading
+import argparse
+from mask_accounting import batch_class_pixel_totals
+from sliced_inference import SlicedPredictor
+from footprint_index import select_unique_video_frames, parse_frame_name
+from prediction_cache import PredictionCache
+from prediction_store import PredictionStoreWriter, PredictionStore
+from inference_backend import BACKENDS, load_model, weights_file, backend_device
 
 # ================= 配置区域 =================
 # 使用 r"" (raw string) 防止Windows路径中的反斜杠被转义
@@ -17,14 +26,173 @@ OUTPUT_FOLDER = r"E:\\Wetland_Exploration_n_Analysis\\runs\\analysis_results"
 FRAME_INTERVAL = 30
 # 置信度阈值
 CONF_THRESHOLD = 0.5
+# 每次送入模型的帧数 (显存不足时调小)
+BATCH_SIZE = 8
+# 队列深度 (批): 解码队列最多排 QUEUE_DEPTH 批帧，结果队列最多排 QUEUE_DEPTH 批推理结果。
+# 结果中的 mask 留在 GPU 上 (retina 模式为原图分辨率)，每批可达数百 MB 显存，不宜设大
+QUEUE_DEPTH = 3
+# 像素统计分辨率: "retina" (原图分辨率 mask，最精确) 或 "input" (网络输入分辨率 mask × 面积系数，显存占用小得多)
+COUNT_RESOLUTION = "retina"
+# 切片推理: 把 3840x2160 的帧切成带重叠的小块按模型训练分辨率推理，小目标不会因整帧缩小而丢失
+SLICED_INFERENCE = False
+TILE_SIZE = 1024
+TILE_OVERLAP = 0.2
+# 足迹去重: 按 images.geojson 选出覆盖不同地面的最少帧，只对这些帧推理
+# (images.geojson 中的帧号按视频逐帧编号；所有帧都被去重掉的视频整段跳过，不在其中的视频仍按 FRAME_INTERVAL 抽帧)
+DEDUP_FOOTPRINTS = False
+# 预测缓存: 按帧内容缓存结果，重复统计同一批视频时跳过推理 (切片推理不走缓存)
+# retina 模式下每条缓存记录包含原图分辨率的 mask，磁盘占用较大
+USE_PREDICTION_CACHE = False
+# 把每帧的实例 (类别/置信度/框/RLE mask) 流式写入 OUTPUT_FOLDER/predictions，便于之后离线分析
+# (之后可用 --from-store 直接出图，不重新推理)
+WRITE_PREDICTION_STORE = False
+# 推理后端: "torch" 或导出的 "onnx" / "onnx-int8" / "openvino" / "openvino-int8" (见 inference_backend.py)
+# 命令行 --backend 可覆盖
+BACKEND = "torch"
 # ===========================================
 
-def batch_analyze_videos():
+class StageStats:
+    """记录单个流水线阶段的处理数量和耗时 (不含等待队列的时间)"""
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+    def add(self, n, seconds):
+        self.items += n
+        self.busy += seconds
+
+    def report(self):
+        rate = self.items / self.busy if self.busy > 0 else 0.0
+        return f"  {self.name:>6}: {self.items} 帧, 忙碌 {self.busy:.1f}s, {rate:.2f} 帧/秒"
+
+class PipelineControl:
+    """
+    流水线各线程共享的停止标志和错误记录。
+    任一线程出错时调用 fail()，其余线程的 put/get 不再阻塞在有界队列上，
+    主线程 join 之后用 raise_if_failed() 重新抛出第一个错误。
+    """
+    def __init__(self):
+        self.stop = threading.Event()
+        self.errors = []
+
+    def fail(self, exc):
+        self.errors.append(exc)
+        self.stop.set()
+
+    def put(self, q, item):
+        """队列满时等待；流水线已停止时放弃并返回 False"""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, q):
+        """取出一项；流水线已停止时返回 None (与结束标记相同)"""
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                pass
+        return None
+
+    def raise_if_failed(self):
+        if self.errors:
+            raise self.errors[0]
+
+def frame_producer(video_files, frame_queue, stats, selected_frames=None, control=None):
+    """
+    解码线程: 逐个视频抽帧，把 (帧名, 帧) 放入有界队列，结束时放入 None。
+    帧名为 "视频名_f帧号" (帧号从 0 开始)。
+    selected_frames 为 {视频名: {帧号}} 时，只保留足迹去重后选中的帧。
+    """
+    control = control or PipelineControl()
+    try:
+        for idx, video_path in enumerate(video_files):
+            if control.stop.is_set():
+                break
+            video_name = os.path.basename(video_path)
+            print(f"\n[{idx+1}/{len(video_files)}] 正在解码视频: {video_name}")
+
+            wanted = selected_frames.get(os.path.splitext(video_name)[0]) if selected_frames else None
+            if wanted is not None and not wanted:
+                print(f"  -> 足迹去重后没有需要推理的帧，跳过。")
+                continue
+            last_wanted = max(wanted) if wanted else None
+
+            cap = cv2.VideoCapture(video_path)
+            if not cap.isOpened():
+                print(f"  -> 无法打开视频，跳过。")
+                continue
+
+            frame_count = 0
+            t0 = time.perf_counter()
+            while True:
+                # 选中的帧都已取出，不再解码剩余部分
+                if last_wanted is not None and frame_count > last_wanted:
+                    break
+                # 不需要的帧只 grab，不做颜色转换
+                if not cap.grab():
+                    break
+                frame_count += 1
+                # 抽帧处理
+                if wanted is not None:
+                    # 去重帧号从 0 开始编号
+                    if frame_count - 1 not in wanted:
+                        continue
+                elif frame_count % FRAME_INTERVAL != 0:
+                    continue
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                stats.add(1, time.perf_counter() - t0)
+                frame_name = f"{os.path.splitext(video_name)[0]}_f{frame_count - 1}"
+                # 队列满时阻塞，限制内存占用；其他线程出错时停止解码
+                if not control.put(frame_queue, (frame_name, frame)):
+                    break
+                t0 = time.perf_counter()
+
+            cap.release()
+            print(f"  -> {video_name} 解码完成。")
+    except Exception as e:
+        control.fail(e)
+    finally:
+        control.put(frame_queue, None)
+
+def result_consumer(result_queue, class_names, global_pixel_counts, stats, writer=None, control=None):
+    """后处理线程: 统计每批结果中各类别的像素数，writer 不为空时同时写入预测结果库"""
+    control = control or PipelineControl()
+    try:
+        while True:
+            item = control.get(result_queue)
+            if item is None:
+                break
+            names, results = item
+            t0 = time.perf_counter()
+            if writer:
+                for name, result in zip(names, results):
+                    writer.add(name, result)
+            # 在设备上按类别归约，只把长度为类别数的向量拷回 CPU
+            totals = batch_class_pixel_totals(results, len(class_names))
+            if totals is not None:
+                for class_id, pixel_sum in enumerate(totals):
+                    if pixel_sum > 0:
+                        global_pixel_counts[class_names[class_id]] += pixel_sum
+            stats.add(len(results), time.perf_counter() - t0)
+            if stats.items % 50 < len(results):
+                print(f"  -> 已统计 {stats.items} 帧...", end='\r')
+    except Exception as e:
+        control.fail(e)
+
+def batch_analyze_videos(backend=BACKEND):
     # 0. 准备工作：检查设备和输出目录
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = backend_device(backend, 'cuda' if torch.cuda.is_available() else 'cpu')
     print(f"当前运行设备: {device.upper()}")
-    if device == 'cpu':
-        print("警告: 使用CPU处理多个视频速度会较慢。")
+    if device == 'cpu' and backend == "torch":
+        print("警告: 使用CPU处理多个视频速度会较慢。可导出 OpenVINO int8 模型后用 --backend openvino-int8 运行。")
 
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER)
@@ -32,7 +200,7 @@ def batch_analyze_videos():
     # 1. 加载模型
     print(f"正在加载模型: {MODEL_PATH} ...")
     try:
-        model = YOLO(MODEL_PATH)
+        model = load_model(MODEL_PATH, backend)
     except Exception as e:
         print(f"模型加载失败! 请检查路径。错误信息: {e}")
         return
@@ -49,57 +217,104 @@ def batch_analyze_videos():
     global_pixel_counts = defaultdict(int)
     class_names = model.names
 
-    # 2. 循环处理每个视频
-    for idx, video_path in enumerate(video_files):
-        video_name = os.path.basename(video_path)
-        print(f"\n[{idx+1}/{len(video_files)}] 正在处理视频: {video_name}")
-        
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            print(f"  -> 无法打开视频，跳过。")
-            continue
-
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_count = 0
-        processed_frames = 0
-        
+    # 2. 流水线处理: 解码线程 -> 批量推理 (主线程) -> 后处理线程
+    stats = {name: StageStats(name) for name in ('decode', 'infer', 'post')}
+    frame_queue = queue.Queue(maxsize=QUEUE_DEPTH * BATCH_SIZE)
+    result_queue = queue.Queue(maxsize=QUEUE_DEPTH)
+    control = PipelineControl()
+
+    selected_frames = select_unique_video_frames() if DEDUP_FOOTPRINTS else None
+    writer = PredictionStoreWriter(os.path.join(OUTPUT_FOLDER, "predictions"), class_names) if WRITE_PREDICTION_STORE else None
+    producer = threading.Thread(
+        target=frame_producer, args=(video_files, frame_queue, stats['decode'], selected_frames, control), daemon=True
+    )
+    post_worker = threading.Thread(
+        target=result_consumer, args=(result_queue, class_names, global_pixel_counts, stats['post'], writer, control),
+        daemon=True
+    )
+    wall_start = time.perf_counter()
+    producer.start()
+    post_worker.start()
+
+    slicer = None
+    if SLICED_INFERENCE:
+        slicer = SlicedPredictor(model, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=BATCH_SIZE,
+                                 conf=CONF_THRESHOLD, device=device)
+    cache = PredictionCache(model, weights_file(MODEL_PATH, backend)) if USE_PREDICTION_CACHE and not slicer else None
+
+    batch = []
+    try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            item = control.get(frame_queue)
+            if item is not None:
+                batch.append(item)
+            # 攒够一批，或解码结束时把剩余的帧一起推理
+            if batch and (len(batch) >= BATCH_SIZE or item is None):
+                t0 = time.perf_counter()
+                frames = [frame for _, frame in batch]
+                if slicer:
+                    # 整批帧的所有切片一起推理，结果拼回整帧坐标
+                    results = slicer.predict(frames)
+                elif cache:
+                    results = cache.predict(
+                        frames, conf=CONF_THRESHOLD, verbose=False, device=device,
+                        retina_masks=(COUNT_RESOLUTION == "retina")
+                    )
+                else:
+                    # retina: mask 上采样到原图分辨率; input: 在网络输入分辨率统计后按比例换算，不生成 4K mask
+                    results = model.predict(
+                        frames, conf=CONF_THRESHOLD, verbose=False, device=device,
+                        retina_masks=(COUNT_RESOLUTION == "retina")
+                    )
+                stats['infer'].add(len(batch), time.perf_counter() - t0)
+                control.put(result_queue, ([name for name, _ in batch], results))
+                batch = []
+            if item is None:
                 break
-            
-            frame_count += 1
-            # 抽帧处理
-            if frame_count % FRAME_INTERVAL != 0:
-                continue
-            
-            # 推理 (使用 stream=True 可以减少内存占用，但这里单帧推影响不大)
-            # retina_masks=True 保证mask质量
-            results = model.predict(frame, conf=CONF_THRESHOLD, verbose=False, device=device, retina_masks=True)
-            result = results[0]
-
-            if result.masks is not None:
-                # 提取数据
-                masks = result.masks.data.cpu().numpy() # (N, H, W)
-                classes = result.boxes.cls.cpu().numpy()
-                
-                # 统计当前帧各类别像素
-                for i, class_id in enumerate(classes):
-                    class_name = class_names[int(class_id)]
-                    # 统计Mask中像素值为1的数量
-                    pixel_sum = np.sum(masks[i])
-                    global_pixel_counts[class_name] += pixel_sum
-            
-            processed_frames += 1
-            if processed_frames % 10 == 0:
-                print(f"  -> 进度: {frame_count}/{total_frames} 帧...", end='\r')
-
-        cap.release()
-        print(f"  -> {video_name} 处理完成。")
+    except Exception as e:
+        control.fail(e)
+
+    control.put(result_queue, None)
+    producer.join()
+    post_worker.join()
+    # 任一阶段出错: 解码/后处理线程已经退出，这里重新抛出 (不生成不完整的统计结果，也不替换旧的预测结果库)
+    if control.errors and writer:
+        writer.abort()
+    control.raise_if_failed()
+    wall = time.perf_counter() - wall_start
+    if writer:
+        writer.close()
+        print(f"预测结果库已保存: {writer.store_dir}")
+
+    print("\n====== 流水线吞吐量 ======")
+    for st in stats.values():
+        print(st.report())
+    if slicer:
+        print(slicer.report())
+    if cache:
+        print(cache.report())
+    total = stats['post'].items
+    print(f"整体: {total} 帧 / {wall:.1f}s = {total / wall if wall > 0 else 0:.2f} 帧/秒 (批大小 {BATCH_SIZE}, 队列深度 {QUEUE_DEPTH})")
 
     # 3. 数据可视化 (生成总饼状图)
     print("\n所有视频处理完毕，正在生成统计图表...")
     
+    title = f"Wetland Vegetation Distribution Analysis\n(Total {len(video_files)} Videos Aggregated)"
+    save_distribution_chart(global_pixel_counts, title, os.path.join(OUTPUT_FOLDER, 'total_vegetation_distribution.png'))
+
+def analyze_from_store(store_dir=os.path.join(OUTPUT_FOLDER, "predictions")):
+    """不重新推理，直接用预测结果库中各类别的像素总数生成同样的甜甜圈图 (只读 cls 和 area 两列)"""
+    store = PredictionStore(store_dir)
+    print(f"从预测结果库读取 {len(store)} 帧: {store_dir}")
+    global_pixel_counts = {name: pixels for name, pixels in store.class_pixel_totals().items() if pixels > 0}
+
+    # 帧名为 "视频名_f帧号"，按视频名计数
+    videos = {(parse_frame_name(name) or (name,))[0] for name in store.frame_index()}
+    title = f"Wetland Vegetation Distribution Analysis\n(Total {len(videos)} Videos Aggregated)"
+    save_distribution_chart(global_pixel_counts, title, os.path.join(OUTPUT_FOLDER, 'total_vegetation_distribution.png'))
+
+def save_distribution_chart(global_pixel_counts, title, save_path, show=True):
+    """按类别像素总数绘制甜甜圈图并打印文本报告"""
     if not global_pixel_counts:
         print("未检测到任何植被目标，无法生成图表。请检查置信度阈值或模型效果。")
         return
@@ -132,11 +347,10 @@ def batch_analyze_videos():
     fig.gca().add_artist(centre_circle)
 
     plt.axis('equal')  
-    plt.title(f"Wetland Vegetation Distribution Analysis\n(Total {len(video_files)} Videos Aggregated)", fontsize=16)
+    plt.title(title, fontsize=16)
     plt.legend(wedges, labels, title="Vegetation Types", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
 
     # 保存图片
-    save_path = os.path.join(OUTPUT_FOLDER, 'total_vegetation_distribution.png')
     plt.tight_layout()
     plt.savefig(save_path, dpi=300)
     print(f"统计结果已保存至: {save_path}")
@@ -148,7 +362,17 @@ def batch_analyze_videos():
         percentage = (size / total_pixels) * 100
         print(f"{label}: {percentage:.2f}%")
     print("==========================")
-    plt.show()
+    if show:
+        plt.show()
+    plt.close()
 
 if __name__ == '__main__':
-    batch_analyze_videos()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="批量统计视频中各类别的像素占比")
+    parser.add_argument('--backend', default=BACKEND, choices=BACKENDS)
+    parser.add_argument('--from-store', action='store_true',
+                        help="从 OUTPUT_FOLDER/predictions 的预测结果库出图，不重新推理 (需先以 WRITE_PREDICTION_STORE=True 运行一次)")
+    args = parser.parse_args()
+    if args.from_store:
+        analyze_from_store()
+    else:
+        batch_analyze_videos(args.backend)
\ No newline at end of file
@@ -0,0 +1,394 @@
+import os
+import glob
+import json
+import time
+import queue
+import argparse
+import threading
+import cv2
+import numpy as np
+import pandas as pd
+import torch
+from pathlib import Path
+from collections import defaultdict
+
+from mask_accounting import batch_class_union_coverage, batch_class_pixel_totals
+from prediction_cache import PredictionCache
+from inference_backend import BACKENDS, load_model, weights_file, backend_device
+from prediction_store import PredictionStoreWriter
+from statistic import StageStats, PipelineControl, frame_producer, save_distribution_chart
+from coverage_statistic import frame_coverage_stats, save_coverage_report, COVERAGE_MAX_SIDE
+from structure_visualization import draw_structure_map
+from footprint_index import load_footprint_index, parse_frame_name, IMAGES_GEOJSON
+
+# ================= 配置区域 =================
+current_file = Path(__file__).resolve()
+project_root = current_file.parents[2]
+
+MODEL_PATH = project_root / "models" / "best.pt"
+SOURCE = project_root / "data" / "wetland_dataset" / "images" / "val"
+OUTPUT_DIR = project_root / "results" / "survey"
+
+BATCH_SIZE = 8
+CONF_THRESHOLD = 0.25
+# 解码队列和每个分析器的输入队列深度 (批)
+QUEUE_DEPTH = 4
+# 地理汇总的网格大小 (m)
+GEO_CELL_SIZE = 10.0
+# 视频帧与 images.geojson 中同一视频最近的帧号相差不超过该值时使用其位置
+# (images.geojson 按 29.97fps 每秒一帧，与按固定间隔抽的帧号不完全一致)
+GEO_MAX_FRAME_GAP = 15
+# ===========================================
+
+# ================= 说明 =================
+# 一次解码、一次推理，把每批 Results 分发给多个分析器:
+#   解码线程 -> 批量推理 (主线程) -> 每个分析器一个线程 + 有界队列，并行消费同一批结果
+# 分析器只读取 Results，不修改；需要覆盖度的分析器共享同一次计算 (FrameBatch.coverage)。
+# 新增分析器: 继承 Analyzer，实现 consume / finish，并登记到 ANALYZERS。
+# =======================================
+
+class FrameBatch:
+    """一批推理结果，以及在分析器之间共享、按需计算一次的中间量"""
+
+    def __init__(self, names, results, num_classes):
+        self.names = names
+        self.results = results
+        self.num_classes = num_classes
+        self._coverage = None
+        self._lock = threading.Lock()
+
+    def coverage(self):
+        """(B, C) 覆盖比例 (同类实例求并集)，第一个请求的分析器计算，其余直接复用"""
+        with self._lock:
+            if self._coverage is None:
+                self._coverage = batch_class_union_coverage(self.results, self.num_classes, COVERAGE_MAX_SIDE)
+            return self._coverage
+
+class Analyzer:
+    name = "base"
+
+    def __init__(self, class_names, output_dir):
+        self.class_names = class_names
+        self.output_dir = output_dir
+        self.stats = StageStats(self.name)
+
+    def consume(self, batch):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+    def abort(self):
+        """流水线出错时代替 finish 调用，丢弃未完成的输出"""
+        pass
+
+class CoverageAnalyzer(Analyzer):
+    """逐帧覆盖度 CSV + 饼图 + 箱线图 (同 coverage_statistic.py)"""
+    name = "coverage"
+
+    def __init__(self, class_names, output_dir):
+        super().__init__(class_names, output_dir)
+        self.rows = []
+
+    def consume(self, batch):
+        for name, result, cover in zip(batch.names, batch.results, batch.coverage()):
+            self.rows.append(frame_coverage_stats(name, result.orig_shape, cover, self.class_names))
+
+    def finish(self):
+        save_coverage_report(pd.DataFrame(self.rows), self.output_dir)
+
+class OverlayAnalyzer(Analyzer):
+    """植被结构图 (同 structure_visualization.py)"""
+    name = "overlay"
+
+    def __init__(self, class_names, output_dir):
+        super().__init__(class_names, output_dir)
+        self.map_dir = os.path.join(output_dir, "structure_maps")
+        os.makedirs(self.map_dir, exist_ok=True)
+
+    def consume(self, batch):
+        for name, result in zip(batch.names, batch.results):
+            img = result.orig_img.copy()
+            boxes = result.boxes
+            cls_ids = boxes.cls.cpu().numpy() if boxes else []
+            xyxy = boxes.xyxy.cpu().numpy() if boxes else []
+            draw_structure_map(img, cls_ids, xyxy, self.class_names)
+            save_name = "structure_" + os.path.splitext(name)[0] + ".jpg"
+            cv2.imwrite(os.path.join(self.map_dir, save_name), img)
+
+class PixelTotalsAnalyzer(Analyzer):
+    """各类别像素总数甜甜圈图 (同 statistic.py)"""
+    name = "pixels"
+
+    def __init__(self, class_names, output_dir):
+        super().__init__(class_names, output_dir)
+        self.counts = defaultdict(float)
+        self.frames = 0
+
+    def consume(self, batch):
+        self.frames += len(batch.results)
+        totals = batch_class_pixel_totals(batch.results, len(self.class_names))
+        if totals is not None:
+            for class_id, pixel_sum in enumerate(totals):
+                if pixel_sum > 0:
+                    self.counts[self.class_names[class_id]] += pixel_sum
+
+    def finish(self):
+        title = f"Wetland Vegetation Distribution Analysis\n(Total {self.frames} Frames Aggregated)"
+        save_distribution_chart(self.counts, title, os.path.join(self.output_dir, 'total_vegetation_distribution.png'),
+                                show=False)
+
+class GeoAnalyzer(Analyzer):
+    """
+    按拍摄位置 (images.geojson) 把逐帧覆盖度汇总到 GEO_CELL_SIZE 的地面网格，
+    输出每个网格的平均覆盖度 (CSV + GeoJSON)。不在 images.geojson 中的帧跳过。
+    帧按 (视频名, 帧号) 对应，图片 (视频_t时间_帧号.jpg) 和直接从视频抽的帧 (视频_f帧号) 都能找到位置，
+    帧号不完全相同时取同一视频中最近的帧 (相差不超过 GEO_MAX_FRAME_GAP)。
+    """
+    name = "geo"
+
+    def __init__(self, class_names, output_dir, geojson_path=IMAGES_GEOJSON):
+        super().__init__(class_names, output_dir)
+        self.index = load_footprint_index(geojson_path)
+        self.position = {}
+        frames = defaultdict(list)  # 视频名 -> [(帧号, 下标)]
+        for i, name in enumerate(self.index.names):
+            parsed = parse_frame_name(name)
+            if parsed:
+                frames[parsed[0]].append((parsed[1], i))
+            else:
+                self.position[os.path.basename(name)] = i
+        self.video_frames = {}
+        for video, items in frames.items():
+            items.sort()
+            self.video_frames[video] = (np.array([f for f, _ in items]), np.array([i for _, i in items]))
+        self.cells = defaultdict(lambda: np.zeros(len(class_names) + 1))  # 最后一列为帧数
+        self.skipped = 0
+
+    def locate(self, name):
+        """帧名 -> 索引中的下标，找不到时返回 None"""
+        parsed = parse_frame_name(name)
+        if parsed is None:
+            return self.position.get(os.path.basename(name))
+        if parsed[0] not in self.video_frames:
+            return None
+        frame_ids, ids = self.video_frames[parsed[0]]
+        k = int(np.searchsorted(frame_ids, parsed[1]))
+        best = min((j for j in (k - 1, k) if 0 <= j < len(frame_ids)), key=lambda j: abs(frame_ids[j] - parsed[1]))
+        return int(ids[best]) if abs(frame_ids[best] - parsed[1]) <= GEO_MAX_FRAME_GAP else None
+
+    def consume(self, batch):
+        for name, cover in zip(batch.names, batch.coverage()):
+            i = self.locate(name)
+            if i is None:
+                self.skipped += 1
+                continue
+            key = (int(np.floor(self.index.x[i] / GEO_CELL_SIZE)), int(np.floor(self.index.y[i] / GEO_CELL_SIZE)))
+            acc = self.cells[key]
+            acc[:-1] += cover
+            acc[-1] += 1
+
+    def cell_lonlat(self, cx, cy):
+        """局部平面坐标 -> 经纬度 (FootprintIndex.project 的逆变换)"""
+        R = 6378137.0
+        lon = self.index.lon0 + np.degrees(cx / (R * np.cos(np.radians(self.index.lat0))))
+        lat = self.index.lat0 + np.degrees(cy / R)
+        return lon, lat
+
+    def finish(self):
+        rows, features = [], []
+        for (gx, gy), acc in sorted(self.cells.items()):
+            lon, lat = self.cell_lonlat((gx + 0.5) * GEO_CELL_SIZE, (gy + 0.5) * GEO_CELL_SIZE)
+            lon0, lat0 = self.cell_lonlat(gx * GEO_CELL_SIZE, gy * GEO_CELL_SIZE)
+            lon1, lat1 = self.cell_lonlat((gx + 1) * GEO_CELL_SIZE, (gy + 1) * GEO_CELL_SIZE)
+            props = {'frames': int(acc[-1])}
+            props.update({f"{self.class_names[k]}_ratio": float(acc[k] / acc[-1] * 100) for k in range(len(acc) - 1)})
+            rows.append({'lon': lon, 'lat': lat, **props})
+            features.append({
+                'type': 'Feature', 'properties': props,
+                'geometry': {'type': 'Polygon', 'coordinates': [[
+                    [lon0, lat0], [lon1, lat0], [lon1, lat1], [lon0, lat1], [lon0, lat0]]]},
+            })
+
+        pd.DataFrame(rows).to_csv(os.path.join(self.output_dir, "geo_coverage_grid.csv"), index=False)
+        with open(os.path.join(self.output_dir, "geo_coverage_grid.geojson"), 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f, ensure_ascii=False)
+        print(f"地理汇总: {len(rows)} 个 {GEO_CELL_SIZE:g}m 网格 (跳过 {self.skipped} 帧无位置信息)")
+
+class StoreAnalyzer(Analyzer):
+    """把结果流式写入预测结果库 (prediction_store.py)"""
+    name = "store"
+
+    def __init__(self, class_names, output_dir):
+        super().__init__(class_names, output_dir)
+        self.writer = PredictionStoreWriter(os.path.join(output_dir, "predictions"), class_names)
+
+    def consume(self, batch):
+        for name, result in zip(batch.names, batch.results):
+            self.writer.add(name, result)
+
+    def finish(self):
+        self.writer.close()
+        print(f"预测结果库已保存: {self.writer.store_dir}")
+
+    def abort(self):
+        self.writer.abort()
+
+ANALYZERS = {
+    'coverage': CoverageAnalyzer,
+    'overlay': OverlayAnalyzer,
+    'pixels': PixelTotalsAnalyzer,
+    'geo': GeoAnalyzer,
+    'store': StoreAnalyzer,
+}
+
+def image_producer(image_paths, frame_queue, stats, control):
+    """解码线程 (图片目录): 把 (文件名, 图像) 放入有界队列，结束时放入 None"""
+    try:
+        t0 = time.perf_counter()
+        for path in image_paths:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            stats.add(1, time.perf_counter() - t0)
+            if not control.put(frame_queue, (os.path.basename(path), img)):
+                break
+            t0 = time.perf_counter()
+    except Exception as e:
+        control.fail(e)
+    finally:
+        control.put(frame_queue, None)
+
+def analyzer_worker(analyzer, batch_queue, control):
+    """每个分析器一个线程，按顺序消费所有批次；出错时停止整个流水线 (其他线程不会阻塞在队列上)"""
+    try:
+        while True:
+            batch = control.get(batch_queue)
+            if batch is None:
+                break
+            t0 = time.perf_counter()
+            analyzer.consume(batch)
+            analyzer.stats.add(len(batch.results), time.perf_counter() - t0)
+    except Exception as e:
+        print(f"\n分析器 {analyzer.name} 出错: {e!r}")
+        control.fail(e)
+
+def collect_sources(source):
+    """图片目录 -> ('images', 路径列表)；视频文件或视频目录 -> ('videos', 路径列表)"""
+    source = str(source)
+    if os.path.isfile(source):
+        return ('videos', [source]) if source.lower().endswith(('.mp4', '.mov', '.avi')) else ('images', [source])
+    videos = sorted(glob.glob(os.path.join(source, "*.mp4")) + glob.glob(os.path.join(source, "*.MP4")))
+    if videos:
+        return 'videos', videos
+    images = sorted(glob.glob(os.path.join(source, "*.jpg")) + glob.glob(os.path.join(source, "*.png")))
+    return 'images', images
+
+def run_survey(model_path, source, output_dir, analyzer_names, batch_size=BATCH_SIZE, conf=CONF_THRESHOLD,
+               use_cache=False, backend="torch"):
+    device = backend_device(backend, 'cuda' if torch.cuda.is_available() else 'cpu')
+    model = load_model(model_path, backend)
+    class_names = model.names
+    os.makedirs(output_dir, exist_ok=True)
+
+    kind, paths = collect_sources(source)
+    if not paths:
+        print(f"错误: 在 {source} 下没有找到图片或视频。")
+        return
+    print(f"数据源: {len(paths)} 个{'视频' if kind == 'videos' else '图片'} | 分析器: {', '.join(analyzer_names)}")
+
+    analyzers = [ANALYZERS[name](class_names, output_dir) for name in analyzer_names]
+    # 覆盖度在降低的分辨率上计算，像素统计按面积系数换算，都不需要 retina mask
+    predict_args = dict(conf=conf, verbose=False, device=device, retina_masks=False)
+    cache = PredictionCache(model, weights_file(model_path, backend)) if use_cache else None
+
+    # 1. 解码线程
+    decode_stats, infer_stats = StageStats('decode'), StageStats('infer')
+    frame_queue = queue.Queue(maxsize=QUEUE_DEPTH * batch_size)
+    control = PipelineControl()
+    if kind == 'videos':
+        producer = threading.Thread(target=frame_producer, args=(paths, frame_queue, decode_stats, None, control),
+                                    daemon=True)
+    else:
+        producer = threading.Thread(target=image_producer, args=(paths, frame_queue, decode_stats, control),
+                                    daemon=True)
+
+    # 2. 每个分析器一个线程
+    queues = [queue.Queue(maxsize=QUEUE_DEPTH) for _ in analyzers]
+    workers = [threading.Thread(target=analyzer_worker, args=(a, q, control), daemon=True)
+               for a, q in zip(analyzers, queues)]
+
+    wall_start = time.perf_counter()
+    producer.start()
+    for w in workers:
+        w.start()
+
+    # 3. 主线程批量推理，每批结果放入所有分析器的队列 (最慢的分析器决定背压)
+    batch = []
+    try:
+        while True:
+            item = control.get(frame_queue)
+            if item is not None:
+                batch.append(item)
+            if batch and (len(batch) >= batch_size or item is None):
+                t0 = time.perf_counter()
+                frames = [frame for _, frame in batch]
+                results = cache.predict(frames, **predict_args) if cache else model.predict(frames, **predict_args)
+                infer_stats.add(len(batch), time.perf_counter() - t0)
+                frame_batch = FrameBatch([name for name, _ in batch], results, len(class_names))
+                for q in queues:
+                    control.put(q, frame_batch)
+                batch = []
+                print(f"  -> 已推理 {infer_stats.items} 帧...", end='\r')
+            if item is None:
+                break
+    except Exception as e:
+        control.fail(e)
+
+    for q in queues:
+        control.put(q, None)
+    producer.join()
+    for w in workers:
+        w.join()
+    # 任一线程出错时不输出不完整的报告，直接抛出第一个错误
+    if control.errors:
+        for analyzer in analyzers:
+            analyzer.abort()
+    control.raise_if_failed()
+
+    print()
+    for analyzer in analyzers:
+        analyzer.finish()
+    wall = time.perf_counter() - wall_start
+
+    print("\n====== 流水线吞吐量 ======")
+    for st in [decode_stats, infer_stats] + [a.stats for a in analyzers]:
+        print(st.report())
+    if cache:
+        print(cache.report())
+    total = infer_stats.items
+    print(f"整体: {total} 帧 / {wall:.1f}s = {total / wall if wall > 0 else 0:.2f} 帧/秒 (一次推理，{len(analyzers)} 个分析器)")
+    print(f"✅ 调查报告已保存至: {output_dir}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="一次推理，同时生成覆盖度/结构图/像素统计/地理汇总")
+    parser.add_argument('--model', default=str(MODEL_PATH))
+    parser.add_argument('--source', default=str(SOURCE), help="图片目录、视频文件或视频目录")
+    parser.add_argument('--output', default=str(OUTPUT_DIR))
+    parser.add_argument('--analyzers', default="coverage,overlay,pixels",
+                        help=f"逗号分隔，可选: {','.join(ANALYZERS)}")
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE)
+    parser.add_argument('--conf', type=float, default=CONF_THRESHOLD)
+    parser.add_argument('--cache', action='store_true', help="使用预测缓存 (prediction_cache.py)")
+    parser.add_argument('--backend', default="torch", choices=BACKENDS,
+                        help="推理后端，没有 GPU 时可用导出的 openvino-int8 等 (见 inference_backend.py)")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.analyzers.split(',') if n.strip()]
+    unknown = [n for n in names if n not in ANALYZERS]
+    if unknown:
+        parser.error(f"未知的分析器: {', '.join(unknown)}")
+    if not os.path.exists(args.model):
+        print("错误: 找不到模型文件。")
+    else:
+        run_survey(args.model, args.source, args.output, names, args.batch, args.conf, args.cache, args.backend)
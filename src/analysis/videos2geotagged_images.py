@@ -1,9 +1,13 @@
 import cv2
-import re
 import os
 import piexif
 import math
+import struct
+import threading
+import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from srt_telemetry import parse_srt_smart
 
 # ================= 配置区域 =================
 # 1. 视频和SRT所在的文件夹 (输入)
@@ -19,28 +23,18 @@ IMAGES_PER_PART = 600
 # 4. 抽帧间隔 (秒)
 # 1.0 表示每秒抽一帧
 INTERVAL_SEC = 1.0 
-# ===========================================
 
-# 全局计数器，用于跨视频分包
-GLOBAL_IMG_COUNT = 0
+# 5. 同时处理的视频数量 (进程池大小)，1 表示串行
+# 图片编号在规划阶段统一分配，并行与串行输出完全一致
+NUM_WORKERS = 4
 
-def normalize_exif_date(date_str):
-    """
-    [关键修复] 将各种格式的日期转换为 EXIF 标准格式: YYYY:MM:DD HH:MM:SS
-    WebODM 严格要求使用冒号分隔
-    """
-    if not date_str:
-        return "2024:01:01 00:00:00" # 默认值防止报错
-    
-    # 替换 - 和 . 为 :
-    normalized = date_str.replace('-', ':').replace('.', ':')
-    
-    # 确保格式正确 (简单校验)
-    # 如果原字符串带有毫秒 (2024:10:14 12:00:00,000)，去掉逗号后面
-    if ',' in normalized:
-        normalized = normalized.split(',')[0]
-        
-    return normalized
+# 6. 是否在相邻两条SRT记录之间线性插值坐标
+# False: 直接取所在时间段的记录 (原始行为)；True: 亚秒级位置精度
+INTERPOLATE_GPS = False
+
+# 7. 每个视频进程内的写盘线程数 (JPEG编码 + 写文件)，0 表示在解码线程中同步写
+WRITER_THREADS = 2
+# ===========================================
 
 def decimal_to_dms(decimal):
     """将十进制经纬度转换为EXIF所需的DMS格式"""
@@ -49,195 +43,258 @@ def decimal_to_dms(decimal):
     seconds = (decimal - degrees - minutes / 60) * 3600
     return ((degrees, 1), (minutes, 1), (int(seconds * 10000), 10000))
 
-def parse_srt_time(time_str):
-    """将SRT时间字符串转换为秒"""
-    try:
-        h, m, s = time_str.replace(',', '.').split(':')
-        return int(h) * 3600 + int(m) * 60 + float(s)
-    except:
-        return 0.0
-
-def parse_srt_smart(srt_path):
-    """解析SRT文件，提取GPS和时间信息"""
-    print(f"正在解析字幕: {os.path.basename(srt_path)}")
-    try:
-        with open(srt_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except:
-        try:
-            with open(srt_path, 'r', encoding='gbk', errors='ignore') as f:
-                content = f.read()
-        except:
-            print("  -> SRT读取失败")
-            return []
-
-    blocks = re.split(r'\n\s*\n', content.strip())
-    parsed_data = []
-    
-    # 正则表达式匹配
-    # 匹配 New DJI 格式: GPS(113.12, 30.12, 10.5) ... 2024-10-14 12:00:00
-    regex_new_v2 = re.compile(
-        r'(\d{4}[\.-]\d{2}[\.-]\d{2} \d{2}:\d{2}:\d{2}).*?GPS\(([\d\.]+),\s*([\d\.]+),\s*([\d\.]+)\)',
-        re.DOTALL | re.IGNORECASE
-    )
-    regex_new = re.compile(
-        r'GPS\(([\d\.]+),\s*([\d\.]+),\s*([\d\.]+)\).*?(\d{4}[\.-]\d{2}[\.-]\d{2} \d{2}:\d{2}:\d{2})',
-        re.DOTALL | re.IGNORECASE
-    )
-    # 匹配 Old DJI 格式
-    regex_old = re.compile(
-        r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}).*?latitude:\s*([\d\.]+).*?longitude:\s*([\d\.]+).*?altitude:\s*([\d\.]+)', 
-        re.DOTALL | re.IGNORECASE
-    )
-
-    for block in blocks:
-        lines = block.strip().split('\n')
-        if len(lines) < 3: continue
-        
-        # 提取时间轴
-        time_match = re.search(r'(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})', lines[1])
-        if not time_match: continue
-        
-        start_sec = parse_srt_time(time_match.group(1))
-        end_sec = parse_srt_time(time_match.group(2))
-        
-        text_content = " ".join(lines[2:])
-        lat, lon, alt, date_str = None, None, None, None
-        
-        # 尝试不同正则
-        m = regex_new_v2.search(text_content)
-        if m:
-            date_str, lon, lat, alt = m.group(1), float(m.group(2)), float(m.group(3)), float(m.group(4))
-        
-        if not lat:
-            m = regex_new.search(text_content)
-            if m:
-                lon, lat, alt, date_str = float(m.group(1)), float(m.group(2)), float(m.group(3)), m.group(4)
-
-        if not lat:
-            m = regex_old.search(text_content)
-            if m:
-                date_str, lat, lon, alt = m.group(1), float(m.group(2)), float(m.group(3)), float(m.group(4))
-        
-        if lat is not None:
-            # [关键] 立即修复时间格式
-            exif_time = normalize_exif_date(date_str)
-            
-            parsed_data.append({
-                'start': start_sec,
-                'end': end_sec,
-                'lat': lat,
-                'lon': lon,
-                'alt': alt,
-                'time': exif_time # 已经是 YYYY:MM:DD HH:MM:SS
-            })
-
-    print(f"  -> 解析成功: {len(parsed_data)} 条GPS记录")
-    return parsed_data
-
-def get_output_folder():
-    """根据全局计数器决定当前图片应该放入哪个 part 文件夹"""
-    global GLOBAL_IMG_COUNT
+def get_output_folder(img_index):
+    """根据图片的全局序号决定它应该放入哪个 part 文件夹"""
     # 计算当前是第几部分 (从1开始)
-    part_idx = math.floor(GLOBAL_IMG_COUNT / IMAGES_PER_PART) + 1
+    part_idx = math.floor(img_index / IMAGES_PER_PART) + 1
     
     folder_name = f"wetland_proj_part{part_idx}"
     full_path = os.path.join(OUTPUT_ROOT, folder_name)
     
     if not os.path.exists(full_path):
-        os.makedirs(full_path)
+        # 多个进程可能同时创建同一个文件夹，exist_ok 防止竞争报错
+        os.makedirs(full_path, exist_ok=True)
         print(f"\n>>> 创建新任务文件夹: {folder_name} (每包限额: {IMAGES_PER_PART} 张) <<<")
         
     return full_path
 
-def find_gps_by_time(gps_data, current_time_sec):
-    """查找对应时间的GPS数据"""
-    for item in gps_data:
-        if item['start'] <= current_time_sec < item['end']:
-            return item
-    
-    # 容错查找 (1.5秒内)
-    closest = None
-    min_diff = 1.5
-    for item in gps_data:
-        diff = abs(item['start'] - current_time_sec)
-        if diff < min_diff:
-            min_diff = diff
-            closest = item
-    return closest
-
-def process_single_video(video_path, srt_path):
-    global GLOBAL_IMG_COUNT
-    
+class GpsIndex:
+    """
+    SRT GPS记录的有序数组索引，每个SRT只构建一次。
+    查询时用二分查找定位时间区间，复杂度 O(log N)，替代逐条线性扫描。
+    """
+    # 容错查找的最大时间差 (秒)
+    MAX_GAP = 1.5
+
+    def __init__(self, gps_data):
+        order = sorted(range(len(gps_data)), key=lambda i: gps_data[i]['start'])
+        self.records = [gps_data[i] for i in order]
+        self.start = np.array([r['start'] for r in self.records], dtype=np.float64)
+        self.end = np.array([r['end'] for r in self.records], dtype=np.float64)
+        self.lat = np.array([r['lat'] for r in self.records], dtype=np.float64)
+        self.lon = np.array([r['lon'] for r in self.records], dtype=np.float64)
+        self.alt = np.array([r['alt'] for r in self.records], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.records)
+
+    def nearest(self, t):
+        """返回时间 t 所在区间的记录；不在任何区间内时返回 1.5 秒内起始时间最近的记录"""
+        if not self.records:
+            return None
+        # i: 最后一个 start <= t 的记录
+        i = int(np.searchsorted(self.start, t, side='right')) - 1
+        if i >= 0 and t < self.end[i]:
+            return self.records[i]
+
+        # 容错: 只需比较左右两个相邻记录
+        best, min_diff = None, self.MAX_GAP
+        for j in (i, i + 1):
+            if 0 <= j < len(self.records):
+                diff = abs(self.start[j] - t)
+                if diff < min_diff:
+                    min_diff, best = diff, self.records[j]
+        return best
+
+    def interpolate(self, t):
+        """
+        在相邻两条记录之间按时间线性插值经纬度和高度 (以每条记录的 start 为采样时刻)。
+        超出首尾记录范围时退化为 nearest()；时间字符串取最近的记录。
+        """
+        base = self.nearest(t)
+        if base is None or len(self.records) < 2:
+            return base
+        if t < self.start[0] or t > self.start[-1]:
+            return base
+        record = dict(base)
+        record['lat'] = float(np.interp(t, self.start, self.lat))
+        record['lon'] = float(np.interp(t, self.start, self.lon))
+        record['alt'] = float(np.interp(t, self.start, self.alt))
+        return record
+
+def find_gps_by_time(gps_index, current_time_sec, interpolate=INTERPOLATE_GPS):
+    """查找对应时间的GPS数据 (gps_index 为 GpsIndex)"""
+    if interpolate:
+        return gps_index.interpolate(current_time_sec)
+    return gps_index.nearest(current_time_sec)
+
+def plan_single_video(video_path, srt_path):
+    """
+    规划阶段: 只读取视频元信息和SRT，不解码画面。
+    计算出该视频会被保存的每一帧 (帧号, 时间, GPS记录)，
+    这样在真正抽帧之前就能知道每个视频贡献多少张图片。
+    """
     video_name = Path(video_path).stem
     gps_data = parse_srt_smart(srt_path)
     
     if not gps_data:
         print(f"  [跳过] 无有效GPS数据: {video_name}")
-        return
+        return None
 
     cap = cv2.VideoCapture(str(video_path))
-    if not cap.isOpened(): return
-
+    if not cap.isOpened(): return None
     fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    frame_interval = int(fps * INTERVAL_SEC)
+    cap.release()
+    if fps <= 0: return None
+
+    # 每个SRT只建一次索引
+    gps_index = GpsIndex(gps_data)
+    frame_interval = max(1, int(fps * INTERVAL_SEC))
+    frames = []
+    for frame_idx in range(0, total_frames, frame_interval):
+        current_time = frame_idx / fps
+        record = find_gps_by_time(gps_index, current_time)
+        if record:
+            frames.append((frame_idx, current_time, record))
+
+    return {
+        'video_path': str(video_path),
+        'video_name': video_name,
+        'fps': fps,
+        'total_frames': total_frames,
+        'frames': frames,
+        'start_index': 0,  # 由 plan_all_videos 统一分配
+    }
+
+def plan_all_videos(video_pairs):
+    """
+    按文件名顺序为所有视频规划编号区间。
+    第 k 个视频的图片编号从前 k-1 个视频的图片总数开始，
+    因此无论串行还是并行执行，文件名和分包结果都完全一致。
+    """
+    plans = []
+    next_index = 0
+    for video_path, srt_path in video_pairs:
+        plan = plan_single_video(video_path, srt_path)
+        if plan is None or not plan['frames']:
+            continue
+        plan['start_index'] = next_index
+        next_index += len(plan['frames'])
+        plans.append(plan)
+        print(f"  -> 规划: {plan['video_name']} 编号 {plan['start_index']:05d} ~ {next_index - 1:05d}")
+    return plans, next_index
+
+def build_exif_bytes(record):
+    """根据GPS记录生成 EXIF 数据块 (GPS IFD + 拍摄时间)"""
+    lat, lon, alt = record['lat'], record['lon'], record['alt']
+    time_str = record['time'] # YYYY:MM:DD HH:MM:SS
     
-    print(f"  -> 视频处理中: {video_name} (FPS={fps:.1f}, 总帧数={total_frames})")
+    zeroth_ifd = {piexif.ImageIFD.Make: "DJI", piexif.ImageIFD.DateTime: time_str}
+    exif_ifd = {
+        piexif.ExifIFD.DateTimeOriginal: time_str, 
+        piexif.ExifIFD.DateTimeDigitized: time_str
+    }
+    gps_ifd = {
+        piexif.GPSIFD.GPSLatitudeRef: "N" if lat >= 0 else "S",
+        piexif.GPSIFD.GPSLatitude: decimal_to_dms(abs(lat)),
+        piexif.GPSIFD.GPSLongitudeRef: "E" if lon >= 0 else "W",
+        piexif.GPSIFD.GPSLongitude: decimal_to_dms(abs(lon)),
+        piexif.GPSIFD.GPSAltitudeRef: 0, # 0 = Sea level
+        piexif.GPSIFD.GPSAltitude: (int(alt * 100), 100)
+    }
+    exif_dict = {"0th": zeroth_ifd, "Exif": exif_ifd, "GPS": gps_ifd}
+    return piexif.dump(exif_dict)
+
+def splice_exif(jpeg_bytes, exif_bytes):
+    """
+    把 EXIF (APP1 段) 直接拼进内存中的 JPEG 码流。
+    cv2.imencode 的输出为 SOI + APP0(JFIF) + ...，与 piexif.insert 相同，用 APP1 替换 APP0，
+    得到的文件与原先 "imwrite + piexif.insert" 的结果逐字节一致。
+    """
+    app1 = b"\xff\xe1" + struct.pack(">H", len(exif_bytes) + 2) + exif_bytes
+    rest = 2  # 跳过 SOI (FFD8)
+    if jpeg_bytes[2:4] == b"\xff\xe0":
+        rest = 4 + struct.unpack(">H", jpeg_bytes[4:6])[0]
+    return jpeg_bytes[:2] + app1 + jpeg_bytes[rest:]
+
+def save_geotagged_frame(frame, record, save_path):
+    """内存中编码 JPEG 并拼接 EXIF，每张图片只写盘一次"""
+    ok, buf = cv2.imencode(".jpg", frame)
+    if not ok:
+        print(f"JPEG编码失败: {save_path}")
+        return False
+
+    data = buf.tobytes()
+    try:
+        data = splice_exif(data, build_exif_bytes(record))
+    except Exception as e:
+        # EXIF 出错时仍然保存无地理信息的图片，与原流程行为一致
+        print(f"EXIF写入错误: {e}")
+
+    with open(save_path, 'wb') as f:
+        f.write(data)
+    return True
+
+def process_single_video(plan):
+    """按规划结果抽帧并写入 EXIF，返回实际保存的图片数"""
+    video_name = plan['video_name']
+    cap = cv2.VideoCapture(plan['video_path'])
+    if not cap.isOpened(): return 0
+
+    print(f"  -> 视频处理中: {video_name} (FPS={plan['fps']:.1f}, 总帧数={plan['total_frames']})")
+
+    # 帧号 -> 在本视频内的序号
+    wanted = {frame_idx: k for k, (frame_idx, _, _) in enumerate(plan['frames'])}
+    last_wanted = plan['frames'][-1][0]
 
     frame_count = 0
     saved_in_video = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
+    # 可选的写盘线程池: 编码和写盘与解码重叠进行
+    # 用信号量限制排队中的帧数，防止解码过快时 4K 帧堆满内存
+    writer = ThreadPoolExecutor(max_workers=WRITER_THREADS) if WRITER_THREADS > 0 else None
+    pending_slots = threading.BoundedSemaphore(WRITER_THREADS * 2) if writer else None
+    pending = []
+
+    def _release_slot(_future):
+        pending_slots.release()
+
+    while frame_count <= last_wanted:
+        # 只推进不需要的帧，需要保存的帧才 retrieve
+        if not cap.grab(): break
+
+        if frame_count in wanted:
+            ret, frame = cap.retrieve()
+            if not ret: break
+
+            k = wanted[frame_count]
+            _, current_time, record = plan['frames'][k]
+            img_index = plan['start_index'] + k
 
-        if frame_count % frame_interval == 0:
-            current_time = frame_count / fps
-            record = find_gps_by_time(gps_data, current_time)
+            # 1. 获取当前应该存放的目录 (自动分包)
+            current_output_dir = get_output_folder(img_index)
             
-            if record:
-                # 1. 获取当前应该存放的目录 (自动分包)
-                current_output_dir = get_output_folder()
-                
-                # 2. 保存图片
-                # 文件名包含绝对计数，防止重名
-                filename = f"img_{GLOBAL_IMG_COUNT:05d}_{video_name}_t{current_time:.1f}.jpg"
-                save_path = os.path.join(current_output_dir, filename)
-                cv2.imwrite(save_path, frame)
-                
-                # 3. 写入 EXIF
-                lat, lon, alt = record['lat'], record['lon'], record['alt']
-                time_str = record['time'] # YYYY:MM:DD HH:MM:SS
-                
-                zeroth_ifd = {piexif.ImageIFD.Make: "DJI", piexif.ImageIFD.DateTime: time_str}
-                exif_ifd = {
-                    piexif.ExifIFD.DateTimeOriginal: time_str, 
-                    piexif.ExifIFD.DateTimeDigitized: time_str
-                }
-                gps_ifd = {
-                    piexif.GPSIFD.GPSLatitudeRef: "N" if lat >= 0 else "S",
-                    piexif.GPSIFD.GPSLatitude: decimal_to_dms(abs(lat)),
-                    piexif.GPSIFD.GPSLongitudeRef: "E" if lon >= 0 else "W",
-                    piexif.GPSIFD.GPSLongitude: decimal_to_dms(abs(lon)),
-                    piexif.GPSIFD.GPSAltitudeRef: 0, # 0 = Sea level
-                    piexif.GPSIFD.GPSAltitude: (int(alt * 100), 100)
-                }
-                
-                try:
-                    exif_dict = {"0th": zeroth_ifd, "Exif": exif_ifd, "GPS": gps_ifd}
-                    exif_bytes = piexif.dump(exif_dict)
-                    piexif.insert(exif_bytes, save_path)
-                except Exception as e:
-                    print(f"EXIF写入错误: {e}")
+            # 2. 编码 + 写入 EXIF + 保存 (一次写盘)
+            # 文件名包含绝对计数，防止重名
+            filename = f"img_{img_index:05d}_{video_name}_t{current_time:.1f}.jpg"
+            save_path = os.path.join(current_output_dir, filename)
+            if writer:
+                pending_slots.acquire()
+                future = writer.submit(save_geotagged_frame, frame, record, save_path)
+                future.add_done_callback(_release_slot)
+                pending.append(future)
+            else:
+                save_geotagged_frame(frame, record, save_path)
 
-                saved_in_video += 1
-                GLOBAL_IMG_COUNT += 1
+            saved_in_video += 1
             
         frame_count += 1
 
     cap.release()
+    if writer:
+        writer.shutdown(wait=True)
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"图片保存失败: {e}")
+
+    if saved_in_video < len(plan['frames']):
+        # 视频实际可读帧数少于元信息中的帧数时，缺失的编号保留为空号，不会挤占其他视频的编号
+        print(f"  [警告] {video_name} 实际只读到 {saved_in_video}/{len(plan['frames'])} 张规划帧")
     print(f"  -> {video_name} 完成: 贡献了 {saved_in_video} 张图片")
+    return saved_in_video
 
 def main():
     if not os.path.exists(VIDEO_ROOT):
@@ -246,13 +303,15 @@ def main():
 
     # 获取所有mp4文件
     video_files = [f for f in os.listdir(VIDEO_ROOT) if f.lower().endswith(('.mp4', '.mov'))]
-    video_files.sort() # 排序，确保处理顺序
+    video_files.sort() # 排序，确保处理顺序 (编号规划依赖这个顺序)
     
     print(f"=== 开始处理湿地数据 ===")
     print(f"源目录: {VIDEO_ROOT}")
     print(f"目标目录: {OUTPUT_ROOT}")
-    print(f"分包策略: 每 {IMAGES_PER_PART} 张图片创建一个新文件夹\n")
+    print(f"分包策略: 每 {IMAGES_PER_PART} 张图片创建一个新文件夹")
+    print(f"并行进程数: {NUM_WORKERS}\n")
 
+    video_pairs = []
     for v_file in video_files:
         video_path = os.path.join(VIDEO_ROOT, v_file)
         
@@ -261,13 +320,30 @@ def main():
         srt_path = os.path.join(VIDEO_ROOT, srt_name)
         
         if os.path.exists(srt_path):
-            process_single_video(video_path, srt_path)
+            video_pairs.append((video_path, srt_path))
         else:
             print(f"[警告] 视频 {v_file} 缺少对应的 SRT 文件，跳过处理。")
 
+    # 1. 规划: 确定每个视频的编号区间
+    plans, planned_total = plan_all_videos(video_pairs)
+
+    # 2. 执行: 各视频互不依赖，可以并行
+    total_saved = 0
+    if NUM_WORKERS <= 1:
+        for plan in plans:
+            total_saved += process_single_video(plan)
+    else:
+        with ProcessPoolExecutor(max_workers=NUM_WORKERS) as executor:
+            futures = {executor.submit(process_single_video, plan): plan['video_name'] for plan in plans}
+            for future in as_completed(futures):
+                try:
+                    total_saved += future.result()
+                except Exception as e:
+                    print(f"[Error] 处理 {futures[future]} 失败: {e}")
+
     print(f"\n=== 全部完成 ===")
-    print(f"总计生成图片: {GLOBAL_IMG_COUNT}")
+    print(f"总计生成图片: {total_saved} (规划 {planned_total})")
     print(f"查看输出目录: {OUTPUT_ROOT}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,218 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+from pathlib import Path
+import cv2
+import numpy as np
+
+# ================= 配置区域 =================
+IMGSZ_LIST = [640, 1024]          # 推理分辨率
+BATCH_SIZES = [1, 4, 8]           # 批量吞吐测试的 batch
+RETINA_OPTIONS = [False, True]    # retina_masks: True 时 mask 上采样到原图尺寸 (后处理更重)
+WARMUP = 3                        # 每组配置正式计时前的预热次数
+LATENCY_ROUNDS = 3                # 单张延迟: 所有图片各跑几轮
+THROUGHPUT_BATCHES = 5            # 批量吞吐: 每组跑几个 batch
+NUM_4K_FRAMES = 4                 # 合成的 3840x2160 帧数
+FRAME_4K = (2160, 3840)
+CONF = 0.25
+TOLERANCE = 0.10                  # 与基线比较: 延迟变慢或吞吐下降超过 10% 记为回退
+# ===========================================
+
+# ================= 说明 =================
+# 推理速度基准测试，输出 JSON:
+#   cold_start : 加载模型 + 第一次推理的时间 (包含 CUDA 初始化、算子选择等)
+#   latency    : 单张逐张推理的 p50/p90/p99 延迟，及 YOLO 统计的预处理/推理/后处理耗时
+#   throughput : 按 batch 推理的吞吐量 (张/秒)
+# 图片集: "samples" = data/samples 下的图片，"4k" = 把样例图放大到 3840x2160 的合成帧 (无人机原始分辨率)。
+# 图片预先读入内存，测量不包含磁盘读取。
+# 用 --baseline 与保存的基线比较，超过 TOLERANCE 的退化会列出并以退出码 1 结束。
+# =======================================
+
+def load_sample_images(samples_dir):
+    paths = sorted(p for p in glob.glob(os.path.join(samples_dir, "*"))
+                   if p.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+    images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        raise FileNotFoundError(f"{samples_dir} 中没有可读取的图片")
+    return images
+
+def make_4k_frames(images, count=NUM_4K_FRAMES, shape=FRAME_4K):
+    """循环取样例图放大到 4K，保留真实纹理 (纯噪声图几乎没有检测结果，后处理耗时不具代表性)"""
+    h, w = shape
+    return [cv2.resize(images[i % len(images)], (w, h), interpolation=cv2.INTER_LINEAR) for i in range(count)]
+
+def percentile_stats(values_ms):
+    v = np.asarray(values_ms, dtype=np.float64)
+    return {
+        "mean_ms": round(float(v.mean()), 3),
+        "p50_ms": round(float(np.percentile(v, 50)), 3),
+        "p90_ms": round(float(np.percentile(v, 90)), 3),
+        "p99_ms": round(float(np.percentile(v, 99)), 3),
+    }
+
+def stage_means(results_list):
+    """YOLO 在 Results.speed 中记录的每张图预处理/推理/后处理耗时 (ms) 的平均值"""
+    stages = {"preprocess": [], "inference": [], "postprocess": []}
+    for r in results_list:
+        for key in stages:
+            if r.speed.get(key) is not None:
+                stages[key].append(r.speed[key])
+    return {f"{key}_ms": round(float(np.mean(v)), 3) if v else None for key, v in stages.items()}
+
+def measure_cold_start(model_path, image, imgsz, device):
+    """加载模型 + 第一次推理 (必须在本进程的其他推理之前调用)"""
+    from ultralytics import YOLO
+
+    t0 = time.perf_counter()
+    model = YOLO(model_path)
+    t1 = time.perf_counter()
+    model.predict(image, imgsz=imgsz, conf=CONF, device=device, verbose=False)
+    t2 = time.perf_counter()
+    return model, {"load_s": round(t1 - t0, 4), "first_predict_s": round(t2 - t1, 4), "total_s": round(t2 - t0, 4)}
+
+def measure_latency(model, images, imgsz, retina, device):
+    predict = lambda img: model.predict(img, imgsz=imgsz, retina_masks=retina, conf=CONF, device=device,
+                                        verbose=False)
+    for i in range(WARMUP):
+        predict(images[i % len(images)])
+    times, results_list = [], []
+    for _ in range(LATENCY_ROUNDS):
+        for img in images:
+            t0 = time.perf_counter()
+            results = predict(img)
+            times.append((time.perf_counter() - t0) * 1000)
+            results_list += results
+    return {**percentile_stats(times), **stage_means(results_list), "calls": len(times)}
+
+def measure_throughput(model, images, imgsz, batch, retina, device):
+    batches = [[images[(k * batch + j) % len(images)] for j in range(batch)] for k in range(THROUGHPUT_BATCHES)]
+    predict = lambda imgs: model.predict(imgs, imgsz=imgsz, batch=batch, retina_masks=retina, conf=CONF,
+                                         device=device, verbose=False)
+    predict(batches[0])  # 预热
+    results_list = []
+    t0 = time.perf_counter()
+    for imgs in batches:
+        results_list += predict(imgs)
+    elapsed = time.perf_counter() - t0
+    n = batch * len(batches)
+    return {"images_per_s": round(n / elapsed, 3), "ms_per_image": round(1000 * elapsed / n, 3),
+            **stage_means(results_list)}
+
+def environment_info(model_path, device):
+    import torch
+    import ultralytics
+    return {
+        "model": str(model_path),
+        "device": str(device),
+        "gpu": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        "cpu": platform.processor() or platform.machine(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "ultralytics": ultralytics.__version__,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def run_benchmark(model_path, samples_dir, imgsz_list=IMGSZ_LIST, batch_sizes=BATCH_SIZES,
+                  retina_options=RETINA_OPTIONS):
+    import torch
+
+    device = 0 if torch.cuda.is_available() else 'cpu'
+    samples = load_sample_images(samples_dir)
+    image_sets = {"samples": samples, "4k": make_4k_frames(samples)}
+    print(f"图片: samples {len(samples)} 张, 4k {len(image_sets['4k'])} 张 | 设备: {device}")
+
+    model, cold = measure_cold_start(model_path, samples[0], imgsz_list[0], device)
+    print(f"冷启动: 加载 {cold['load_s']:.2f}s + 首次推理 {cold['first_predict_s']:.2f}s")
+
+    latency, throughput = [], []
+    for set_name, images in image_sets.items():
+        for imgsz in imgsz_list:
+            for retina in retina_options:
+                row = {"set": set_name, "imgsz": imgsz, "retina_masks": retina}
+                row.update(measure_latency(model, images, imgsz, retina, device))
+                latency.append(row)
+                print(f"[延迟] {set_name} imgsz={imgsz} retina={retina}: "
+                      f"p50 {row['p50_ms']:.1f} ms | p90 {row['p90_ms']:.1f} ms | p99 {row['p99_ms']:.1f} ms")
+                for batch in batch_sizes:
+                    row = {"set": set_name, "imgsz": imgsz, "batch": batch, "retina_masks": retina}
+                    row.update(measure_throughput(model, images, imgsz, batch, retina, device))
+                    throughput.append(row)
+                    print(f"[吞吐] {set_name} imgsz={imgsz} batch={batch} retina={retina}: "
+                          f"{row['images_per_s']:.2f} 张/秒")
+
+    return {"meta": environment_info(model_path, device), "cold_start": cold,
+            "latency": latency, "throughput": throughput}
+
+def _row_key(section, row):
+    return (section, row["set"], row["imgsz"], row.get("batch"), row["retina_masks"])
+
+def compare_with_baseline(report, baseline, tolerance=TOLERANCE):
+    """
+    返回退化列表 [(配置, 指标, 基线值, 当前值, 变化比例)]。
+    延迟类指标 (越小越好) 变大超过 tolerance、吞吐 (越大越好) 变小超过 tolerance 记为退化。
+    """
+    checks = {"latency": ["p50_ms", "p90_ms", "p99_ms"], "throughput": ["images_per_s"]}
+    base_rows = {_row_key(section, r): r for section in checks for r in baseline.get(section, [])}
+    regressions = []
+    for section, metrics in checks.items():
+        for row in report.get(section, []):
+            base = base_rows.get(_row_key(section, row))
+            if base is None:
+                continue
+            for metric in metrics:
+                old, new = base.get(metric), row.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                worse = change < -tolerance if metric == "images_per_s" else change > tolerance
+                if worse:
+                    regressions.append((_row_key(section, row), metric, old, new, change))
+
+    old_cold, new_cold = baseline.get("cold_start", {}).get("total_s"), report["cold_start"]["total_s"]
+    if old_cold and (new_cold - old_cold) / old_cold > tolerance:
+        regressions.append((("cold_start",), "total_s", old_cold, new_cold, (new_cold - old_cold) / old_cold))
+    return regressions
+
+if __name__ == "__main__":
+    current_file = Path(__file__).resolve()
+    project_root = current_file.parents[2]
+
+    parser = argparse.ArgumentParser(description="推理延迟/吞吐基准测试")
+    parser.add_argument("--model", default=str(project_root / "runs" / "train" / "wetland_yolo11x_exp1" / "weights" / "best.pt"))
+    parser.add_argument("--samples", default=str(project_root / "data" / "samples"))
+    parser.add_argument("--output", default=str(project_root / "results" / "benchmark" / "inference.json"))
+    parser.add_argument("--baseline", default=None, help="与该基线 JSON 比较")
+    parser.add_argument("--save-baseline", default=None, help="把本次结果另存为基线")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--imgsz", type=int, nargs="+", default=IMGSZ_LIST)
+    parser.add_argument("--batch", type=int, nargs="+", default=BATCH_SIZES)
+    args = parser.parse_args()
+
+    report = run_benchmark(args.model, args.samples, args.imgsz, args.batch)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已保存: {args.output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"已保存基线: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("device") != report["meta"]["device"]:
+            print(f"⚠️ 基线设备 ({baseline.get('meta', {}).get('device')}) 与本次 ({report['meta']['device']}) 不同，比较仅供参考")
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ 发现 {len(regressions)} 项性能退化 (阈值 {args.tolerance:.0%}):")
+            for key, metric, old, new, change in regressions:
+                print(f"  {' / '.join(str(k) for k in key if k is not None)} {metric}: {old} -> {new} ({change:+.1%})")
+            sys.exit(1)
+        print(f"✅ 与基线相比没有超过 {args.tolerance:.0%} 的退化")
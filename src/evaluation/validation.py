@@ -1,18 +1,357 @@
+import os
+import csv
+import glob
+import json
+import argparse
+import cv2
+import numpy as np
+import torch
 from ultralytics import YOLO
+from ultralytics.utils.ops import scale_masks
 
-model = YOLO('best.pt')
-
-# 使用 generator (生成器) 模式
-# 注意：stream=True 时，必须用 for 循环遍历结果，否则推理不会开始
-results = model.predict(
-    source='test_videos/',  # 你的图片文件夹
-    save=True,      # 保存结果
-    imgsz=1024,     # 保持高清
-    stream=True,    # 【关键】开启流式模式，用完即扔，不占内存
-    device=0,       # 使用 GPU 推理
-    conf=0.25
-)
-
-# 必须遍历，流程才会执行
-for result in results:
-    pass  # 可以在这里加一行 print("Processed one image") 来监控进度
\ No newline at end of file
+# ================= 配置区域 =================
+MODEL_PATH = 'best.pt'
+SOURCE = 'test_videos/'          # 你的图片文件夹 (标签按 YOLO 规则: /images/ -> /labels/，或用 --labels 指定)
+OUTPUT_DIR = 'runs/validation'
+IMGSZ = 1024                     # 保持高清
+# 计算 mAP 时保留低置信度的预测 (与 Ultralytics val 相同)；混淆矩阵和覆盖度只统计 CONF_THRESHOLD 以上的预测
+EVAL_CONF = 0.001
+CONF_THRESHOLD = 0.25
+CONFUSION_IOU = 0.45
+# 在长边为 EVAL_MAX_SIDE 的分辨率上比较 mask (GT 多边形直接在该分辨率上栅格化)
+EVAL_MAX_SIDE = 640
+# 置信度直方图的分箱数: AP 由直方图的累计值计算，状态大小与图片数量无关
+CONF_BINS = 1000
+SAVE_IMAGES = True               # 保存画好的预测图 (只画 CONF_THRESHOLD 以上的预测，与原来 conf=0.25 的输出一致)
+# ===========================================
+
+# ================= 说明 =================
+# 流式评估: predict(stream=True) 逐张产出结果，每张图更新一次累计量后就丢弃，内存占用与测试集大小无关。
+#   - mask AP: 每个类别、每个 IoU 阈值 (0.50:0.95) 按置信度分箱累计 TP 数和预测数，
+#              最后按箱从高到低累加得到 P-R 曲线，101 点插值计算 AP
+#   - 混淆矩阵: (类别数+1) x (类别数+1)，最后一行/列为背景，行 = 预测，列 = 真值
+#   - 覆盖度误差: 每张图每个类别的 (预测覆盖比例 - 真值覆盖比例)，同类实例先求并集；
+#                逐张写入 CSV，同时累计绝对误差、平方误差和有符号误差
+# 所有累计量都是可以直接相加的数组，分片评估 (--shard i/n) 的结果保存为 .npz 后可用 --merge 合并。
+# =======================================
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+class StreamingSegEvaluator:
+    """分割模型的流式评估器，update() 每次处理一张图，state 中只有固定大小的数组"""
+
+    STATE_KEYS = ('tp_hist', 'pred_hist', 'n_gt', 'confusion', 'cover_abs', 'cover_sq', 'cover_signed', 'n_images')
+
+    def __init__(self, class_names, conf_bins=CONF_BINS):
+        self.class_names = dict(class_names)
+        nc = len(self.class_names)
+        self.nc = nc
+        self.conf_bins = conf_bins
+        self.tp_hist = np.zeros((nc, len(IOU_THRESHOLDS), conf_bins), dtype=np.int64)
+        self.pred_hist = np.zeros((nc, conf_bins), dtype=np.int64)
+        self.n_gt = np.zeros(nc, dtype=np.int64)
+        self.confusion = np.zeros((nc + 1, nc + 1), dtype=np.int64)
+        self.cover_abs = np.zeros(nc, dtype=np.float64)
+        self.cover_sq = np.zeros(nc, dtype=np.float64)
+        self.cover_signed = np.zeros(nc, dtype=np.float64)
+        self.n_images = np.zeros(1, dtype=np.int64)
+
+    # ---------- 单张图 ----------
+    def update(self, pred_cls, pred_conf, pred_masks, gt_cls, gt_masks):
+        """
+        pred_cls/pred_conf: (P,)；pred_masks: (P, h, w) bool；gt_cls: (G,)；gt_masks: (G, h, w) bool。
+        mask 在同一分辨率、同一设备上。返回该图各类别的覆盖度误差 (nc,)。
+        """
+        pred_cls = np.asarray(pred_cls, dtype=np.int64)
+        pred_conf = np.asarray(pred_conf, dtype=np.float64)
+        gt_cls = np.asarray(gt_cls, dtype=np.int64)
+        iou = mask_iou(gt_masks, pred_masks)  # (G, P)
+
+        # 1. AP 累计量
+        np.add.at(self.n_gt, gt_cls, 1)
+        order = np.argsort(-pred_conf, kind='stable')
+        correct = match_predictions(pred_cls[order], gt_cls, iou[:, order])
+        bins = np.minimum((pred_conf[order] * self.conf_bins).astype(np.int64), self.conf_bins - 1)
+        np.add.at(self.pred_hist, (pred_cls[order], bins), 1)
+        for t in range(len(IOU_THRESHOLDS)):
+            hit = correct[:, t]
+            np.add.at(self.tp_hist[:, t], (pred_cls[order][hit], bins[hit]), 1)
+
+        # 2. 混淆矩阵 (只看置信度足够的预测)
+        keep = pred_conf >= CONF_THRESHOLD
+        self.confusion += confusion_counts(pred_cls[keep], gt_cls, iou[:, keep], self.nc)
+
+        # 3. 覆盖度误差
+        error = class_coverage(pred_cls[keep], pred_masks[torch.from_numpy(keep).to(pred_masks.device)], self.nc) \
+            - class_coverage(gt_cls, gt_masks, self.nc)
+        self.cover_abs += np.abs(error)
+        self.cover_sq += error ** 2
+        self.cover_signed += error
+        self.n_images += 1
+        return error
+
+    # ---------- 分片合并 ----------
+    def merge(self, other):
+        if other.nc != self.nc or other.conf_bins != self.conf_bins:
+            raise ValueError("分片的类别数或分箱数不一致，无法合并")
+        for key in self.STATE_KEYS:
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        return self
+
+    def save(self, path):
+        np.savez(path, names=json.dumps(self.class_names, ensure_ascii=False), conf_bins=self.conf_bins,
+                 **{key: getattr(self, key) for key in self.STATE_KEYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            names = {int(k): v for k, v in json.loads(str(npz['names'])).items()}
+            ev = cls(names, int(npz['conf_bins']))
+            for key in cls.STATE_KEYS:
+                setattr(ev, key, npz[key])
+        return ev
+
+    # ---------- 指标 ----------
+    def average_precision(self):
+        """返回 (nc, 10) 的 AP 矩阵；没有真值的类别为 nan"""
+        ap = np.full((self.nc, len(IOU_THRESHOLDS)), np.nan)
+        # 置信度从高到低累加
+        cum_n = np.cumsum(self.pred_hist[:, ::-1], axis=1)
+        cum_tp = np.cumsum(self.tp_hist[:, :, ::-1], axis=2)
+        for c in range(self.nc):
+            if self.n_gt[c] == 0:
+                continue
+            valid = cum_n[c] > 0
+            for t in range(len(IOU_THRESHOLDS)):
+                recall = cum_tp[c, t, valid] / self.n_gt[c]
+                precision = cum_tp[c, t, valid] / cum_n[c, valid]
+                ap[c, t] = interpolated_ap(recall, precision)
+        return ap
+
+    def summary(self):
+        ap = self.average_precision()
+        n = max(int(self.n_images[0]), 1)
+        rows = []
+        for c, name in self.class_names.items():
+            rows.append({
+                'class': name,
+                'gt_instances': int(self.n_gt[c]),
+                'mask_AP50': ap[c, 0],
+                'mask_AP50-95': np.nanmean(ap[c]) if self.n_gt[c] else np.nan,
+                'coverage_MAE_%': 100 * self.cover_abs[c] / n,
+                'coverage_RMSE_%': 100 * np.sqrt(self.cover_sq[c] / n),
+                'coverage_bias_%': 100 * self.cover_signed[c] / n,
+            })
+        return rows
+
+def interpolated_ap(recall, precision):
+    """COCO 101 点插值 AP (precision 取右侧包络)"""
+    if len(recall) == 0:
+        return 0.0
+    mpre = np.maximum.accumulate(np.concatenate(([0.0], precision, [0.0]))[::-1])[::-1]
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    x = np.linspace(0, 1, 101)
+    idx = np.searchsorted(mrec, x, side='left')
+    return float(mpre[idx].mean())
+
+def mask_iou(gt_masks, pred_masks):
+    """(G, h, w) 与 (P, h, w) 的两两 IoU，一次矩阵乘法完成，返回 numpy (G, P)"""
+    if len(gt_masks) == 0 or len(pred_masks) == 0:
+        return np.zeros((len(gt_masks), len(pred_masks)))
+    g = gt_masks.flatten(1).float()
+    p = pred_masks.flatten(1).float()
+    inter = g @ p.T
+    union = g.sum(1)[:, None] + p.sum(1)[None, :] - inter
+    return (inter / union.clamp(min=1)).cpu().numpy()
+
+def match_predictions(pred_cls, gt_cls, iou):
+    """
+    预测已按置信度从高到低排序。每个 IoU 阈值下，预测依次认领 IoU 最大且尚未被认领的同类真值。
+    返回 (P, 10) 的 bool 矩阵，True 表示该阈值下为 TP。
+    """
+    correct = np.zeros((len(pred_cls), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(gt_cls) == 0 or len(pred_cls) == 0:
+        return correct
+    iou = iou * (gt_cls[:, None] == pred_cls[None, :])
+    claimed = np.zeros((len(gt_cls), len(IOU_THRESHOLDS)), dtype=bool)
+    cols = np.arange(len(IOU_THRESHOLDS))
+    for j in np.flatnonzero((iou >= IOU_THRESHOLDS[0]).any(0)):
+        available = np.where(claimed, 0, iou[:, j, None])  # (G, 10)
+        k = available.argmax(0)
+        correct[j] = available[k, cols] >= IOU_THRESHOLDS
+        claimed[k, cols] |= correct[j]
+    return correct
+
+def confusion_counts(pred_cls, gt_cls, iou, nc):
+    """IoU >= CONFUSION_IOU 的预测-真值一一配对 (按 IoU 从大到小)，未配对的计入背景"""
+    matrix = np.zeros((nc + 1, nc + 1), dtype=np.int64)
+    pairs = np.argwhere(iou >= CONFUSION_IOU)
+    if len(pairs):
+        pairs = pairs[np.argsort(-iou[pairs[:, 0], pairs[:, 1]], kind='stable')]
+        pairs = pairs[np.unique(pairs[:, 1], return_index=True)[1]]   # 每个预测只配一次
+        # np.unique 按预测下标重排了顺序，去重真值前要重新按 IoU 排序，否则保留的是下标最小而不是 IoU 最大的配对
+        pairs = pairs[np.argsort(-iou[pairs[:, 0], pairs[:, 1]], kind='stable')]
+        pairs = pairs[np.unique(pairs[:, 0], return_index=True)[1]]   # 每个真值只配一次
+    matched_gt = np.zeros(len(gt_cls), dtype=bool)
+    matched_pred = np.zeros(len(pred_cls), dtype=bool)
+    if len(pairs):
+        np.add.at(matrix, (pred_cls[pairs[:, 1]], gt_cls[pairs[:, 0]]), 1)
+        matched_gt[pairs[:, 0]] = True
+        matched_pred[pairs[:, 1]] = True
+    np.add.at(matrix, (np.full((~matched_gt).sum(), nc), gt_cls[~matched_gt]), 1)
+    np.add.at(matrix, (pred_cls[~matched_pred], np.full((~matched_pred).sum(), nc)), 1)
+    return matrix
+
+def class_coverage(cls, masks, nc):
+    """每个类别 mask 并集占整幅图的比例 (nc,)"""
+    cover = np.zeros(nc)
+    if len(cls) == 0:
+        return cover
+    cls_t = torch.as_tensor(cls, device=masks.device)
+    for c in np.unique(cls):
+        cover[c] = masks[cls_t == int(c)].any(0).float().mean().item()
+    return cover
+
+# ---------- 数据 ----------
+def eval_shape(orig_shape, max_side=EVAL_MAX_SIDE):
+    h, w = orig_shape
+    r = min(1.0, max_side / max(h, w))
+    return max(1, round(h * r)), max(1, round(w * r))
+
+def label_path_for(img_path, label_dir=None):
+    stem = os.path.splitext(os.path.basename(img_path))[0]
+    if label_dir:
+        return os.path.join(label_dir, stem + ".txt")
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return os.path.splitext(sb.join(os.path.abspath(img_path).rsplit(sa, 1)))[0] + ".txt"
+
+def load_gt(label_path, shape, device):
+    """读取 YOLO 分割标签并在 shape 分辨率上栅格化，返回 (cls (G,), masks (G, h, w) bool)"""
+    h, w = shape
+    cls, masks = [], []
+    if os.path.exists(label_path):
+        with open(label_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                n = (len(parts) - 1) // 2
+                if n < 3:
+                    continue
+                pts = np.asarray(parts[1:1 + 2 * n], dtype=np.float64).reshape(n, 2) * (w, h)
+                mask = np.zeros((h, w), dtype=np.uint8)
+                cv2.fillPoly(mask, [np.round(pts).astype(np.int32)], 1)
+                cls.append(int(float(parts[0])))
+                masks.append(mask)
+    if not masks:
+        return np.zeros(0, dtype=np.int64), torch.zeros((0, h, w), dtype=torch.bool, device=device)
+    return np.asarray(cls), torch.from_numpy(np.stack(masks)).to(device).bool()
+
+def prediction_masks(result, shape):
+    """把网络输入分辨率 (带灰边) 的预测 mask 去掉灰边并缩放到 shape，返回 (P, h, w) bool"""
+    if result.masks is None or len(result.masks) == 0:
+        return torch.zeros((0, *shape), dtype=torch.bool, device=result.boxes.data.device)
+    return scale_masks(result.masks.data[None].float(), shape)[0] > 0.5
+
+def list_images(source, shard=None):
+    images = sorted(p for p in glob.glob(os.path.join(source, "*"))
+                    if p.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+    if shard:
+        i, n = shard
+        images = images[i::n]
+    return images
+
+# ---------- 主流程 ----------
+def evaluate(model_path, source, output_dir, label_dir=None, shard=None, device=None):
+    model = YOLO(model_path)
+    images = list_images(source, shard)
+    if not images:
+        print(f"错误: 在 {source} 下没有找到图片")
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    tag = f"_shard{shard[0]}of{shard[1]}" if shard else ""
+    evaluator = StreamingSegEvaluator(model.names)
+    names = [model.names[c] for c in range(len(model.names))]
+    print(f"开始流式评估 {len(images)} 张图片{f' (分片 {shard[0]}/{shard[1]})' if shard else ''}...")
+
+    # 使用 generator (生成器) 模式
+    # 注意：stream=True 时，必须用 for 循环遍历结果，否则推理不会开始
+    # 预测图由下面的循环按 CONF_THRESHOLD 过滤后自己保存，不用 predict(save=True) (会把 EVAL_CONF 以上的框全画出来)
+    image_dir = os.path.join(output_dir, "images")
+    if SAVE_IMAGES:
+        os.makedirs(image_dir, exist_ok=True)
+    results = model.predict(
+        source=images,
+        imgsz=IMGSZ,
+        stream=True,    # 【关键】开启流式模式，用完即扔，不占内存
+        device=device if device is not None else (0 if torch.cuda.is_available() else 'cpu'),
+        conf=EVAL_CONF,
+        retina_masks=False,  # 不生成原图分辨率的 mask，在 EVAL_MAX_SIDE 分辨率上比较
+        verbose=False,
+    )
+
+    with open(os.path.join(output_dir, f"coverage_error{tag}.csv"), 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['filename'] + [f"{n}_error_%" for n in names])
+        for k, result in enumerate(results, 1):
+            shape = eval_shape(result.orig_shape)
+            pred_masks = prediction_masks(result, shape)
+            gt_cls, gt_masks = load_gt(label_path_for(result.path, label_dir), shape, pred_masks.device)
+            boxes = result.boxes
+            error = evaluator.update(boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy(), pred_masks, gt_cls, gt_masks)
+            writer.writerow([os.path.basename(result.path)] + [f"{100 * e:.3f}" for e in error])
+            if SAVE_IMAGES:
+                shown = result[boxes.conf >= CONF_THRESHOLD]
+                cv2.imwrite(os.path.join(image_dir, os.path.basename(result.path)), shown.plot())
+            if k % 50 == 0:
+                print(f"  -> 已评估 {k} 张...", end='\r')
+
+    state_path = os.path.join(output_dir, f"eval_state{tag}.npz")
+    evaluator.save(state_path)
+    print(f"\n评估状态已保存: {state_path} (可用 --merge 与其他分片合并)")
+    report(evaluator, output_dir)
+    return evaluator
+
+def report(evaluator, output_dir):
+    rows = evaluator.summary()
+    with open(os.path.join(output_dir, "metrics.csv"), 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    labels = list(evaluator.class_names.values()) + ['background']
+    with open(os.path.join(output_dir, "confusion_matrix.csv"), 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['预测 \\ 真值'] + labels)
+        for name, row in zip(labels, evaluator.confusion):
+            writer.writerow([name] + row.tolist())
+
+    print(f"\n====== 评估结果 ({int(evaluator.n_images[0])} 张) ======")
+    print(f"{'类别':<28}{'实例':>6}{'AP50':>8}{'AP50-95':>9}{'覆盖MAE%':>10}{'偏差%':>8}")
+    for r in rows:
+        print(f"{r['class']:<28}{r['gt_instances']:>6}{r['mask_AP50']:>8.3f}{r['mask_AP50-95']:>9.3f}"
+              f"{r['coverage_MAE_%']:>10.2f}{r['coverage_bias_%']:>+8.2f}")
+    ap = evaluator.average_precision()
+    valid = evaluator.n_gt > 0
+    if valid.any():
+        print(f"mask mAP50: {np.nanmean(ap[valid, 0]):.4f} | mask mAP50-95: {np.nanmean(ap[valid]):.4f}")
+    print(f"✅ 指标和混淆矩阵已保存至: {output_dir}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式计算 mask mAP、混淆矩阵和覆盖度误差")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--source', default=SOURCE, help="图片文件夹")
+    parser.add_argument('--labels', default=None, help="标签文件夹 (默认按 /images/ -> /labels/ 查找)")
+    parser.add_argument('--output', default=OUTPUT_DIR)
+    parser.add_argument('--shard', default=None, help="只评估第 i 个分片，格式 i/n (从 0 开始)")
+    parser.add_argument('--merge', nargs='+', default=None, help="合并多个 eval_state*.npz 并输出总指标")
+    args = parser.parse_args()
+
+    if args.merge:
+        merged = StreamingSegEvaluator.load(args.merge[0])
+        for path in args.merge[1:]:
+            merged.merge(StreamingSegEvaluator.load(path))
+        os.makedirs(args.output, exist_ok=True)
+        merged.save(os.path.join(args.output, "eval_state.npz"))
+        report(merged, args.output)
+    else:
+        shard = tuple(int(v) for v in args.shard.split('/')) if args.shard else None
+        evaluate(args.model, args.source, args.output, args.labels, shard)
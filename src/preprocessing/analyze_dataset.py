@@ -1,7 +1,8 @@
 import os
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from tqdm import tqdm
+from yolo_labels import load_manifest
 
 # === 配置 ===
 LABEL_DIR = "output_json2txt/yolotxt"  # 你的txt文件夹路径
@@ -9,32 +10,19 @@ CLASSES = ["Phragmites australis", "Miscanthus sacchariflorus", "Typha orientali
 # ===========
 
 def analyze():
-    class_counts = {name: 0 for name in CLASSES}
-    box_sizes = [] # 存储所有框的面积 (w * h)
-
-    txt_files = [f for f in os.listdir(LABEL_DIR) if f.endswith('.txt')]
-    
     print("正在分析标签分布...")
-    for txt in tqdm(txt_files):
-        with open(os.path.join(LABEL_DIR, txt), 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) < 5: continue # 格式不对
-                
-                # 统计类别
-                cls_id = int(parts[0])
-                if cls_id < len(CLASSES):
-                    class_counts[CLASSES[cls_id]] += 1
-                
-                # 统计目标大小 (YOLO分割格式: class x1 y1 x2 y2 ...)
-                # 粗略计算外接矩形宽高
-                coords = [float(x) for x in parts[1:]]
-                xs = coords[0::2]
-                ys = coords[1::2]
-                w = max(xs) - min(xs)
-                h = max(ys) - min(ys)
-                box_sizes.append(w * h)
+    # 批量解析 + 清单缓存: 标签没有变化时直接读取上次的统计结果
+    manifest = load_manifest(LABEL_DIR)
+    # 与逐行解析时一致: 至少 2 个点的实例才参与统计
+    valid = manifest.n_vertices >= 2
+
+    # 统计类别
+    hist = np.bincount(manifest.cls[valid & (manifest.cls < len(CLASSES))], minlength=len(CLASSES))
+    class_counts = {name: int(hist[i]) for i, name in enumerate(CLASSES)}
+
+    # 统计目标大小 (YOLO分割格式: class x1 y1 x2 y2 ...)
+    # 多边形外接矩形的面积 (w * h)
+    box_sizes = manifest.box_areas()[valid]
 
     # === 绘图 ===
     plt.figure(figsize=(12, 5))
@@ -64,7 +52,7 @@ def analyze():
         if ratio < 0.1:
             print(f"  [警告] {name} 样本过少 (<10%)，可能导致该类别检测效果极差！建议复制粘贴增强数据。")
             
-    small_obj = sum(1 for s in box_sizes if s < 0.01) # 面积小于全图1%的算小目标
+    small_obj = int(np.count_nonzero(box_sizes < 0.01)) # 面积小于全图1%的算小目标
     print(f"\n小目标数量: {small_obj} (占比 {small_obj/len(box_sizes):.1%})")
     if small_obj/len(box_sizes) > 0.5:
         print("  [警告] 超过50%的目标是非常小的物体。")
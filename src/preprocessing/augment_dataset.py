@@ -1,6 +1,9 @@
 import os
+import sys
 import shutil
+import numpy as np
 from tqdm import tqdm
+from yolo_labels import load_manifest
 
 # === 配置区域 ===
 # 你的数据集路径 (指向你 split 之后的 train 文件夹，或者清洗后的总文件夹)
@@ -24,11 +27,113 @@ AUGMENT_RULES = {
     2: 15,  # Typha (只有24个，必须疯狂复制)
     4: 2    # Alternanthera
 }
+
+# 过采样方式:
+#   "virtual": 不复制文件，只生成加权的训练图片列表 (同一张图在列表中重复 1 + 倍数 次)，
+#              效果与物理复制相同，磁盘占用为 0。需要先运行 split_dataset.py，只对训练集加权。
+#   "copy"   : 原来的物理复制 (_augcopy_ 副本)
+OVERSAMPLE_MODE = "virtual"
+# split_dataset.py 的输出目录，加权列表写到这里 (chenhu_seg.yaml 的 train 指向它即可)
+DATASET_ROOT = "datasets/chenhu_seg"
+WEIGHTED_LIST = os.path.join(DATASET_ROOT, "train_weighted.txt")
+# 生成列表时所依据的划分指纹 (split_dataset.py 写入 split.fingerprint)，train_model.py 据此判断列表是否过期
+SPLIT_FINGERPRINT = os.path.join(DATASET_ROOT, "split.fingerprint")
+WEIGHTED_FINGERPRINT = os.path.join(DATASET_ROOT, "train_weighted.fingerprint")
+# 生成加权列表前删除源文件夹中以前物理复制产生的 _augcopy_ 文件 (默认不删，需要时用 --clean 单独清理)
+CLEAN_AUGCOPY = False
 # =================
 
+AUGCOPY_TAG = "_augcopy_"
+
+def image_multiplier(classes):
+    """一张图的扩充倍数: 如果一张图里同时有多个稀有类，取最大的倍数"""
+    return max((AUGMENT_RULES[c] for c in classes if c in AUGMENT_RULES), default=0)
+
+def clean_augcopies():
+    """删除物理过采样生成的 _augcopy_ 图片和标签"""
+    removed = 0
+    for folder in (SOURCE_IMAGES, SOURCE_LABELS):
+        for name in os.listdir(folder):
+            if AUGCOPY_TAG in name:
+                os.remove(os.path.join(folder, name))
+                removed += 1
+    print(f"已删除 {removed} 个 _augcopy_ 文件")
+    return removed
+
+def read_train_entries():
+    """
+    读取当前训练集的图片条目 (写入列表文件的路径)。
+    list 模式读 train.txt；文件夹模式 (copy/hardlink/symlink) 列出 train/images。
+    """
+    list_path = os.path.join(DATASET_ROOT, "train.txt")
+    if os.path.exists(list_path):
+        with open(list_path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    img_dir = os.path.join(DATASET_ROOT, "train", "images")
+    if not os.path.isdir(img_dir):
+        return None
+    return [f"./train/images/{name}" for name in sorted(os.listdir(img_dir))
+            if name.lower().endswith(('.jpg', '.png', '.jpeg', '.bmp'))]
+
+def virtual_oversample():
+    """
+    生成加权训练列表: 每张图重复 1 + 倍数 次 (与物理复制后的出现次数一致)。
+    YOLO 读取列表文件时保留重复条目，每个 epoch 中稀有类别的图片按倍数多次出现，
+    并且每次都会经过不同的随机增强。
+    """
+    print("开始进行虚拟过采样 (加权列表)...")
+    if CLEAN_AUGCOPY:
+        clean_augcopies()
+
+    entries = read_train_entries()
+    if entries is None:
+        print(f"找不到训练集 ({DATASET_ROOT}/train.txt 或 train/images)，请先运行 split_dataset.py")
+        return
+
+    # 虚拟过采样代替物理副本: 划分结果里残留的 _augcopy_ 条目不再计入
+    copies = [e for e in entries if AUGCOPY_TAG in os.path.basename(e)]
+    if copies:
+        entries = [e for e in entries if AUGCOPY_TAG not in os.path.basename(e)]
+        print(f"忽略训练集中的 {len(copies)} 个 _augcopy_ 条目 "
+              f"(可运行 python augment_dataset.py --clean 删除副本后重新运行 split_dataset.py)")
+
+    manifest = load_manifest(SOURCE_LABELS)
+    file_pos = {os.path.splitext(name)[0]: i for i, name in enumerate(manifest.files)}
+    num_classes = max(max(AUGMENT_RULES) + 1, int(manifest.cls.max()) + 1 if manifest.num_instances else 0)
+
+    lines = []
+    before = np.zeros(num_classes)
+    after = np.zeros(num_classes)
+    for entry in tqdm(entries):
+        stem = os.path.splitext(os.path.basename(entry))[0]
+        i = file_pos.get(stem)
+        classes = manifest.file_classes(i) if i is not None else np.zeros(0, np.int16)
+        repeat = 1 + image_multiplier(set(classes.tolist()))
+        lines.extend([entry] * repeat)
+        counts = np.bincount(classes, minlength=num_classes)[:num_classes] if len(classes) else 0
+        before += counts
+        after += counts * repeat
+
+    with open(WEIGHTED_LIST, 'w', encoding='utf-8') as f:
+        f.writelines(line + "\n" for line in lines)
+    if os.path.exists(SPLIT_FINGERPRINT):
+        shutil.copyfile(SPLIT_FINGERPRINT, WEIGHTED_FINGERPRINT)
+    else:
+        print(f"警告: 找不到 {SPLIT_FINGERPRINT} (旧版 split_dataset.py 的划分)，train_model.py 不会使用该列表，"
+              f"请重新运行 split_dataset.py 和本脚本")
+
+    print(f"\n完成！训练集 {len(entries)} 张 -> 加权列表 {len(lines)} 条: {WEIGHTED_LIST}")
+    print("每个类别每个 epoch 的实例数 (加权前 -> 加权后):")
+    for k in range(num_classes):
+        print(f"  类别 {k}: {before[k]:.0f} -> {after[k]:.0f}")
+    print("请把 chenhu_seg.yaml 中的 train 改为 train_weighted.txt (train_model.py 会自动使用该列表)。")
+
 def oversample():
     print("开始进行物理过采样...")
-    txt_files = [f for f in os.listdir(SOURCE_LABELS) if f.endswith('.txt')]
+    # 每个标签文件包含的类别直接从清单读取，不再逐行解析
+    manifest = load_manifest(SOURCE_LABELS)
+    txt_files = manifest.files
+    file_pos = {name: i for i, name in enumerate(manifest.files)}
     
     # 统计
     aug_count = 0
@@ -37,17 +142,9 @@ def oversample():
         txt_path = os.path.join(SOURCE_LABELS, txt_file)
         
         # 1. 检查该文件里有没有稀有类别
-        has_rare_class = False
-        max_multiplier = 0
-        
-        with open(txt_path, 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                cls_id = int(line.split()[0])
-                if cls_id in AUGMENT_RULES:
-                    has_rare_class = True
-                    # 如果一张图里同时有多个稀有类，取最大的倍数
-                    max_multiplier = max(max_multiplier, AUGMENT_RULES[cls_id])
+        classes = set(manifest.file_classes(file_pos[txt_file]).tolist())
+        max_multiplier = image_multiplier(classes)
+        has_rare_class = max_multiplier > 0
         
         # 2. 如果有，进行复制
         if has_rare_class:
@@ -80,4 +177,10 @@ def oversample():
     print("请重新运行 split_dataset.py 划分训练集和验证集。")
 
 if __name__ == "__main__":
-    oversample()
\ No newline at end of file
+    # python augment_dataset.py --clean  只删除 _augcopy_ 副本
+    if "--clean" in sys.argv[1:]:
+        clean_augcopies()
+    elif OVERSAMPLE_MODE == "virtual":
+        virtual_oversample()
+    else:
+        oversample()
@@ -1,10 +1,18 @@
 import os
+import sys
 import json
+import hashlib
 import shutil
 import cv2
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm  # 如果没有安装，请 pip install tqdm，或者删除相关代码
 
+try:
+    from PIL import Image  # 只读文件头获取图片尺寸 (Ultralytics 已依赖 Pillow)
+except ImportError:
+    Image = None
+
 # ================= 项目配置区域 (请修改这里) =================
 
 # 1. 你的类别名称 (必须与标注时的英文标签完全一致)
@@ -20,6 +28,17 @@ OUTPUT_ROOT = "output_json2txt"
 OUTPUT_TXT_DIR = os.path.join(OUTPUT_ROOT, "yolotxt")
 OUTPUT_IMG_DIR = os.path.join(OUTPUT_ROOT, "output_images")
 
+# 4. 性能配置
+# 并行转换的进程数 (1 = 串行)
+NUM_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+# 图片输出方式: "copy" 复制 (默认); "hardlink" 硬链接 (不占额外空间，秒级完成；跨磁盘时自动退回复制)
+# 注意: 硬链接与原图是同一个文件，之后原地修改输出图片 (例如原地写入的数据增强) 会同时改掉 IMAGE_FOLDER 中的原图
+IMAGE_MODE = "copy"
+# 增量转换: 根据清单只处理新增或内容有变化的 JSON/图片，并清理源文件已删除的输出
+INCREMENTAL = True
+MANIFEST_PATH = os.path.join(OUTPUT_ROOT, ".conversion_manifest.json")
+MANIFEST_VERSION = 1
+
 # ==========================================================
 
 def setup_directories():
@@ -41,8 +60,45 @@ def find_image_file(base_name, img_folder):
             return img_path
     return None
 
-def convert_single_file(json_file):
-    """处理单个文件，返回是否成功及统计信息"""
+def probe_image_size(img_path):
+    """只读取文件头获取 (h, w)，不解码整张图片；失败时返回 None"""
+    if Image is not None:
+        try:
+            with Image.open(img_path) as im:
+                w, h = im.size
+            return h, w
+        except Exception:
+            return None
+    img = cv2.imread(img_path)
+    return None if img is None else img.shape[:2]
+
+def polygon_to_yolo_line(class_id, points, w, h):
+    """一次完成整个多边形的归一化、裁剪到 0-1 和格式化；不足 3 个点时返回 None"""
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 3:
+        return None
+    norm = np.clip(pts / np.array([w, h], dtype=np.float64), 0, 1).ravel()
+    return f"{class_id} " + " ".join(["%.6f"] * len(norm)) % tuple(norm)
+
+def export_image(src_img_path, dst_img_path, mode=IMAGE_MODE):
+    """复制或硬链接图片到输出目录"""
+    if mode == "hardlink":
+        try:
+            if os.path.exists(dst_img_path):
+                if os.path.samefile(src_img_path, dst_img_path):
+                    return
+                os.remove(dst_img_path)
+            os.link(src_img_path, dst_img_path)
+            return
+        except OSError:
+            pass  # 跨磁盘或文件系统不支持硬链接，退回复制
+    shutil.copy2(src_img_path, dst_img_path)
+
+def convert_single_file(json_file, export_image_file=True):
+    """
+    处理单个文件，返回生成的输出文件 (相对 OUTPUT_ROOT 的路径列表)，被筛除时返回空列表。
+    export_image_file=False 时，若输出目录里已有这张图片则不再复制 (图片内容没有变化)。
+    """
     json_path = os.path.join(JSON_FOLDER, json_file)
     file_name_no_ext = os.path.splitext(json_file)[0]
     
@@ -52,27 +108,27 @@ def convert_single_file(json_file):
             data = json.load(f)
     except Exception as e:
         print(f"\n[警告] JSON损坏无法读取: {json_file}")
-        return False
+        return []
 
     # 2. 寻找对应的图片
     src_img_path = find_image_file(file_name_no_ext, IMAGE_FOLDER)
     if not src_img_path:
         # 如果只有json没有图，跳过
-        return False
+        return []
 
-    # 3. 获取图像宽高 (优先从JSON读，读不到再读图)
+    # 3. 获取图像宽高 (优先从JSON读，读不到再读图片文件头)
     h, w = data.get('imageHeight'), data.get('imageWidth')
     if not h or not w:
-        img = cv2.imread(src_img_path)
-        if img is None: return False
-        h, w = img.shape[:2]
+        size = probe_image_size(src_img_path)
+        if size is None: return []
+        h, w = size
 
     # 4. 解析 Shapes
     yolo_lines = []
     shapes = data.get('shapes', [])
     
     if not shapes:
-        return False # 空标签文件，跳过
+        return [] # 空标签文件，跳过
 
     for shape in shapes:
         label = shape.get('label')
@@ -83,18 +139,11 @@ def convert_single_file(json_file):
             continue
             
         class_id = CLASSES.index(label)
-        np_points = np.array(points)
         
         # 归一化坐标并限制在 0-1 之间
-        normalized_points = []
-        for p in np_points:
-            x = max(0, min(1, p[0] / w))
-            y = max(0, min(1, p[1] / h))
-            normalized_points.extend([x, y])
-            
         # 只有构成多边形(至少3个点 -> 6个数值)才算有效
-        if len(normalized_points) >= 6:
-            line_str = f"{class_id} " + " ".join([f"{val:.6f}" for val in normalized_points])
+        line_str = polygon_to_yolo_line(class_id, points, w, h)
+        if line_str is not None:
             yolo_lines.append(line_str)
 
     # 5. 保存结果
@@ -105,44 +154,176 @@ def convert_single_file(json_file):
         with open(os.path.join(OUTPUT_TXT_DIR, txt_filename), 'w', encoding='utf-8') as f:
             f.write("\n".join(yolo_lines))
         
-        # 复制 图片
+        # 复制 (或硬链接) 图片
         dst_img_path = os.path.join(OUTPUT_IMG_DIR, os.path.basename(src_img_path))
-        shutil.copy2(src_img_path, dst_img_path)
+        if export_image_file or not os.path.exists(dst_img_path):
+            export_image(src_img_path, dst_img_path)
         
-        return True
+        return [os.path.relpath(os.path.join(OUTPUT_TXT_DIR, txt_filename), OUTPUT_ROOT),
+                os.path.relpath(dst_img_path, OUTPUT_ROOT)]
     else:
         # JSON存在但没有有效类别（比如全是不关心的杂草），跳过
+        return []
+
+def file_stat(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def conversion_signature():
+    """影响输出内容的配置，变化后需要全部重新转换"""
+    return {'version': MANIFEST_VERSION, 'classes': CLASSES, 'image_folder': os.path.abspath(IMAGE_FOLDER)}
+
+def load_manifest():
+    """
+    返回 (清单条目, 配置是否一致)。配置变化时条目不能用于跳过转换，
+    但其中记录的输出文件仍用于清理孤立的输出。
+    """
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}, False
+    return manifest.get('files', {}), manifest.get('signature') == conversion_signature()
+
+def save_manifest(entries):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'signature': conversion_signature(), 'files': entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def is_unchanged(entry, json_stat):
+    """快速判断: JSON 和图片的 mtime/大小都没变，且输出文件都还在"""
+    if entry is None or entry['json_stat'] != json_stat:
         return False
+    image = entry.get('image')
+    if image:
+        try:
+            if file_stat(image) != entry['image_stat']:
+                return False
+        except OSError:
+            return False
+    elif find_image_file(os.path.splitext(entry['json'])[0], IMAGE_FOLDER):
+        return False  # 之前缺图，现在补上了
+    return all(os.path.exists(os.path.join(OUTPUT_ROOT, out)) for out in entry['outputs'])
 
-def main():
+def process_json(task):
+    """
+    增量转换的工作函数: 计算 JSON 和图片的内容哈希，与清单一致时只刷新 mtime 记录，
+    否则重新转换。返回 (状态, 文件名, 新清单条目)。
+    """
+    json_file, old = task
+    json_path = os.path.join(JSON_FOLDER, json_file)
+    src_img_path = find_image_file(os.path.splitext(json_file)[0], IMAGE_FOLDER)
+    entry = {
+        'json': json_file, 'json_stat': file_stat(json_path), 'json_hash': file_digest(json_path),
+        'image': src_img_path,
+        'image_stat': file_stat(src_img_path) if src_img_path else None,
+        'image_hash': file_digest(src_img_path) if src_img_path else None,
+    }
+    same_image = old is not None and old.get('image') == src_img_path and old.get('image_hash') == entry['image_hash']
+    if same_image and old['json_hash'] == entry['json_hash'] and \
+            all(os.path.exists(os.path.join(OUTPUT_ROOT, out)) for out in old['outputs']):
+        # 只是 mtime 变了 (例如重新保存但内容相同)
+        entry['outputs'] = old['outputs']
+        return 'touched', json_file, entry
+
+    entry['outputs'] = convert_single_file(json_file, export_image_file=not same_image)
+    if not entry['outputs']:
+        status = 'skipped'
+    else:
+        status = 'updated' if old is not None else 'new'
+    return status, json_file, entry
+
+def remove_outputs(outputs, keep):
+    """删除不再需要的输出文件 (只删除清单里记录过的文件)"""
+    removed = 0
+    for out in outputs:
+        if out in keep:
+            continue
+        path = os.path.join(OUTPUT_ROOT, out)
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+def main(workers=NUM_WORKERS, incremental=INCREMENTAL):
     setup_directories()
     
-    # 获取所有 json 文件
-    json_files = [f for f in os.listdir(JSON_FOLDER) if f.endswith('.json')]
+    # 获取所有 json 文件 (连同 mtime/大小，一次目录扫描)
+    json_stats = {}
+    with os.scandir(JSON_FOLDER) as it:
+        for entry in it:
+            if entry.name.endswith('.json') and entry.is_file():
+                st = entry.stat()
+                json_stats[entry.name] = [st.st_mtime_ns, st.st_size]
+    json_files = sorted(json_stats)
     total_files = len(json_files)
     
-    print(f"检测到 {total_files} 个 JSON 文件，开始处理...")
+    # 上一次的清单: 增量模式下用于跳过未变化的文件；不论哪种模式都用于清理孤立的输出
+    previous_entries, compatible = load_manifest()
+    if incremental and previous_entries and not compatible:
+        print("转换配置 (类别/路径) 已变化，全部重新转换。")
+    old_entries = previous_entries if incremental and compatible else {}
+    
+    # 1. 快速筛选: mtime/大小都没变的文件直接跳过，不读内容
+    tasks, entries = [], {}
+    for json_file in json_files:
+        old = old_entries.get(json_file)
+        if is_unchanged(old, json_stats[json_file]):
+            entries[json_file] = old
+        else:
+            tasks.append((json_file, old))
+    unchanged_count = len(entries)
+    
+    print(f"检测到 {total_files} 个 JSON 文件，其中 {len(tasks)} 个新增或有变化，开始处理...")
     
-    converted_count = 0
-    skipped_count = 0
+    counts = {'new': 0, 'updated': 0, 'touched': 0, 'skipped': 0}
     
+    # 多进程并行转换 (每个文件互不依赖)，结果按原顺序返回
+    if workers > 1 and len(tasks) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        outcomes = pool.map(process_json, tasks, chunksize=max(1, min(64, len(tasks) // (workers * 4))))
+    else:
+        pool = None
+        outcomes = map(process_json, tasks)
+
     # 使用 tqdm 显示进度条
-    pbar = tqdm(json_files)
-    for json_file in pbar:
-        success = convert_single_file(json_file)
-        if success:
-            converted_count += 1
-        else:
-            skipped_count += 1
-        pbar.set_description(f"有效: {converted_count} | 跳过: {skipped_count}")
+    pbar = tqdm(outcomes, total=len(tasks))
+    for status, json_file, entry in pbar:
+        counts[status] += 1
+        entries[json_file] = entry
+        pbar.set_description(f"新增: {counts['new']} | 更新: {counts['updated']} | 跳过: {counts['skipped']}")
+    if pool:
+        pool.shutdown()
+
+    # 2. 清理孤立的输出: 上一次清单里有、这一次没有生成的文件
+    #    (源 JSON 已删除、标注全部删掉了、图片换了扩展名等)，--full 重建时同样清理
+    deleted = [name for name in previous_entries if name not in json_stats]
+    still_used = {out for e in entries.values() for out in e['outputs']}
+    removed_count = remove_outputs({out for e in previous_entries.values() for out in e.get('outputs', [])},
+                                   still_used)
+
+    save_manifest(entries)
+    converted_count = sum(1 for e in entries.values() if e['outputs'])
 
     print("\n" + "="*30)
     print(f"处理完成！")
     print(f"源文件总数: {total_files}")
-    print(f"成功转换并保存: {converted_count}")
-    print(f"被筛除(无标/空标/图片缺失): {skipped_count}")
+    print(f"未变化 (直接跳过): {unchanged_count}")
+    print(f"新增转换: {counts['new']} | 重新转换: {counts['updated']} | 内容未变仅更新时间: {counts['touched']}")
+    print(f"源文件已删除: {len(deleted)} 个，清理输出文件 {removed_count} 个")
+    print(f"当前有效样本: {converted_count}")
+    print(f"被筛除(无标/空标/图片缺失): {total_files - converted_count}")
     print(f"结果保存在: {os.path.abspath(OUTPUT_ROOT)}")
     print("="*30)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python json2txtyolo.py --full  忽略清单，全部重新转换
+    main(incremental="--full" not in sys.argv[1:])
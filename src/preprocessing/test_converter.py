@@ -3,6 +3,7 @@ import cv2
 import numpy as np
 import random
 from tqdm import tqdm
+from yolo_labels import read_label_file
 
 # ================= 配置区域 =================
 # 1. 必须与你转换时的类别顺序完全一致！
@@ -70,27 +71,17 @@ def visualize():
         # 创建一个用于画半透明遮罩的图层
         overlay = img.copy()
 
-        # 3. 读取并解析 TXT
-        with open(os.path.join(TXT_DIR, txt_file), 'r') as f:
-            lines = f.readlines()
+        # 3. 读取并解析 TXT (整个文件一次解析为 类别 + 扁平坐标数组)
+        cls, vert_start, xy = read_label_file(os.path.join(TXT_DIR, txt_file))
 
-        for line in lines:
-            parts = line.strip().split()
-            if len(parts) < 3: continue
+        # 4. 反归一化坐标 (x * w, y * h)，所有实例一次完成
+        # YOLO格式: class x1 y1 x2 y2 ... xn yn
+        pixel_xy = (xy * np.array([w, h], dtype=np.float32)).astype(np.int32)
 
-            class_id = int(parts[0])
-            coords = [float(x) for x in parts[1:]]
-
-            # 4. 反归一化坐标 (x * w, y * h)
-            # YOLO格式: class x1 y1 x2 y2 ... xn yn
-            points = []
-            for i in range(0, len(coords), 2):
-                pt_x = int(coords[i] * w)
-                pt_y = int(coords[i+1] * h)
-                points.append([pt_x, pt_y])
-            
-            pts_np = np.array(points, np.int32)
-            pts_np = pts_np.reshape((-1, 1, 2))
+        for k in range(len(cls)):
+            class_id = int(cls[k])
+            points = pixel_xy[vert_start[k]:vert_start[k + 1]]
+            pts_np = points.reshape((-1, 1, 2))
 
             # 5. 绘制
             color = colors[class_id] if class_id < len(colors) else [255, 255, 255]
@@ -101,7 +92,7 @@ def visualize():
             cv2.polylines(img, [pts_np], True, color, 2)
             
             # 写类别名称
-            text_pos = (points[0][0], points[0][1] - 5)
+            text_pos = (int(points[0][0]), int(points[0][1]) - 5)
             cv2.putText(img, CLASSES[class_id], text_pos, cv2.FONT_HERSHEY_SIMPLEX, 
                         0.6, (255, 255, 255), 2)
 
@@ -1,7 +1,10 @@
 import cv2
 import os
 import glob
+import time
+import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # ================= 修复后的配置区域 =================
 # 获取当前脚本文件所在的绝对路径
@@ -12,51 +15,124 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 VIDEO_DIR = os.path.join(BASE_DIR, 'videos')
 OUTPUT_DIR = os.path.join(BASE_DIR, 'images')
 
-TIME_INTERVAL = 3.0 
+TIME_INTERVAL = 3.0
 JPEG_QUALITY = 95
+
+# 抽帧模式:
+#   "read" : 原始方式，每一帧都完整解码 (最慢，作为对照)
+#   "grab" : 每帧只 grab() 推进解码器，只有需要保存的帧才 retrieve() 转成图像 (推荐)
+#   "seek" : 直接 set(CAP_PROP_POS_FRAMES) 跳到目标帧，适合关键帧很密的素材
+#            注意: 部分编码下 seek 会落在最近的关键帧上，帧号可能有少量偏差
+SAMPLING_MODE = "grab"
+
+# 同时处理的视频数量 (进程池大小)，1 表示串行
+NUM_WORKERS = 4
 # ===================================================
 
-def extract_frames_from_video(video_path, output_folder, interval_sec):
+def iter_sampled_frames(cap, frame_step, mode=SAMPLING_MODE):
+    """按指定模式遍历视频，只产出需要保存的帧: (帧号, 图像)"""
+    if mode == "seek":
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for target in range(0, total_frames, frame_step):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            ret, frame = cap.read()
+            if not ret: break
+            yield target, frame
+        return
+
+    current_frame = 0
+    while True:
+        if mode == "grab":
+            # grab() 只推进码流，不做颜色转换和拷贝；被丢弃的帧开销最小
+            if not cap.grab(): break
+            if current_frame % frame_step == 0:
+                ret, frame = cap.retrieve()
+                if not ret: break
+                yield current_frame, frame
+        else:
+            ret, frame = cap.read()
+            if not ret: break
+            if current_frame % frame_step == 0:
+                yield current_frame, frame
+        current_frame += 1
+
+def extract_frames_from_video(video_path, output_folder, interval_sec, mode=SAMPLING_MODE):
     video_name = Path(video_path).stem
     cap = cv2.VideoCapture(video_path)
-    
+
     if not cap.isOpened():
         print(f"[Error] 无法打开视频: {video_path}")
-        return
+        return 0
     # 获取视频的帧率 (FPS)
     fps = cap.get(cv2.CAP_PROP_FPS)
     if fps == 0:
         print(f"[Error] 无法获取FPS，跳过: {video_path}")
-        return
+        cap.release()
+        return 0
 
     frame_step = int(fps * interval_sec)
     if frame_step < 1: frame_step = 1
 
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    print(f"正在处理: {video_name} | FPS: {fps:.2f} | 总帧数: {total_frames}")
+    print(f"正在处理: {video_name} | FPS: {fps:.2f} | 总帧数: {total_frames} | 模式: {mode}")
 
-    current_frame = 0
     saved_count = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-
-        if current_frame % frame_step == 0:
-            out_name = f"{video_name}_{str(current_frame).zfill(6)}.jpg"
-            out_path = os.path.join(output_folder, out_name)
-            cv2.imwrite(out_path, frame, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-            saved_count += 1
-        current_frame += 1
+    for current_frame, frame in iter_sampled_frames(cap, frame_step, mode):
+        out_name = f"{video_name}_{str(current_frame).zfill(6)}.jpg"
+        out_path = os.path.join(output_folder, out_name)
+        cv2.imwrite(out_path, frame, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+        saved_count += 1
 
     cap.release()
     print(f"完成: {video_name} -> {saved_count} 张图片")
+    return saved_count
+
+def benchmark_sampling(video_path, interval_sec=TIME_INTERVAL, modes=("read", "grab", "seek")):
+    """
+    对同一个视频分别用不同抽帧模式跑一遍 (不写盘)，打印吞吐量。
+    帧/秒 按视频总帧数计算，即"每秒能扫过多少帧源视频"。
+    """
+    print(f"\n=== 抽帧性能测试: {os.path.basename(video_path)} (间隔 {interval_sec}s) ===")
+    results = {}
+    for mode in modes:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"[Error] 无法打开视频: {video_path}")
+            return results
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_step = max(1, int(fps * interval_sec))
+
+        start = time.perf_counter()
+        kept = sum(1 for _ in iter_sampled_frames(cap, frame_step, mode))
+        elapsed = time.perf_counter() - start
+        cap.release()
+
+        results[mode] = {
+            'seconds': elapsed,
+            'frames_per_sec': total_frames / elapsed if elapsed > 0 else 0.0,
+            'kept': kept,
+        }
+        print(f"  {mode:>4}: {elapsed:7.2f}s | {results[mode]['frames_per_sec']:8.1f} 帧/秒 | 保留 {kept} 帧")
+
+    if "read" in results and results["read"]['seconds'] > 0:
+        for mode, r in results.items():
+            if mode != "read" and r['seconds'] > 0:
+                print(f"  {mode} 相对 read 加速: {results['read']['seconds'] / r['seconds']:.2f}x")
+    return results
 
 def main():
+    parser = argparse.ArgumentParser(description="批量视频抽帧")
+    parser.add_argument('--mode', choices=["read", "grab", "seek"], default=SAMPLING_MODE, help="抽帧模式")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help="并行处理的视频数")
+    parser.add_argument('--benchmark', action='store_true', help="只对第一个视频做抽帧模式性能对比，不保存图片")
+    args = parser.parse_args()
+
     # --- 调试信息打印 ---
     print(f"脚本所在路径: {BASE_DIR}")
     print(f"寻找视频路径: {VIDEO_DIR}")
-    
+
     if not os.path.exists(VIDEO_DIR):
         print(f"\n[致命错误] 找不到 videos 文件夹！")
         print(f"请确认你的文件夹名字是否完全叫 'videos' (注意大小写)")
@@ -71,7 +147,7 @@ def main():
     video_files = []
     for ext in exts:
         video_files.extend(glob.glob(os.path.join(VIDEO_DIR, ext)))
-    
+
     video_files = sorted(list(set(video_files))) # 去重并排序
 
     if not video_files:
@@ -79,12 +155,31 @@ def main():
         print(f"请检查视频后缀名。该文件夹下的文件有: {os.listdir(VIDEO_DIR)}")
         return
 
-    print(f"共发现 {len(video_files)} 个视频文件，开始处理...\n")
+    if args.benchmark:
+        benchmark_sampling(video_files[0], TIME_INTERVAL)
+        return
 
-    for video_path in video_files:
-        extract_frames_from_video(video_path, OUTPUT_DIR, TIME_INTERVAL)
+    print(f"共发现 {len(video_files)} 个视频文件，开始处理...\n")
 
-    print("\n所有视频处理完毕！")
+    start = time.perf_counter()
+    total_saved = 0
+    if args.workers <= 1:
+        for video_path in video_files:
+            total_saved += extract_frames_from_video(video_path, OUTPUT_DIR, TIME_INTERVAL, args.mode)
+    else:
+        # 每个视频一个任务，输出文件名只依赖视频名和帧号，并行不会冲突
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {
+                executor.submit(extract_frames_from_video, video_path, OUTPUT_DIR, TIME_INTERVAL, args.mode): video_path
+                for video_path in video_files
+            }
+            for future in as_completed(futures):
+                try:
+                    total_saved += future.result()
+                except Exception as e:
+                    print(f"[Error] 处理 {os.path.basename(futures[future])} 失败: {e}")
+
+    print(f"\n所有视频处理完毕！共 {total_saved} 张图片，耗时 {time.perf_counter() - start:.1f}s")
 #
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
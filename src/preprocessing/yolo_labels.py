@@ -0,0 +1,254 @@
+import os
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# ================= 配置区域 =================
+# 清单文件保存在标签文件夹内 (以 . 开头，YOLO 和划分脚本只处理 .txt，不会受影响)
+MANIFEST_NAME = ".labels_manifest.npz"
+MANIFEST_VERSION = 1
+# 并行解析的进程数，文件数少于 PARALLEL_MIN_FILES 时直接在当前进程解析
+NUM_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+PARALLEL_MIN_FILES = 2000
+CHUNK_FILES = 500
+# ===========================================
+
+# ================= 说明 =================
+# YOLO 分割标签 (每行: class x1 y1 x2 y2 ... xn yn，坐标归一化到 0~1) 的批量解析:
+#   整个文件用 np.fromstring 一次转成浮点数组，再按每行的数值个数切分，
+#   得到 "扁平数组 + 偏移" 的表示: cls (N,), vert_start (N+1,), xy (V, 2)。
+# 清单 (manifest) 按文件记录 mtime/大小和每个实例的类别、外接框、多边形面积、顶点数，
+# 文件没变时直接复用，类别直方图和尺寸分布不需要重新读取标签。
+# =======================================
+
+def parse_label_text(text):
+    """
+    解析一个标签文件的内容，返回 (cls, vert_start, xy)。
+    少于 2 个点的行跳过；坐标个数为奇数时丢掉最后一个数值。
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    counts = np.array([len(line.split()) for line in lines], dtype=np.int64)
+    try:
+        with warnings.catch_warnings():
+            # 旧版 numpy 遇到无法解析的数值只给警告并截断，统一当作错误处理
+            warnings.simplefilter("error")
+            values = np.fromstring(" ".join(lines), dtype=np.float64, sep=' ') if lines else np.zeros(0)
+    except (ValueError, DeprecationWarning):
+        values = None
+    if values is None or values.size != counts.sum():
+        # 含有无法解析的数值，逐行处理并跳过坏行
+        return _parse_label_lines(lines)
+
+    line_start = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    n_vert = (counts - 1) // 2
+    keep = n_vert >= 2
+    line_start, n_vert = line_start[keep], n_vert[keep]
+
+    cls = values[line_start].astype(np.int16)
+    vert_start = np.zeros(len(n_vert) + 1, dtype=np.int64)
+    vert_start[1:] = np.cumsum(n_vert)
+    # 每个顶点的 x 在 values 中的位置: 行首 + 1 + 2 * (顶点在行内的序号)
+    owner = np.repeat(np.arange(len(n_vert)), n_vert)
+    local = np.arange(vert_start[-1]) - vert_start[owner]
+    x_idx = line_start[owner] + 1 + 2 * local
+    xy = np.stack([values[x_idx], values[x_idx + 1]], axis=1).astype(np.float32)
+    return cls, vert_start, xy
+
+def _parse_label_lines(lines):
+    cls, polys = [], []
+    for line in lines:
+        try:
+            parts = [float(v) for v in line.split()]
+        except ValueError:
+            continue
+        n = (len(parts) - 1) // 2
+        if n < 2:
+            continue
+        cls.append(int(parts[0]))
+        polys.append(np.asarray(parts[1:1 + 2 * n], dtype=np.float32).reshape(n, 2))
+    vert_start = np.zeros(len(polys) + 1, dtype=np.int64)
+    vert_start[1:] = np.cumsum([len(p) for p in polys])
+    xy = np.concatenate(polys) if polys else np.zeros((0, 2), np.float32)
+    return np.asarray(cls, dtype=np.int16), vert_start, xy
+
+def read_label_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_label_text(f.read())
+
+def polygon_stats(vert_start, xy):
+    """
+    每个多边形的外接框 (xmin, ymin, xmax, ymax)、面积 (鞋带公式) 和顶点数，全部向量化。
+    """
+    n = len(vert_start) - 1
+    if n == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int32)
+    starts = vert_start[:-1]
+    x, y = xy[:, 0].astype(np.float64), xy[:, 1].astype(np.float64)
+    bbox = np.stack([
+        np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts),
+        np.maximum.reduceat(x, starts), np.maximum.reduceat(y, starts),
+    ], axis=1).astype(np.float32)
+
+    # 每个顶点的 "下一个顶点" (多边形首尾相连)
+    nxt = np.arange(len(x)) + 1
+    nxt[vert_start[1:] - 1] = starts
+    cross = x * y[nxt] - x[nxt] * y
+    area = (0.5 * np.abs(np.add.reduceat(cross, starts))).astype(np.float32)
+    n_vertices = np.diff(vert_start).astype(np.int32)
+    return bbox, area, n_vertices
+
+def _scan_files(paths):
+    """解析一组文件，只返回统计量 (不返回坐标，减少进程间传输)"""
+    counts, cls_list, bbox_list, area_list, nv_list = [], [], [], [], []
+    for path in paths:
+        try:
+            cls, vert_start, xy = read_label_file(path)
+        except (OSError, UnicodeDecodeError):
+            cls, vert_start, xy = np.zeros(0, np.int16), np.zeros(1, np.int64), np.zeros((0, 2), np.float32)
+        bbox, area, n_vertices = polygon_stats(vert_start, xy)
+        counts.append(len(cls))
+        cls_list.append(cls)
+        bbox_list.append(bbox)
+        area_list.append(area)
+        nv_list.append(n_vertices)
+    return (np.asarray(counts, dtype=np.int64), np.concatenate(cls_list), np.concatenate(bbox_list),
+            np.concatenate(area_list), np.concatenate(nv_list))
+
+class LabelManifest:
+    """
+    整个标签文件夹的统计清单 (扁平数组 + 每个文件的实例偏移)。
+    files[i] 的实例为 cls[inst_start[i]:inst_start[i+1]]，bbox/area/n_vertices 同理。
+    """
+
+    def __init__(self, files, mtime_ns, size, inst_start, cls, bbox, area, n_vertices):
+        self.files = list(files)
+        self.mtime_ns = np.asarray(mtime_ns, dtype=np.int64)
+        self.size = np.asarray(size, dtype=np.int64)
+        self.inst_start = np.asarray(inst_start, dtype=np.int64)
+        self.cls = np.asarray(cls, dtype=np.int16)
+        self.bbox = np.asarray(bbox, dtype=np.float32).reshape(-1, 4)
+        self.area = np.asarray(area, dtype=np.float32)
+        self.n_vertices = np.asarray(n_vertices, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def num_instances(self):
+        return len(self.cls)
+
+    def file_index(self):
+        """每个实例所属文件的下标 (N,)"""
+        return np.repeat(np.arange(len(self.files)), np.diff(self.inst_start))
+
+    def class_histogram(self, num_classes):
+        valid = (self.cls >= 0) & (self.cls < num_classes)
+        return np.bincount(self.cls[valid], minlength=num_classes)
+
+    def box_areas(self):
+        """外接框面积 (归一化，w * h)"""
+        return (self.bbox[:, 2] - self.bbox[:, 0]) * (self.bbox[:, 3] - self.bbox[:, 1])
+
+    def file_classes(self, i):
+        return self.cls[self.inst_start[i]:self.inst_start[i + 1]]
+
+    def classes_by_file(self):
+        """{文件名(不含扩展名): 出现的类别集合}"""
+        return {os.path.splitext(name)[0]: set(self.file_classes(i).tolist()) for i, name in enumerate(self.files)}
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=MANIFEST_VERSION, files=np.array(self.files, dtype=str), mtime_ns=self.mtime_ns,
+                     size=self.size, inst_start=self.inst_start, cls=self.cls, bbox=self.bbox,
+                     area=self.area, n_vertices=self.n_vertices)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            if int(npz['version']) != MANIFEST_VERSION:
+                return None
+            return cls(npz['files'].tolist(), npz['mtime_ns'], npz['size'], npz['inst_start'],
+                       npz['cls'], npz['bbox'], npz['area'], npz['n_vertices'])
+
+def _list_label_files(label_dir):
+    entries = []
+    with os.scandir(label_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.txt') and entry.is_file():
+                st = entry.stat()
+                entries.append((entry.name, st.st_mtime_ns, st.st_size))
+    entries.sort()
+    return entries
+
+def _scan_parallel(paths, workers):
+    if not paths:
+        return (np.zeros(0, np.int64), np.zeros(0, np.int16), np.zeros((0, 4), np.float32),
+                np.zeros(0, np.float32), np.zeros(0, np.int32))
+    if workers <= 1 or len(paths) < PARALLEL_MIN_FILES:
+        return _scan_files(paths)
+    chunks = [paths[i:i + CHUNK_FILES] for i in range(0, len(paths), CHUNK_FILES)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_scan_files, chunks))
+    return tuple(np.concatenate([p[k] for p in parts]) for k in range(5))
+
+def load_manifest(label_dir, workers=NUM_WORKERS, verbose=True):
+    """
+    返回标签文件夹的 LabelManifest。
+    只重新解析新增或 mtime/大小变化的文件，其余直接沿用上次的清单；有变化时写回清单文件。
+    """
+    manifest_path = os.path.join(label_dir, MANIFEST_NAME)
+    old = None
+    if os.path.exists(manifest_path):
+        try:
+            old = LabelManifest.load(manifest_path)
+        except (OSError, ValueError, KeyError):
+            old = None
+    old_pos = {name: i for i, name in enumerate(old.files)} if old else {}
+
+    entries = _list_label_files(label_dir)
+    reuse, stale = [], []
+    for k, (name, mtime_ns, size) in enumerate(entries):
+        i = old_pos.get(name)
+        if i is not None and old.mtime_ns[i] == mtime_ns and old.size[i] == size:
+            reuse.append((k, i))
+        else:
+            stale.append(k)
+
+    if old is not None and not stale and len(reuse) == len(old.files):
+        return old  # 没有任何变化
+
+    # 新解析的文件
+    counts_new, cls_new, bbox_new, area_new, nv_new = _scan_parallel(
+        [os.path.join(label_dir, entries[k][0]) for k in stale], workers)
+    new_start = np.zeros(len(stale) + 1, dtype=np.int64)
+    new_start[1:] = np.cumsum(counts_new)
+
+    # 按文件顺序拼接: 复用旧清单的切片 + 新解析的切片
+    pieces = [None] * len(entries)
+    for k, i in reuse:
+        a, b = old.inst_start[i], old.inst_start[i + 1]
+        pieces[k] = (old.cls[a:b], old.bbox[a:b], old.area[a:b], old.n_vertices[a:b])
+    for j, k in enumerate(stale):
+        a, b = new_start[j], new_start[j + 1]
+        pieces[k] = (cls_new[a:b], bbox_new[a:b], area_new[a:b], nv_new[a:b])
+
+    counts = np.array([len(p[0]) for p in pieces], dtype=np.int64)
+    inst_start = np.zeros(len(entries) + 1, dtype=np.int64)
+    inst_start[1:] = np.cumsum(counts)
+    manifest = LabelManifest(
+        [e[0] for e in entries], [e[1] for e in entries], [e[2] for e in entries], inst_start,
+        np.concatenate([p[0] for p in pieces]) if pieces else np.zeros(0, np.int16),
+        np.concatenate([p[1] for p in pieces]) if pieces else np.zeros((0, 4), np.float32),
+        np.concatenate([p[2] for p in pieces]) if pieces else np.zeros(0, np.float32),
+        np.concatenate([p[3] for p in pieces]) if pieces else np.zeros(0, np.int32),
+    )
+    try:
+        manifest.save(manifest_path)
+    except OSError:
+        pass  # 只读目录: 不保存清单，下次重新扫描
+    if verbose:
+        removed = len(set(old.files) - {e[0] for e in entries}) if old else 0
+        print(f"标签清单: {len(entries)} 个文件 (重新解析 {len(stale)}，沿用 {len(reuse)}，删除 {removed})")
+    return manifest
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import itertools
+import subprocess
+import psutil
+import pandas as pd
+
+# 强制设置环境变量，减少底层库的冲突风险 (与 train_model.py 相同)
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+# ================= 配置区域 =================
+DATA_YAML = "chenhu_seg.yaml"
+# 只测吞吐量，用模型结构文件随机初始化即可 (不需要下载权重，结果与 yolo11s-seg.pt 相同)
+MODEL_CFG = "yolo11s-seg.yaml"
+SUBSET_IMAGES = 64                # 从训练集中取前 N 张做基准测试
+STEPS = 30                        # 每组配置训练的 batch 数
+WARMUP_STEPS = 5                  # 前几个 batch (DataLoader 启动、cudnn 选算法) 不计入统计
+RUN_TIMEOUT = 1800                # 单组配置的超时时间 (秒)，超时记为 timeout
+OUTPUT_DIR = "runs/benchmark"
+OUTPUT_CSV = os.path.join(OUTPUT_DIR, "train_throughput.csv")
+
+# 参数网格 (笛卡尔积)。cache: False / "ram" / "disk" 为 YOLO 自带方式，"memmap" 为 train_cache.py 的预缩放缓存
+GRID = {
+    "batch": [2, 4, 8],
+    "workers": [0, 2, 4],
+    "imgsz": [640, 1024],
+    "amp": [True, False],
+    "cache": [False, "memmap"],
+}
+# 只有 CPU 时使用的小网格 (CPU 上 AMP 不生效，YOLO 也会把 workers 强制设为 0)
+CPU_GRID = {
+    "batch": [2, 4],
+    "workers": [0],
+    "imgsz": [320, 640],
+    "amp": [False],
+    "cache": [False, "memmap"],
+}
+# ===========================================
+
+# ================= 说明 =================
+# 每组配置在独立的子进程中运行 (峰值内存互不影响，某组显存溢出或崩溃不会中断整个测试)。
+# 子进程通过训练回调计时:
+#   on_train_batch_start - 上一个 batch 结束 = 等待 DataLoader 的时间
+#   on_train_batch_end   - 上一个 batch 结束 = 一个 step 的总时间 (GPU 上先同步)
+# 每个 epoch 的第一个 batch 不计时，epoch 之间的收尾开销不会算进 step。
+# 结果写入 OUTPUT_CSV，每组一行: 图片/秒、DataLoader 等待占比、主进程峰值内存、worker 内存之和的峰值 (按 batch 采样)、峰值显存。
+# =======================================
+
+RESULT_PREFIX = "BENCH_RESULT "
+
+class StopBenchmark(Exception):
+    """跑满 STEPS 个 batch 后从回调中抛出，提前结束训练"""
+
+def peak_rss_mb():
+    """主进程的峰值 RSS (MB)；Windows 下为峰值工作集"""
+    try:
+        import resource
+    except ImportError:
+        return psutil.Process().memory_info().peak_wset / 2**20
+    scale = 1 / 2**20 if sys.platform == "darwin" else 1 / 1024  # macOS 单位为字节，Linux 为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def children_rss_mb():
+    """当前所有子进程 (DataLoader worker) 的 RSS 之和 (MB)"""
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / 2**20
+
+def make_subset(data_yaml, n_images):
+    """把训练集前 n 张写成列表文件，生成只包含这些图片的数据集配置，返回其路径"""
+    import yaml
+    from train_cache import list_train_images
+
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    images = list_train_images(data_yaml)[:n_images]
+    if not images:
+        raise FileNotFoundError(f"{data_yaml} 的训练集中没有图片")
+
+    subset_dir = os.path.abspath(os.path.join(OUTPUT_DIR, "subset"))
+    os.makedirs(subset_dir, exist_ok=True)
+    list_path = os.path.join(subset_dir, "train.txt")
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.writelines(p + "\n" for p in images)
+    cfg.update(path=subset_dir, train="train.txt", val="train.txt")
+    subset_yaml = os.path.join(subset_dir, "subset.yaml")
+    with open(subset_yaml, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+    print(f"基准测试子集: {len(images)} 张 ({subset_yaml})")
+    return subset_yaml
+
+def run_single(config, data_yaml, steps=STEPS, warmup=WARMUP_STEPS):
+    """在当前进程中跑一组配置，返回结果字典"""
+    import torch
+    from ultralytics import YOLO
+
+    device = 0 if torch.cuda.is_available() else 'cpu'
+    trainer = None
+    cache = config["cache"]
+    if cache == "memmap":
+        from train_cache import build_cache
+        from train_model import CachedSegmentationTrainer
+        CachedSegmentationTrainer.image_cache = build_cache(data_yaml, config["imgsz"])
+        trainer, cache = CachedSegmentationTrainer, False
+
+    marks = {"last_end": None, "start": None, "worker_rss": 0.0}
+    waits, steps_time = [], []
+
+    def on_epoch_start(_trainer):
+        # epoch 之间的收尾工作 (日志、学习率调整等) 不计入 step 时间
+        marks["last_end"] = None
+
+    def on_batch_start(_trainer):
+        marks["start"] = time.perf_counter()
+
+    def on_batch_end(_trainer):
+        if device != 'cpu':
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        if marks["last_end"] is not None:
+            waits.append(marks["start"] - marks["last_end"])
+            steps_time.append(now - marks["last_end"])
+        marks["last_end"] = now
+        marks["worker_rss"] = max(marks["worker_rss"], children_rss_mb())
+        if len(steps_time) >= steps + warmup - 1:
+            raise StopBenchmark()
+
+    if device != 'cpu':
+        torch.cuda.reset_peak_memory_stats()
+    model = YOLO(MODEL_CFG)
+    model.add_callback("on_train_epoch_start", on_epoch_start)
+    model.add_callback("on_train_batch_start", on_batch_start)
+    model.add_callback("on_train_batch_end", on_batch_end)
+    try:
+        model.train(
+            data=data_yaml, trainer=trainer, device=device,
+            batch=config["batch"], workers=config["workers"], imgsz=config["imgsz"], amp=config["amp"], cache=cache,
+            epochs=1000, close_mosaic=0,  # 由 StopBenchmark 结束，保持 Mosaic 增强与正式训练一致
+            val=False, plots=False, save=False, verbose=False,
+            project=os.path.join(OUTPUT_DIR, "jobs"), name="bench", exist_ok=True,
+        )
+    except StopBenchmark:
+        pass
+
+    # 第一个计时的 step 之前已经过了 1 个 batch，所以丢掉 warmup - 1 个
+    waits, steps_time = waits[warmup - 1:], steps_time[warmup - 1:]
+    total = sum(steps_time)
+    return {
+        **config,
+        "device": str(device),
+        "steps": len(steps_time),
+        "images_per_s": config["batch"] * len(steps_time) / total if total else float('nan'),
+        "step_ms": 1000 * total / len(steps_time) if steps_time else float('nan'),
+        "dataloader_wait_frac": sum(waits) / total if total else float('nan'),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_worker_rss_mb": marks["worker_rss"],  # 每个 batch 结束时采样的 worker 内存之和
+        "peak_device_mem_mb": torch.cuda.max_memory_allocated() / 2**20 if device != 'cpu' else float('nan'),
+        "status": "ok" if len(steps_time) >= steps else "incomplete",
+    }
+
+def grid_configs(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def run_grid(data_yaml=DATA_YAML, grid=None):
+    """逐组启动子进程运行基准测试，每完成一组就写一次 CSV (中途中断也保留已有结果)"""
+    import torch
+
+    if grid is None:
+        grid = GRID if torch.cuda.is_available() else CPU_GRID
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    subset_yaml = make_subset(data_yaml, SUBSET_IMAGES)
+    configs = grid_configs(grid)
+    log_dir = os.path.join(OUTPUT_DIR, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    rows = []
+    for k, config in enumerate(configs, 1):
+        tag = "_".join(f"{key}{value}" for key, value in config.items())
+        print(f"[{k}/{len(configs)}] {tag} ...", flush=True)
+        cmd = [sys.executable, os.path.abspath(__file__), "--run", json.dumps(config), subset_yaml]
+        try:
+            proc = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                                  timeout=RUN_TIMEOUT)
+            output = proc.stdout + proc.stderr
+            lines = [l for l in proc.stdout.splitlines() if l.startswith(RESULT_PREFIX)]
+            if lines:
+                row = json.loads(lines[-1][len(RESULT_PREFIX):])
+            else:
+                # 崩溃或显存溢出: 记录状态，继续下一组
+                status = "oom" if "out of memory" in output.lower() else f"failed({proc.returncode})"
+                row = {**config, "status": status}
+        except subprocess.TimeoutExpired:
+            output = f"超时 ({RUN_TIMEOUT} 秒)"
+            row = {**config, "status": "timeout"}
+        with open(os.path.join(log_dir, tag + ".log"), 'w', encoding='utf-8') as f:
+            f.write(output)
+
+        rows.append(row)
+        pd.DataFrame(rows).to_csv(OUTPUT_CSV, index=False, encoding='utf-8-sig')
+        if row.get("status") == "ok":
+            print(f"    {row['images_per_s']:.1f} 张/秒 | 等待数据 {row['dataloader_wait_frac']:.0%} | "
+                  f"峰值内存 {row['peak_rss_mb']:.0f} MB | 峰值显存 {row['peak_device_mem_mb']:.0f} MB")
+        else:
+            print(f"    {row['status']}")
+
+    df = pd.DataFrame(rows)
+    ok = df[df["status"] == "ok"] if "status" in df else df.iloc[0:0]
+    if len(ok):
+        print("\n吞吐量最高的配置:")
+        print(ok.sort_values("images_per_s", ascending=False).head(5).to_string(index=False))
+    print(f"✅ 结果已保存: {OUTPUT_CSV}")
+    return df
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--run":
+        # 子进程: 跑一组配置并把结果打印成一行 JSON
+        result = run_single(json.loads(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else DATA_YAML)
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+    else:
+        run_grid(sys.argv[1] if len(sys.argv) > 1 else DATA_YAML)
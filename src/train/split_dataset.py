@@ -1,6 +1,9 @@
 import os
+import re
 import shutil
+import hashlib
 import random
+from collections import defaultdict
 from tqdm import tqdm
 
 # ================= 配置 =================
@@ -14,59 +17,202 @@ TARGET_ROOT = "datasets/chenhu_seg"
 
 # 3. 划分比例 (0.2 表示 20% 做验证集)
 VAL_RATIO = 0.2
+
+# 4. 划分方式 (重新划分时只改变链接或列表，不复制像素数据)
+#   "copy"     : 复制到 train/val 文件夹 (默认，占用双倍磁盘)
+#   "hardlink" : 硬链接到 train/val 文件夹 (不占额外空间，要求与源文件在同一磁盘)
+#   "symlink"  : 符号链接到 train/val 文件夹 (Windows 需要开发者模式或管理员权限)
+#   "list"     : 只写 train.txt / val.txt 图片列表，chenhu_seg.yaml 中 train/val 改为指向这两个文件
+SPLIT_MODE = "copy"
+
+# 5. 按视频分组划分: 同一段视频抽出的帧 (以及它们的 _augcopy_ 副本) 只会出现在 train 或 val 其中之一，
+#    避免相邻帧同时出现在训练集和验证集造成的指标虚高。
+#    开启后划分结果与按图片随机划分不同，验证集比例也只能接近 VAL_RATIO (整组放入)
+GROUP_BY_VIDEO = False
 # =======================================
 
+# 划分指纹 (train/val 各包含哪些图片) 写在 TARGET_ROOT 下；augment_dataset.py 生成加权列表时记下它，
+# train_model.py 只使用指纹与当前划分一致的加权列表
+SPLIT_FINGERPRINT = "split.fingerprint"
+WEIGHTED_LIST_FILES = ("train_weighted.txt", "train_weighted.fingerprint")
+
+# 从文件名中去掉帧号等后缀得到视频名，例如:
+#   DJI_0040_000123.jpg          -> DJI_0040   (videos2images.py)
+#   img_00012_DJI_0040_t1.0.jpg  -> DJI_0040   (videos2geotagged_images.py)
+AUGCOPY_SUFFIX = re.compile(r'_augcopy_\d+$')
+GEOTAGGED_NAME = re.compile(r'^img_\d+_(?P<video>.+)_t[\d.]+$')
+FRAME_SUFFIX = re.compile(r'^(?P<video>.+)_\d+$')
+
+def video_group(img_name):
+    stem = AUGCOPY_SUFFIX.sub('', os.path.splitext(img_name)[0])
+    for pattern in (GEOTAGGED_NAME, FRAME_SUFFIX):
+        m = pattern.match(stem)
+        if m:
+            return m.group('video')
+    return stem
+
+def split_images(images, val_ratio, group_by_video):
+    """返回 (train, val) 两个图片名列表"""
+    random.seed(42)
+    if not group_by_video:
+        images = list(images)
+        random.shuffle(images)
+        val_count = int(len(images) * val_ratio)
+        return images[val_count:], images[:val_count]
+
+    groups = defaultdict(list)
+    for name in images:
+        groups[video_group(name)].append(name)
+    keys = sorted(groups)
+    random.shuffle(keys)
+
+    # 依次把整组放入验证集: 放入后超过目标数量的组跳过 (留给训练集)，达到目标后停止
+    target = int(len(images) * val_ratio)
+    train, val = [], []
+    for key in keys:
+        group = groups[key]
+        if len(val) < target and len(val) + len(group) <= target:
+            val.extend(group)
+        else:
+            train.extend(group)
+    if not val and target > 0:
+        # 每组都比目标大: 取最小的一组做验证集
+        smallest = min(keys, key=lambda k: len(groups[k]))
+        val = list(groups[smallest])
+        train = [name for name in train if video_group(name) != smallest]
+    print(f"按视频分组: {len(groups)} 组, 验证集 {len(val)} 张 (实际比例 {len(val) / max(len(images), 1):.1%}，"
+          f"目标 {val_ratio:.0%})")
+    return train, val
+
+def place_file(src, dst, mode):
+    """按划分方式把 src 放到 dst (链接失败时退回复制)"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif mode == "symlink":
+        try:
+            os.symlink(os.path.abspath(src), dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+def clear_dir(folder):
+    """清空上一次划分留下的文件 (都是副本或链接，不影响源数据)"""
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) or os.path.islink(path):
+            os.remove(path)
+
+def ensure_pool(images):
+    """
+    list 模式: YOLO 通过把路径中的 /images/ 换成 /labels/ 找标签，
+    因此在 TARGET_ROOT/all 下建立 images/labels 两个入口，列表文件中的路径都指向这里。
+    优先使用目录符号链接 (只建一次)，不支持时为每个文件建立硬链接 (已存在的跳过)。
+    """
+    pool_root = os.path.join(TARGET_ROOT, "all")
+    os.makedirs(pool_root, exist_ok=True)
+    for sub, src_dir in (("images", SRC_IMAGES), ("labels", SRC_LABELS)):
+        link = os.path.join(pool_root, sub)
+        if os.path.islink(link) or os.path.isdir(link):
+            continue
+        try:
+            os.symlink(os.path.abspath(src_dir), link, target_is_directory=True)
+        except OSError:
+            os.makedirs(link, exist_ok=True)
+
+    img_dir, lbl_dir = os.path.join(pool_root, "images"), os.path.join(pool_root, "labels")
+    if not os.path.islink(img_dir):
+        for img_name in tqdm(images, desc="建立硬链接"):
+            txt_name = os.path.splitext(img_name)[0] + ".txt"
+            for src, dst in ((os.path.join(SRC_IMAGES, img_name), os.path.join(img_dir, img_name)),
+                             (os.path.join(SRC_LABELS, txt_name), os.path.join(lbl_dir, txt_name))):
+                if os.path.exists(src) and not os.path.exists(dst):
+                    place_file(src, dst, "hardlink")
+    return img_dir
+
+def write_lists(train, val, img_dir):
+    rel_dir = os.path.relpath(img_dir, TARGET_ROOT).replace(os.sep, "/")
+    for split, names in (("train", train), ("val", val)):
+        list_path = os.path.join(TARGET_ROOT, f"{split}.txt")
+        with open(list_path, 'w', encoding='utf-8') as f:
+            # "./" 开头的路径由 YOLO 按列表文件所在目录解析，整个数据集目录可以直接移动
+            f.writelines(f"./{rel_dir}/{name}\n" for name in sorted(names))
+        print(f"已写入 {list_path} ({len(names)} 张)")
+
+def split_fingerprint(train, val):
+    h = hashlib.blake2b(digest_size=16)
+    for split, names in (("train", train), ("val", val)):
+        h.update(f"{split}\n".encode('utf-8'))
+        for name in sorted(names):
+            h.update(f"{name}\n".encode('utf-8'))
+    return h.hexdigest()
+
+def record_split(train, val):
+    """写入新划分的指纹，并删除按旧划分生成的加权列表 (其中可能包含现在属于 val 的图片)"""
+    os.makedirs(TARGET_ROOT, exist_ok=True)
+    with open(os.path.join(TARGET_ROOT, SPLIT_FINGERPRINT), 'w', encoding='utf-8') as f:
+        f.write(split_fingerprint(train, val) + "\n")
+    removed = [name for name in WEIGHTED_LIST_FILES if os.path.exists(os.path.join(TARGET_ROOT, name))]
+    for name in removed:
+        os.remove(os.path.join(TARGET_ROOT, name))
+    if removed:
+        print("已删除按旧划分生成的加权列表，需要过采样时请重新运行 augment_dataset.py")
+
 def split_data():
     # 检查源文件是否存在
     if not os.path.exists(SRC_IMAGES):
         print("找不到图片文件夹，请检查路径")
         return
 
-    # 创建目标文件夹结构
-    for split in ['train', 'val']:
-        os.makedirs(os.path.join(TARGET_ROOT, split, 'images'), exist_ok=True)
-        os.makedirs(os.path.join(TARGET_ROOT, split, 'labels'), exist_ok=True)
-
     # 获取所有图片文件
-    images = [f for f in os.listdir(SRC_IMAGES) if f.lower().endswith(('.jpg', '.png', '.jpeg', '.bmp'))]
-    
-    # 打乱顺序，保证随机性
-    random.seed(42)
-    random.shuffle(images)
-    
-    # 计算划分数量
-    val_count = int(len(images) * VAL_RATIO)
-    train_count = len(images) - val_count
-    
+    images = sorted(f for f in os.listdir(SRC_IMAGES) if f.lower().endswith(('.jpg', '.png', '.jpeg', '.bmp')))
+
+    train, val = split_images(images, VAL_RATIO, GROUP_BY_VIDEO)
+
     print(f"总数据: {len(images)} 张")
-    print(f"训练集: {train_count} 张 | 验证集: {val_count} 张")
-    print(f"目标目录: {TARGET_ROOT}")
-
-    # 开始移动/复制文件
-    for i, img_name in enumerate(tqdm(images)):
-        # 决定是 train 还是 val
-        if i < val_count:
-            split = "val"
-        else:
-            split = "train"
-            
+    print(f"训练集: {len(train)} 张 | 验证集: {len(val)} 张")
+    print(f"目标目录: {TARGET_ROOT} (方式: {SPLIT_MODE})")
+
+    missing = [n for n in images if not os.path.exists(os.path.join(SRC_LABELS, os.path.splitext(n)[0] + ".txt"))]
+    for name in missing:
+        print(f"警告: 找不到对应的标签文件 {os.path.splitext(name)[0]}.txt")
+
+    record_split(train, val)
+    if SPLIT_MODE == "list":
+        write_lists(train, val, ensure_pool(images))
+        print("数据集划分完成！请确认 chenhu_seg.yaml 中 train/val 指向 train.txt / val.txt")
+        return
+
+    # 创建目标文件夹结构 (清掉上一次划分的结果，避免重新划分后同一张图同时出现在 train 和 val)
+    for split in ['train', 'val']:
+        for sub in ['images', 'labels']:
+            folder = os.path.join(TARGET_ROOT, split, sub)
+            os.makedirs(folder, exist_ok=True)
+            clear_dir(folder)
+
+    # 开始复制/链接文件
+    assignments = [(name, "train") for name in train] + [(name, "val") for name in val]
+    for img_name, split in tqdm(assignments):
         # 构造源路径和目标路径
         src_img_path = os.path.join(SRC_IMAGES, img_name)
         dst_img_path = os.path.join(TARGET_ROOT, split, 'images', img_name)
-        
+
         # 处理对应的 txt
         txt_name = os.path.splitext(img_name)[0] + ".txt"
         src_txt_path = os.path.join(SRC_LABELS, txt_name)
         dst_txt_path = os.path.join(TARGET_ROOT, split, 'labels', txt_name)
-        
-        # 复制文件
-        shutil.copy2(src_img_path, dst_img_path)
+
+        place_file(src_img_path, dst_img_path, SPLIT_MODE)
         if os.path.exists(src_txt_path):
-            shutil.copy2(src_txt_path, dst_txt_path)
-        else:
-            print(f"警告: 找不到对应的标签文件 {txt_name}")
+            place_file(src_txt_path, dst_txt_path, SPLIT_MODE)
 
     print("数据集划分完成！")
 
 if __name__ == "__main__":
-    split_data()
\ No newline at end of file
+    split_data()
@@ -0,0 +1,263 @@
+import os
+import sys
+import math
+import yaml
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ================= 配置区域 =================
+DATA_YAML = "chenhu_seg.yaml"
+IMGSZ = 1024                      # 与 train_model.py 的 imgsz 保持一致
+CACHE_SUBDIR = ".train_cache"     # 缓存放在数据集目录下 (以 . 开头，不会被当成图片目录)
+CACHE_VERSION = 2
+# 解码线程数 (cv2 解码时释放 GIL)；同时在途的图片数不超过 NUM_WORKERS * 2，内存占用与数据集大小无关
+NUM_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+# JPEG 按 1/2、1/4、1/8 分辨率直接解码 (仍不小于目标尺寸)，4K 帧解码快数倍
+REDUCED_DECODE = True
+IMG_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp')
+# ===========================================
+
+# ================= 说明 =================
+# 训练时 YOLO 每个 epoch 都要把 4K 原图完整解码再缩到 1024，数据加载才是瓶颈。
+# 这里离线把每张训练图按 YOLO load_image 的规则 (长边缩放到 imgsz，保持比例) 缩好，
+# 依次写进一个 uint8 的扁平文件 train_<imgsz>.u8，索引 train_<imgsz>.npz 记录:
+#   files / mtime_ns / size  : 源图片路径和状态 (任一变化即重新生成该图)
+#   offset / hw / hw0        : 在扁平文件中的字节偏移、缩放后和原始的 (h, w)
+# 只缓存图片；标签仍由 YOLO 自己的 labels.cache 读取 (按标签文件哈希自动更新)。
+# 补边 (letterbox) 留给 Mosaic/LetterBox 等增强完成，缓存中不存灰边，标签坐标也不需要换算。
+# 训练时以 np.memmap 打开，每张图是其中的一个切片 (不复制)，由系统页缓存负责换入换出。
+# =======================================
+
+def dataset_root(data_yaml):
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    return cfg, cfg.get('path', '.')
+
+def list_train_images(data_yaml=DATA_YAML):
+    """
+    按 data yaml 的 train 项列出训练图片 (绝对路径，去重，保持顺序)。
+    train 可以是图片目录，也可以是列表文件 (split_dataset.py 的 list 模式、加权列表)。
+    """
+    cfg, root = dataset_root(data_yaml)
+    entries = cfg.get('train')
+    entries = entries if isinstance(entries, list) else [entries]
+    images = []
+    for entry in entries:
+        path = os.path.join(root, entry)
+        if os.path.isdir(path):
+            images += [os.path.join(path, n) for n in sorted(os.listdir(path)) if n.lower().endswith(IMG_FORMATS)]
+        elif os.path.isfile(path):
+            parent = os.path.dirname(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        # 与 YOLO 一致: "./" 开头的路径相对于列表文件所在目录
+                        images.append(os.path.join(parent, line[2:]) if line.startswith('./') else line)
+    return list(dict.fromkeys(os.path.abspath(p) for p in images))
+
+def cache_paths(data_yaml=DATA_YAML, imgsz=IMGSZ):
+    _, root = dataset_root(data_yaml)
+    cache_dir = os.path.join(root, CACHE_SUBDIR)
+    return os.path.join(cache_dir, f"train_{imgsz}.u8"), os.path.join(cache_dir, f"train_{imgsz}.npz")
+
+def resized_shape(h0, w0, imgsz):
+    """YOLO load_image (rect_mode) 的缩放规则: 长边到 imgsz，向上取整"""
+    r = imgsz / max(h0, w0)
+    if r == 1:
+        return h0, w0
+    return min(math.ceil(h0 * r), imgsz), min(math.ceil(w0 * r), imgsz)
+
+def load_resized(img_path, imgsz):
+    """解码并缩放一张图片，返回 (缩放后的图, 原始 (h, w))；读取失败返回 (None, None)"""
+    hw0 = None
+    if REDUCED_DECODE and Image is not None and img_path.lower().endswith(('.jpg', '.jpeg')):
+        try:
+            with Image.open(img_path) as im:
+                hw0 = (im.size[1], im.size[0])
+        except Exception:
+            hw0 = None
+
+    flag = cv2.IMREAD_COLOR
+    if hw0 is not None:
+        # 选择解码后长边仍不小于 imgsz 的最大缩小倍数
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if max(hw0) / factor >= imgsz:
+                flag = reduced
+                break
+    im = cv2.imread(img_path, flag)
+    if im is None:
+        return None, None
+    if hw0 is None or flag == cv2.IMREAD_COLOR:
+        hw0 = im.shape[:2]
+    h, w = resized_shape(hw0[0], hw0[1], imgsz)
+    if im.shape[:2] != (h, w):
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(im), hw0
+
+class TrainImageCache:
+    """
+    只读的训练图片缓存。get(path) 返回 (图片视图, 原始 hw, 缩放后 hw)，不在缓存中时返回 None。
+    memmap 在每个进程第一次读取时才打开，DataLoader 的子进程 (Windows 下为 spawn) 不会拷贝整个文件。
+    """
+
+    def __init__(self, shard_path, index_path):
+        self.shard_path = shard_path
+        with np.load(index_path, allow_pickle=False) as npz:
+            self.imgsz = int(npz['imgsz'])
+            self.files = npz['files'].tolist()
+            self.offset = npz['offset']
+            self.hw = npz['hw']
+            self.hw0 = npz['hw0']
+        self.position = {f: i for i, f in enumerate(self.files)}
+        self._mm = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_mm'] = None
+        return state
+
+    @property
+    def nbytes(self):
+        return int(self.offset[-1])
+
+    def image(self, i):
+        if self._mm is None:
+            self._mm = np.memmap(self.shard_path, dtype=np.uint8, mode='r')
+        h, w = self.hw[i]
+        a = self.offset[i]
+        return self._mm[a:a + h * w * 3].reshape(h, w, 3)
+
+    def get(self, img_path):
+        i = self.position.get(os.path.abspath(img_path))
+        if i is None:
+            return None
+        return self.image(i), tuple(self.hw0[i].tolist()), tuple(self.hw[i].tolist())
+
+def load_index(index_path, imgsz):
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with np.load(index_path, allow_pickle=False) as npz:
+            if int(npz['version']) != CACHE_VERSION or int(npz['imgsz']) != imgsz:
+                return None
+            return {k: npz[k] for k in npz.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+def build_cache(data_yaml=DATA_YAML, imgsz=IMGSZ, workers=NUM_WORKERS, force=False):
+    """
+    生成或更新训练缓存，返回 TrainImageCache。
+    源图片 mtime/大小没变的直接从旧缓存拷贝字节，变化或新增的重新解码。
+    """
+    shard_path, index_path = cache_paths(data_yaml, imgsz)
+    os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+    images = list_train_images(data_yaml)
+    stats = []
+    for p in images:
+        try:
+            st = os.stat(p)
+            stats.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stats.append(None)
+    images = [p for p, st in zip(images, stats) if st is not None]
+    stats = [st for st in stats if st is not None]
+
+    old = None if force else load_index(index_path, imgsz)
+    old_mm, old_pos = None, {}
+    if old is not None and os.path.exists(shard_path):
+        old_mm = np.memmap(shard_path, dtype=np.uint8, mode='r') if os.path.getsize(shard_path) else None
+        old_pos = {f: i for i, f in enumerate(old['files'].tolist())}
+
+    def reusable(k):
+        i = old_pos.get(images[k])
+        if i is None or old_mm is None:
+            return None
+        if old['mtime_ns'][i] != stats[k][0] or old['size'][i] != stats[k][1]:
+            return None
+        return i
+
+    reuse = [reusable(k) for k in range(len(images))]
+    n_decode = sum(i is None for i in reuse)
+    if old is not None and n_decode == 0 and images == old['files'].tolist():
+        # 图片全部未变，直接使用 (不重写任何文件)
+        old_mm = None
+        cache = TrainImageCache(shard_path, index_path)
+        print(f"训练缓存已是最新: {len(images)} 张 ({cache.nbytes / 1e9:.2f} GB)")
+        return cache
+
+    print(f"生成训练缓存 (imgsz={imgsz}): {len(images)} 张，重新解码 {n_decode}，沿用 {len(images) - n_decode}")
+    tmp_path = shard_path + ".tmp"
+    offset = np.zeros(len(images) + 1, dtype=np.int64)
+    hw = np.zeros((len(images), 2), dtype=np.int32)
+    hw0 = np.zeros((len(images), 2), dtype=np.int32)
+    keep = np.ones(len(images), dtype=bool)
+
+    with open(tmp_path, 'wb') as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        window = workers * 2
+
+        def submit(k):
+            if k < len(images) and reuse[k] is None:
+                pending[k] = pool.submit(load_resized, images[k], imgsz)
+
+        for k in range(min(window, len(images))):
+            submit(k)
+        for k in tqdm(range(len(images)), desc="写入缓存"):
+            submit(k + window)
+            i = reuse[k]
+            if i is None:
+                im, shape0 = pending.pop(k).result()
+                if im is None:
+                    print(f"警告: 无法读取 {images[k]}，训练时将回退到原图读取")
+                    keep[k] = False
+                    offset[k + 1] = offset[k]
+                    continue
+                data, hw[k], hw0[k] = im, im.shape[:2], shape0
+            else:
+                a, b = old['offset'][i], old['offset'][i + 1]
+                # 拷贝出来，不保留旧 memmap 的视图 (否则映射无法关闭)
+                data, hw[k], hw0[k] = np.array(old_mm[a:b]), old['hw'][i], old['hw0'][i]
+            out.write(memoryview(np.ascontiguousarray(data)).cast('B'))
+            offset[k + 1] = offset[k] + data.nbytes
+        data = None
+
+    # 替换前显式关闭旧文件的映射: Windows 下仍被映射的文件不能被替换，只 del 变量不保证映射已释放。
+    # 上面沿用的图片都已拷贝出来，关闭后不会再有指向旧映射的视图
+    if old_mm is not None:
+        old_mmap, old_mm = old_mm._mmap, None
+        old_mmap.close()
+    os.replace(tmp_path, shard_path)
+    images = [p for p, ok in zip(images, keep) if ok]
+    stats = [st for st, ok in zip(stats, keep) if ok]
+    offset = np.concatenate(([0], offset[1:][keep]))
+    cache = _write_index(index_path, imgsz, images, stats, offset, hw[keep], hw0[keep])
+    print(f"✅ 训练缓存已写入: {shard_path} ({cache.nbytes / 1e9:.2f} GB)")
+    return cache
+
+def _write_index(index_path, imgsz, images, stats, offset, hw, hw0):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, version=CACHE_VERSION, imgsz=imgsz, files=np.array(images, dtype=str),
+                 mtime_ns=np.array([s[0] for s in stats], dtype=np.int64),
+                 size=np.array([s[1] for s in stats], dtype=np.int64),
+                 offset=np.asarray(offset, dtype=np.int64), hw=np.asarray(hw, dtype=np.int32),
+                 hw0=np.asarray(hw0, dtype=np.int32))
+    os.replace(tmp_path, index_path)
+    return TrainImageCache(os.path.splitext(index_path)[0] + ".u8", index_path)
+
+if __name__ == "__main__":
+    force = "--force" in sys.argv
+    cache = build_cache(DATA_YAML, IMGSZ, force=force)
+    print(f"图片 {len(cache)} 张，imgsz={cache.imgsz}")
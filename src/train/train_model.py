@@ -1,23 +1,130 @@
 from ultralytics import YOLO
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.segment import SegmentationTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import unwrap_model
 import torch
 import os
+import yaml
+from train_cache import build_cache
 
 # 强制设置环境变量，减少底层库的冲突风险
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
+# 虚拟过采样列表 (augment_dataset.py 生成，位于数据集目录下)，存在且与当前划分一致时自动作为训练集
+WEIGHTED_TRAIN_LIST = "train_weighted.txt"
+WEIGHTED_FINGERPRINT = "train_weighted.fingerprint"
+SPLIT_FINGERPRINT = "split.fingerprint"
+
+# 预缩放的训练图片缓存 (train_cache.py)：训练前自动检查，源图片变化时增量重建，
+# 训练时直接从内存映射文件切片读取，不再每个 epoch 解码 4K 原图
+USE_TRAIN_CACHE = True
+IMGSZ = 1024
+
+def read_fingerprint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def resolve_data_config(data_yaml='chenhu_seg.yaml'):
+    """
+    数据集目录下有加权列表时，生成 train 指向该列表的 chenhu_seg_weighted.yaml 并返回其路径，
+    否则原样返回 data_yaml。稀有类别的图片在列表中重复出现，不需要物理复制。
+    列表记录的划分指纹与当前划分 (split_dataset.py) 不一致时视为过期，不使用。
+    """
+    if not os.path.exists(data_yaml):
+        return data_yaml
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    root = cfg.get('path', '.')
+    if not os.path.exists(os.path.join(root, WEIGHTED_TRAIN_LIST)):
+        return data_yaml
+
+    split_id = read_fingerprint(os.path.join(root, SPLIT_FINGERPRINT))
+    if split_id is None or read_fingerprint(os.path.join(root, WEIGHTED_FINGERPRINT)) != split_id:
+        # 重新划分后的旧列表可能包含现在属于验证集的图片
+        message = (f"{WEIGHTED_TRAIN_LIST} 不是按当前的 train/val 划分生成的 (可能包含验证集图片)，"
+                   f"请重新运行 augment_dataset.py")
+        if cfg.get('train') == WEIGHTED_TRAIN_LIST:
+            raise RuntimeError(message)
+        print(f"警告: {message}，本次使用原训练集")
+        return data_yaml
+    if cfg.get('train') == WEIGHTED_TRAIN_LIST:
+        return data_yaml
+
+    cfg['train'] = WEIGHTED_TRAIN_LIST
+    weighted_yaml = os.path.splitext(data_yaml)[0] + "_weighted.yaml"
+    with open(weighted_yaml, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+    print(f"使用虚拟过采样列表训练: {WEIGHTED_TRAIN_LIST} ({weighted_yaml})")
+    return weighted_yaml
+
+class MemmapYOLODataset(YOLODataset):
+    """训练集: 命中缓存的图片直接返回内存映射切片，未命中的按 YOLO 原来的方式读取"""
+
+    def __init__(self, *args, image_cache=None, **kwargs):
+        self.image_cache = image_cache
+        super().__init__(*args, **kwargs)
+
+    def load_image(self, i, rect_mode=True, **kwargs):
+        hit = None
+        if self.image_cache is not None and rect_mode and not kwargs.get('resize_short') and self.ims[i] is None:
+            hit = self.image_cache.get(self.im_files[i])
+        if hit is None or self.image_cache.imgsz != self.imgsz:
+            return super().load_image(i, rect_mode, **kwargs)
+
+        im, hw0, hw = hit
+        if hw == (self.imgsz, self.imgsz):
+            # 正方形图 LetterBox 不会生成新数组，HSV 增强会原地修改，这里拷贝一份 (缓存是只读映射)
+            im = im.copy()
+        if self.augment:
+            # Mosaic 从 buffer 中挑选其余几张图，维持与原实现相同的 buffer 长度 (图片本身不放进 self.ims)
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return im, hw0, hw
+
+class CachedSegmentationTrainer(SegmentationTrainer):
+    """训练集改用 MemmapYOLODataset，验证集不变"""
+    image_cache = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if mode != "train" or self.image_cache is None:
+            return super().build_dataset(img_path, mode, batch)
+        gs = max(int(unwrap_model(self.model).stride.max()), 32)
+        cfg = self.args
+        dataset = MemmapYOLODataset(
+            img_path=img_path, imgsz=cfg.imgsz, batch_size=batch, augment=True, hyp=cfg, rect=cfg.rect,
+            cache=cfg.cache or None, single_cls=cfg.single_cls or False, stride=gs, pad=0.0,
+            prefix=colorstr(f"{mode}: "), task=cfg.task, classes=cfg.classes, data=self.data,
+            fraction=cfg.fraction, image_cache=self.image_cache,
+        )
+        hits = sum(os.path.abspath(f) in self.image_cache.position for f in dataset.im_files)
+        print(f"训练缓存命中: {hits}/{len(dataset.im_files)} 张")
+        return dataset
+
 def main():
     # 依然坚持使用 Small 模型
     model = YOLO('yolo11s-seg.pt') 
 
+    data_yaml = resolve_data_config('chenhu_seg.yaml') # 有加权列表时自动使用虚拟过采样
+    trainer = None
+    if USE_TRAIN_CACHE and os.path.exists(data_yaml):
+        CachedSegmentationTrainer.image_cache = build_cache(data_yaml, IMGSZ)
+        trainer = CachedSegmentationTrainer
+
     print("启动 1024 分辨率稳定训练模式...")
     print("配置策略: 极低Batch + SGD + 单线程 -> 降低瞬间功耗")
 
     try:
         results = model.train(
-            data='chenhu_seg.yaml', # 使用你做过物理扩充(复制粘贴)后的数据集
+            data=data_yaml,
+            trainer=trainer, # 使用预缩放缓存时替换训练集的读图方式
             
             # === 核心：保住 1024 的代价 ===
-            imgsz=1024,      # 坚持使用 1024，确保小目标看得清
+            imgsz=IMGSZ,     # 坚持使用 1024，确保小目标看得清
             batch=8,         # 【关键】降为 2。这是防死机的核心。
                              # 虽然速度慢，但能大幅降低 GPU/CPU 的瞬时峰值功耗。
             
@@ -34,7 +141,7 @@ def main():
             device=0,
             workers=2,       # 单线程，防止 CPU 过热
             amp=True,        # 混合精度 (必须开，降温神器)
-            cache=False,     # 关闭 RAM 缓存
+            cache=False,     # 关闭 RAM 缓存 (预缩放的图片由内存映射缓存提供，不占进程内存)
             
             # === 降低 I/O 负担 ===
             plots=True,      # 保留画图
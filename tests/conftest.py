@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# src/ 下的脚本按同目录模块互相导入 (例如 from mask_accounting import ...)，测试时把这些目录加入路径
+SRC = Path(__file__).resolve().parents[1] / "src"
+for sub in ("analysis", "evaluation", "preprocessing", "train"):
+    sys.path.insert(0, str(SRC / sub))
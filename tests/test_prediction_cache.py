@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import torch
+from ultralytics.engine.results import Results
+
+from prediction_cache import PredictionCache
+from mask_accounting import batch_class_pixel_totals, batch_class_union_coverage
+
+NAMES = {0: "a", 1: "b"}
+
+class FakeModel:
+    """按图像内容生成确定的结果，张量放在 predict(device=...) 指定的设备上"""
+    names = NAMES
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, images, device='cpu', **options):
+        self.calls += 1
+        results = []
+        for img in images:
+            h, w = img.shape[:2]
+            k = int(img[0, 0, 0]) % 2
+            boxes = torch.tensor([[0, 0, w / 2, h / 2, 0.9, k]], dtype=torch.float32)
+            masks = torch.zeros(1, h, w)
+            masks[0, : h // 2, : w // 2] = 1
+            results.append(Results(img, "", NAMES, boxes=boxes.to(device), masks=masks.to(device)))
+        return results
+
+def frames(*values):
+    return [np.full((32, 48, 3), v, dtype=np.uint8) for v in values]
+
+def make_cache(tmp_path):
+    weights = tmp_path / "best.pt"
+    weights.write_bytes(b"weights")
+    model = FakeModel()
+    return model, PredictionCache(model, weights, cache_dir=tmp_path / "cache")
+
+DEVICES = ['cpu'] + (['cuda:0'] if torch.cuda.is_available() else [])
+
+@pytest.mark.parametrize("device", DEVICES)
+def test_mixed_hits_and_misses_share_device(tmp_path, device):
+    model, cache = make_cache(tmp_path)
+    cache.predict(frames(1, 2), device=device)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    # 两张命中 + 一张未命中
+    results = cache.predict(frames(1, 3, 2), device=device)
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert model.calls == 2
+    expected = torch.device(device)
+    for r in results:
+        assert r.boxes.data.device == expected
+        assert r.masks.data.device == expected
+
+    # 按设备归约的统计在混合批次上可以直接使用
+    totals = batch_class_pixel_totals(results, len(NAMES))
+    assert totals.sum() == 3 * 16 * 24
+    coverage = batch_class_union_coverage(results, len(NAMES))
+    assert coverage.shape == (3, len(NAMES))
+
+def test_all_hits_follow_requested_device(tmp_path):
+    _, cache = make_cache(tmp_path)
+    cache.predict(frames(1, 2), device='cpu')
+    results = cache.predict(frames(1, 2), device='meta')
+    assert cache.hits == 2
+    assert all(r.boxes.data.device.type == 'meta' for r in results)
+
+def test_restored_results_match_predictions(tmp_path):
+    _, cache = make_cache(tmp_path)
+    first = cache.predict(frames(1, 2), device='cpu')
+    second = cache.predict(frames(1, 2), device='cpu')
+    for a, b in zip(first, second):
+        assert torch.equal(a.boxes.data, b.boxes.data)
+        assert torch.equal(a.masks.data, b.masks.data)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import torch
+from ultralytics.engine.results import Results
+
+from prediction_store import PredictionStore, PredictionStoreWriter
+
+NAMES = {0: "typha", 1: "reed"}
+
+def result(cls):
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+    boxes = torch.tensor([[0, 0, 4, 4, 0.9, cls]], dtype=torch.float32)
+    masks = torch.zeros(1, 8, 8)
+    masks[0, :4, :4] = 1
+    return Results(img, "", NAMES, boxes=boxes, masks=masks)
+
+def write_store(store_dir, frames, shard_frames=2):
+    with PredictionStoreWriter(store_dir, NAMES, shard_frames=shard_frames) as writer:
+        for k, cls in enumerate(frames):
+            writer.add(f"v_f{k}", result(cls))
+
+def test_close_replaces_previous_store(tmp_path):
+    store_dir = tmp_path / "predictions"
+    write_store(store_dir, [0, 0, 0, 0, 0])
+    write_store(store_dir, [1])
+    store = PredictionStore(store_dir)
+    assert len(store) == 1
+    assert store.class_pixel_totals() == {"typha": 0.0, "reed": 16.0}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["predictions"]
+
+def test_failed_run_keeps_previous_store(tmp_path):
+    store_dir = tmp_path / "predictions"
+    write_store(store_dir, [0, 0, 0])
+    with pytest.raises(RuntimeError):
+        with PredictionStoreWriter(store_dir, NAMES, shard_frames=2) as writer:
+            for k in range(3):
+                writer.add(f"w_f{k}", result(1))  # 第一个分片已经写出
+            raise RuntimeError("推理出错")
+    store = PredictionStore(store_dir)
+    assert len(store) == 3
+    assert set(store.frame_index()) == {"v_f0", "v_f1", "v_f2"}
+    assert store.class_pixel_totals()["typha"] == 48.0
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["predictions"]
+
+def test_unclosed_writer_does_not_touch_store(tmp_path):
+    store_dir = tmp_path / "predictions"
+    write_store(store_dir, [0])
+    writer = PredictionStoreWriter(store_dir, NAMES, shard_frames=1)
+    writer.add("w_f0", result(1))  # 写出分片后进程崩溃，未调用 close()
+    assert len(PredictionStore(store_dir)) == 1
+    # 下次运行清理残留的临时目录
+    write_store(store_dir, [1, 1])
+    assert len(PredictionStore(store_dir)) == 2
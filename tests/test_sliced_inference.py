@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from sliced_inference import SlicedPredictor, make_tiles
+
+NAMES = {0: "typha", 1: "reed"}
+
+# 两个横向相邻的切片，重叠区 x 在 [80, 120]
+TILES = torch.tensor([[0, 0, 120, 100], [80, 0, 200, 100]], dtype=torch.float32)
+
+def merge(boxes, tile_ids, masks=None):
+    slicer = SlicedPredictor(model=None, merge_threshold=0.5, iou=0.7)
+    boxes = torch.tensor(boxes, dtype=torch.float32)
+    return slicer._merge(boxes, masks, torch.tensor(tile_ids), TILES)
+
+def test_same_tile_instances_are_not_merged():
+    # 同一切片内，小实例完全落在大实例的框里 (IoS = 1)，仍是两个实例
+    boxes, _ = merge([[0, 0, 100, 100, 0.9, 0], [10, 10, 30, 30, 0.8, 0]], [0, 0])
+    assert len(boxes) == 2
+
+def test_fragments_across_seam_are_merged():
+    boxes, masks = merge([[50, 10, 120, 50, 0.9, 0], [80, 10, 160, 50, 0.8, 0]], [0, 1],
+                         masks=torch.eye(2, dtype=torch.bool)[:, :, None].expand(2, 2, 3))
+    assert len(boxes) == 1
+    assert boxes[0, :4].tolist() == [50, 10, 160, 50]
+    assert boxes[0, 4].item() == torch.tensor(0.9).item()
+    assert masks[0].all()
+
+def test_no_transitive_growth():
+    # 右侧切片中有一个碎片和一个框内的小实例: 只吸收 IoS 最大的一个，小实例保留
+    boxes, _ = merge([[60, 10, 120, 50, 0.9, 0], [80, 10, 150, 50, 0.8, 0], [85, 12, 110, 40, 0.7, 0]],
+                     [0, 1, 1])
+    assert len(boxes) == 2
+    assert boxes[0, :4].tolist() == [60, 10, 150, 50]
+
+def test_different_class_is_not_merged():
+    boxes, _ = merge([[50, 10, 120, 50, 0.9, 0], [80, 10, 160, 50, 0.8, 1]], [0, 1])
+    assert len(boxes) == 2
+
+class FakeModel:
+    """每个切片在同一整帧位置 (60..140, 20..60) 上各给出一个截断的实例"""
+    names = NAMES
+
+    def __init__(self, tiles):
+        self.tiles = iter(tiles)
+
+    def predict(self, crops, **options):
+        results = []
+        for crop in crops:
+            x0, y0, x1, y1 = next(self.tiles)
+            bx0, bx1 = max(60, x0) - x0, min(140, x1) - x0
+            boxes = torch.tensor([[bx0, 20 - y0, bx1, 60 - y0, 0.9, 0]], dtype=torch.float32)
+            masks = torch.zeros(1, *crop.shape[:2])
+            masks[0, 20 - y0:60 - y0, bx0:bx1] = 1
+            results.append(Results(crop, "", NAMES, boxes=boxes, masks=masks))
+        return results
+
+def test_predict_stitches_instance_cut_by_tile_edge():
+    frame = np.zeros((100, 200, 3), dtype=np.uint8)
+    tiles = make_tiles(100, 200, 120, 1 / 3)
+    assert len(tiles) == 2
+    slicer = SlicedPredictor(FakeModel(tiles), tile_size=120, overlap=1 / 3, mask_downscale=1)
+    result, = slicer.predict([frame])
+    assert len(result.boxes) == 1
+    assert result.boxes.xyxy[0].tolist() == [60, 20, 140, 60]
+    assert result.masks.data[0].sum().item() == 80 * 40
@@ -0,0 +1,57 @@
+import os
+import cv2
+import numpy as np
+import yaml
+
+import train_cache
+
+def make_dataset(tmp_path, count=3):
+    img_dir = tmp_path / "train" / "images"
+    img_dir.mkdir(parents=True)
+    for k in range(count):
+        cv2.imwrite(str(img_dir / f"f{k}.png"), np.full((40, 60, 3), 10 * k, dtype=np.uint8))
+    data_yaml = tmp_path / "data.yaml"
+    data_yaml.write_text(yaml.safe_dump({"path": str(tmp_path), "train": "train/images"}), encoding="utf-8")
+    return img_dir, str(data_yaml)
+
+def test_incremental_rebuild_reuses_old_shard(tmp_path, monkeypatch):
+    img_dir, data_yaml = make_dataset(tmp_path)
+    first = train_cache.build_cache(data_yaml, imgsz=32, workers=1)
+    assert len(first) == 3
+
+    # 记录打开的映射；替换缓存文件时旧映射必须已经关闭 (Windows 下否则 os.replace 报 PermissionError)
+    mappings = []
+
+    class RecordingMemmap(np.memmap):
+        def __new__(cls, *args, **kwargs):
+            mm = super().__new__(cls, *args, **kwargs)
+            mappings.append(mm._mmap)
+            return mm
+
+    real_replace = os.replace
+
+    def checked_replace(src, dst):
+        if str(dst).endswith(".u8"):
+            assert mappings and all(m.closed for m in mappings)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(train_cache.np, "memmap", RecordingMemmap)
+    monkeypatch.setattr(train_cache.os, "replace", checked_replace)
+
+    # 修改一张图: 其余两张从旧缓存拷贝
+    cv2.imwrite(str(img_dir / "f1.png"), np.full((40, 60, 3), 200, dtype=np.uint8))
+    second = train_cache.build_cache(data_yaml, imgsz=32, workers=1)
+    monkeypatch.undo()
+    assert len(second) == 3
+    for k, value in enumerate((0, 200, 20)):
+        im, hw0, hw = second.get(str(img_dir / f"f{k}.png"))
+        assert hw0 == (40, 60) and hw == (22, 32)
+        assert (im == value).all()
+
+def test_unchanged_cache_is_not_rewritten(tmp_path):
+    _, data_yaml = make_dataset(tmp_path)
+    train_cache.build_cache(data_yaml, imgsz=32, workers=1)
+    shard, index = train_cache.cache_paths(data_yaml, 32)
+    before = (tmp_path / shard).stat().st_mtime_ns
+    train_cache.build_cache(data_yaml, imgsz=32, workers=1)
+    assert (tmp_path / shard).stat().st_mtime_ns == before
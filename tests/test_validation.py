@@ -0,0 +1,23 @@
+import numpy as np
+
+from validation import confusion_counts
+
+def test_confusion_prefers_highest_iou_pair():
+    # 一个类别 0 的真值；类别 1 的预测 IoU 0.5 (下标靠前)，类别 0 的预测 IoU 0.9
+    pred_cls = np.array([1, 0])
+    gt_cls = np.array([0])
+    iou = np.array([[0.5, 0.9]])
+    matrix = confusion_counts(pred_cls, gt_cls, iou, nc=2)
+
+    assert matrix[0, 0] == 1     # 0 <-> 0 配对
+    assert matrix[1, 0] == 0     # 没有 1 -> 0 的混淆
+    assert matrix[0, 2] == 0     # 类别 0 的预测没有被算成背景误检
+    assert matrix[1, 2] == 1     # 未配对的类别 1 预测计入背景
+    assert matrix.sum() == 2
+
+def test_confusion_unmatched_go_to_background():
+    pred_cls = np.array([1])
+    gt_cls = np.array([0])
+    iou = np.array([[0.2]])
+    matrix = confusion_counts(pred_cls, gt_cls, iou, nc=2)
+    assert matrix[2, 0] == 1 and matrix[1, 2] == 1 and matrix.sum() == 2